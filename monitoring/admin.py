@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Message
+from .models import Message, MessageCounter, MessageEvent, MessagePartition
 
 # Register your models here.
 
@@ -8,3 +8,22 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ('message_id', 'queue_name', 'state', 'received_at')
     search_fields = ('message_id', 'queue_name', 'topic_arn')
     list_filter = ('state',)
+
+
+@admin.register(MessageCounter)
+class MessageCounterAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'name', 'count', 'last_received_at')
+    search_fields = ('name',)
+    list_filter = ('kind',)
+
+
+@admin.register(MessageEvent)
+class MessageEventAdmin(admin.ModelAdmin):
+    list_display = ('key', 'topic_arn', 'fanout', 'first_received_at', 'last_received_at')
+    search_fields = ('key', 'topic_arn')
+
+
+@admin.register(MessagePartition)
+class MessagePartitionAdmin(admin.ModelAdmin):
+    list_display = ('table_name', 'period_start', 'period_end', 'rows', 'sealed_at')
+    readonly_fields = ('table_name', 'period_start', 'period_end', 'min_id', 'max_id', 'rows', 'columns', 'counts')
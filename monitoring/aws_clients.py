@@ -0,0 +1,156 @@
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from django.conf import settings
+from .metrics import instrument_client
+import boto3
+import botocore.session
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Errores con los que AWS rechaza credenciales temporales vencidas
+EXPIRED_CREDENTIALS_CODES = {'ExpiredToken', 'ExpiredTokenException'}
+
+# Registro de clientes compartido por todo el proceso. Los clientes de boto3 son
+# thread-safe, pero las sesiones no: la creación se serializa con un lock.
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+# Un lock por rol: AssumeRole es una llamada de red y no debe frenar a los demás clientes
+_role_locks = {}
+# Credenciales explícitas que AWS rechazó por vencidas: no se vuelven a usar en este proceso
+_expired = set()
+
+def _static_credentials():
+    """Credenciales explícitas configuradas en settings, o None para usar la cadena por defecto"""
+    if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
+        credentials = (
+            settings.AWS_ACCESS_KEY_ID,
+            settings.AWS_SECRET_ACCESS_KEY,
+            getattr(settings, 'AWS_SESSION_TOKEN', None) or None,
+        )
+        if credentials not in _expired:
+            return credentials
+    return None
+
+def credentials_expired(exc):
+    """Indica si un error de AWS se debe a credenciales temporales vencidas"""
+    return getattr(exc, 'response', {}).get('Error', {}).get('Code') in EXPIRED_CREDENTIALS_CODES
+
+def _watch_credentials(client, credentials):
+    """Descarta los clientes cacheados cuando AWS rechaza por vencidas las credenciales del cliente"""
+    def on_after_call(parsed=None, **kwargs):
+        if (parsed or {}).get('Error', {}).get('Code') not in EXPIRED_CREDENTIALS_CODES:
+            return
+        if credentials:
+            # Las explícitas no se renuevan solas: se pasa a la cadena por defecto de boto3
+            _expired.add(credentials)
+        logger.warning('Credenciales de AWS vencidas; se recrean los clientes')
+        reset_clients()
+
+    client.meta.events.register('after-call', on_after_call)
+    return client
+
+def _client_config():
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={'mode': settings.AWS_RETRY_MODE, 'max_attempts': settings.AWS_MAX_ATTEMPTS},
+        # Timeouts acotados: una región lenta falla rápido en vez de frenar a las demás
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+    )
+
+def _get_session(credentials):
+    session = _sessions.get(credentials)
+    if session is None:
+        if credentials:
+            access_key, secret_key, token = credentials
+            session = boto3.session.Session(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                aws_session_token=token,
+            )
+        else:
+            # Sin credenciales explícitas boto3 usa su cadena por defecto (variables de
+            # entorno, perfiles, roles de instancia) y renueva solo las temporales
+            botocore_session = botocore.session.Session()
+            if _expired:
+                # Las variables de entorno devolverían las mismas credenciales vencidas
+                botocore_session.get_component('credential_provider').remove('env')
+            session = boto3.session.Session(botocore_session=botocore_session)
+        _sessions[credentials] = session
+    return session
+
+def _sts_client():
+    """Cliente de STS con las credenciales base vigentes (se arma en cada renovación del rol)"""
+    credentials = _static_credentials()
+    with _lock:
+        client = _get_session(credentials).client('sts', config=_client_config())
+    return _watch_credentials(client, credentials)
+
+def _assume_role_session(role_arn, external_id=None):
+    """Sesión con credenciales de STS AssumeRole que botocore renueva antes de que venzan"""
+    def refresh():
+        params = {'RoleArn': role_arn, 'RoleSessionName': settings.AWS_ROLE_SESSION_NAME}
+        if external_id:
+            params['ExternalId'] = external_id
+        # Los clientes de rol viven mucho: si vencen las credenciales base, la renovación usa las nuevas
+        credentials = _sts_client().assume_role(**params)['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    botocore_session = botocore.session.get_session()
+    botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+        metadata=refresh(), refresh_using=refresh, method='sts-assume-role'
+    )
+    return boto3.session.Session(botocore_session=botocore_session)
+
+def _get_role_session(credentials, role_arn, external_id):
+    key = (credentials, role_arn, external_id)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _lock:
+        role_lock = _role_locks.setdefault(key, threading.Lock())
+    # Solo esperan los clientes de este mismo rol mientras se llama a STS
+    with role_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _assume_role_session(role_arn, external_id)
+            with _lock:
+                _sessions[key] = session
+    return session
+
+def get_client(service_name, region_name=None, role_arn=None, external_id=None):
+    """Devuelve un cliente cacheado para el servicio, la región y (opcionalmente) el rol indicados"""
+    region_name = region_name or settings.AWS_REGION
+    if settings.MONITOR_AWS_BACKEND == 'fake':
+        # Backend en memoria para benchmarks y pruebas: no hay credenciales ni red
+        from .fake_aws import get_fake_client
+        return get_fake_client(service_name, region_name)
+    credentials = _static_credentials()
+    # Las credenciales forman parte de la clave: si cambia el token de sesión se crea otro cliente
+    key = (service_name, region_name, credentials, role_arn, external_id)
+    client = _clients.get(key)
+    if client is None:
+        role_session = _get_role_session(credentials, role_arn, external_id) if role_arn else None
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                session = role_session or _get_session(credentials)
+                client = session.client(service_name, region_name=region_name, config=_client_config())
+                # Cuenta intentos, reintentos y throttling de cada llamada para /metrics
+                _clients[key] = instrument_client(_watch_credentials(client, None if role_arn else credentials))
+    return client
+
+def reset_clients():
+    """Descarta los clientes cacheados, por ejemplo tras rotar o vencer credenciales"""
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
@@ -1,111 +1,303 @@
-import boto3
+from botocore.exceptions import BotoCoreError, ClientError
 from django.conf import settings
+from django.db import transaction
+from datetime import datetime, timezone as dt_timezone
+from . import metrics
+from .aws_clients import get_client
+from .blobs import offload_bodies
+from .counters import increment_counters, queue_key
+from .envelopes import decode
+from .events import assign_events
 from .models import Message
-import json
-
-def get_sqs_client():
-    """Inicializa el cliente de SQS usando las credenciales configuradas"""
-    # Parámetros básicos incluyendo región
-    params = {'region_name': settings.AWS_REGION}
-    # Si se configuran credenciales, inclúyelas (con token opcional)
-    if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
-        params.update({
-            'aws_access_key_id': settings.AWS_ACCESS_KEY_ID,
-            'aws_secret_access_key': settings.AWS_SECRET_ACCESS_KEY,
-        })
-        # Token de sesión opcional para credenciales temporales
-        if getattr(settings, 'AWS_SESSION_TOKEN', None):
-            params['aws_session_token'] = settings.AWS_SESSION_TOKEN
-    return boto3.client('sqs', **params)
-
-def list_queues():
-    """Devuelve la lista de URLs de las colas SQS"""
-    client = get_sqs_client()
-    response = client.list_queues()
-    return response.get('QueueUrls', [])
-
-def fetch_messages_from_queue(queue_url, max_messages=10, wait_time=1):
-    """Recibe mensajes de una cola y los guarda en la base de datos"""
-    client = get_sqs_client()
-    response = client.receive_message(
-        QueueUrl=queue_url,
-        MaxNumberOfMessages=max_messages,
-        WaitTimeSeconds=wait_time,
-        MessageAttributeNames=['All'],
-        AttributeNames=['All']
-    )
+from .rollups import record_rollups
+from .search import index_messages
+from urllib.parse import urlparse
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+def get_sqs_client(region_name=None):
+    """Devuelve el cliente compartido de SQS configurado con las credenciales de settings"""
+    return get_client('sqs', region_name)
+
+def region_from_queue_url(queue_url):
+    """Región de una URL de cola (https://sqs.<región>.amazonaws.com/...), o None"""
+    host = urlparse(queue_url).hostname or ''
+    parts = host.split('.')
+    if len(parts) >= 3 and parts[0] == 'sqs':
+        return parts[1]
+    # Formato antiguo: https://<región>.queue.amazonaws.com/...
+    if len(parts) >= 3 and parts[1] == 'queue':
+        return parts[0]
+    return None
+
+def account_from_queue_url(queue_url):
+    """Cuenta de AWS dueña de una cola (primer segmento de la ruta de la URL), o None"""
+    parts = urlparse(queue_url).path.strip('/').split('/')
+    if len(parts) == 2 and parts[0].isdigit():
+        return parts[0]
+    return None
+
+def queue_key_from_url(queue_url):
+    """Clave (cuenta, región, nombre) de la cola, la misma que usan contadores y métricas"""
+    return queue_key(account_from_queue_url(queue_url), region_from_queue_url(queue_url), queue_url.split('/')[-1])
+
+def queue_labels(queue_url):
+    """Etiquetas de las métricas de una cola: nombre, cuenta y región (las homónimas no se mezclan)"""
+    account_id, region, name = queue_key_from_url(queue_url)
+    return {'queue': name, 'account': account_id, 'region': region}
+
+def get_queue_client(queue_url):
+    """Cliente de SQS de la región a la que pertenece la cola"""
+    return get_sqs_client(region_from_queue_url(queue_url))
+
+def list_queues(prefix=None, region_name=None, client=None):
+    """Devuelve la lista completa de URLs de las colas SQS (recorre todas las páginas)"""
+    client = client or get_sqs_client(region_name)
+    params = {'PaginationConfig': {'PageSize': 1000}}
+    if prefix:
+        params['QueueNamePrefix'] = prefix
+    urls = []
+    for page in client.get_paginator('list_queues').paginate(**params):
+        urls.extend(page.get('QueueUrls', []))
+    return urls
+
+# URL de la cola de monitoreo
+MONITOR_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/381492023522/mentaqueue-monitor'
+
+# Tamaño máximo de lote que aceptan DeleteMessageBatch y ChangeMessageVisibilityBatch
+SQS_BATCH_SIZE = 10
+
+def receive_messages(queue_url, max_messages=10, wait_time=1, client=None, visibility_timeout=None):
+    """Recibe un lote de mensajes de una cola sin procesarlos"""
+    client = client or get_queue_client(queue_url)
+    params = {}
+    # En modo observación se pide una visibilidad corta para no retener los mensajes
+    if visibility_timeout is not None:
+        params['VisibilityTimeout'] = visibility_timeout
+    labels = queue_labels(queue_url)
+    with metrics.receive_seconds.time(**labels):
+        response = client.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=wait_time,
+            MessageAttributeNames=['All'],
+            AttributeNames=['All'],
+            **params
+        )
     messages = response.get('Messages', [])
+    metrics.receive_batch_size.observe(len(messages), **labels)
+    if messages:
+        metrics.messages_received.inc(len(messages), **labels)
+    else:
+        metrics.empty_receives.inc(**labels)
+    return messages
+
+def sqs_sent_at(msg):
+    """Momento en que SQS recibió el mensaje (atributo SentTimestamp, en milisegundos)"""
+    sent = msg.get('Attributes', {}).get('SentTimestamp')
+    try:
+        return datetime.fromtimestamp(int(sent) / 1000, tz=dt_timezone.utc) if sent else None
+    except (TypeError, ValueError):
+        return None
+
+def build_message(msg, queue_url):
+    """Convierte un mensaje recibido de SQS en una instancia (sin guardar) de Message"""
+    attrs = msg.get('MessageAttributes', {})
+    # Un solo parseo del cuerpo: sobre de SNS, evento de EventBridge o entrega directa
+    envelope = decode(msg.get('Body') or '')
+    topic_arn = envelope.topic_arn
+    # Si TopicArn viene como atributo
+    if 'TopicArn' in attrs:
+        topic_arn = attrs['TopicArn']['StringValue']
+    payload = envelope.payload
+    threshold = settings.MONITOR_BLOB_THRESHOLD
+    if threshold and len(envelope.body) > threshold:
+        # Los cuerpos grandes se guardan comprimidos; no se duplican como JSON sin comprimir
+        payload = None
+    return Message(
+        message_id=msg['MessageId'],
+        queue_name=queue_url.split('/')[-1],
+        account_id=account_from_queue_url(queue_url),
+        region=region_from_queue_url(queue_url),
+        topic_arn=topic_arn,
+        subject=envelope.subject,
+        body=envelope.body,
+        payload=payload,
+        envelope=envelope.kind,
+        envelope_id=envelope.envelope_id,
+        # Los atributos del sobre de SNS se suman a los de SQS
+        attributes={**envelope.attributes, **attrs},
+        state='RECEIVED',
+        # Momento de publicación en SNS o EventBridge, más preciso que el envío a SQS
+        published_at=envelope.published_at or sqs_sent_at(msg),
+    )
+
+def store_messages(queue_url, messages):
+    """Guarda un lote de mensajes en la base de datos y devuelve los que eran nuevos"""
+    # Un mismo lote puede traer el mismo MessageId repetido
+    candidates = {}
     for msg in messages:
-        msg_id = msg['MessageId']
-        # Evitar duplicados
-        if not Message.objects.filter(message_id=msg_id).exists():
-            raw_body = msg.get('Body')
-            attrs = msg.get('MessageAttributes', {})
-            topic_arn = None
-            subject = None
-            # Si TopicArn viene como atributo
-            if 'TopicArn' in attrs:
-                topic_arn = attrs['TopicArn']['StringValue']
-            body = raw_body
-            # Si es mensaje de SNS suscrito en SQS, parsear JSON
-            try:
-                payload = json.loads(raw_body)
-                if isinstance(payload, dict):
-                    # Extraer TopicArn del payload
-                    if not topic_arn and payload.get('TopicArn'):
-                        topic_arn = payload.get('TopicArn')
-                    # Extraer Subject del payload
-                    if payload.get('Subject'):
-                        subject = payload.get('Subject')
-                    # Reemplazar body con el contenido real del mensaje
-                    body = payload.get('Message', raw_body)
-            except (ValueError, TypeError):
-                pass
-            Message.objects.create(
-                message_id=msg_id,
-                queue_name=queue_url.split('/')[-1],
-                topic_arn=topic_arn,
-                subject=subject,
-                body=body,
-                attributes=attrs,
-                state='RECEIVED'
+        candidates.setdefault(msg['MessageId'], msg)
+    if not candidates:
+        return []
+    # Evitar duplicados con una sola consulta
+    existing = set(
+        Message.objects.filter(message_id__in=list(candidates)).values_list('message_id', flat=True)
+    )
+    labels = queue_labels(queue_url)
+    with metrics.parse_seconds.time(**labels):
+        new_rows = [build_message(msg, queue_url) for msg_id, msg in candidates.items() if msg_id not in existing]
+    if len(messages) > len(new_rows):
+        metrics.duplicates_skipped.inc(len(messages) - len(new_rows), **labels)
+    if new_rows:
+        # El índice de búsqueda recibe el cuerpo completo aunque se desplace a un blob
+        bodies = {row.message_id: row.body for row in new_rows}
+        with metrics.db_insert_seconds.time(**labels), transaction.atomic():
+            offload_bodies(new_rows)
+            # Las copias de un mismo evento en otras colas quedan marcadas como duplicadas
+            assign_events(new_rows)
+            # ignore_conflicts cubre la carrera con otro proceso que inserte el mismo mensaje
+            Message.objects.bulk_create(new_rows, ignore_conflicts=True)
+            # Con ignore_conflicts no se devuelven los ids: se recuperan con una consulta
+            ids = dict(
+                Message.objects.filter(message_id__in=list(bodies)).values_list('message_id', 'id')
             )
-        # Eliminar el mensaje para evitar re-procesarlo
-        receipt_handle = msg.get('ReceiptHandle')
-        if receipt_handle:
-            client.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+            for row in new_rows:
+                row.pk = ids.get(row.message_id)
+            increment_counters(new_rows)
+            record_rollups(new_rows)
+            # Se indexa una fila por evento: las copias no aparecen repetidas en la búsqueda
+            index_messages([row for row in new_rows if not row.duplicate], bodies)
+        metrics.messages_stored.inc(len(new_rows), **labels)
+    return new_rows
+
+def _run_batches(queue_url, messages, operation, client, **extra):
+    """Ejecuta una operación *Batch de SQS en lotes de 10 y devuelve las entradas que fallaron"""
+    # El Id de cada entrada es la posición del mensaje en el lote
+    by_id = {str(index): msg for index, msg in enumerate(messages) if msg.get('ReceiptHandle')}
+    entries = [
+        {'Id': entry_id, 'ReceiptHandle': msg['ReceiptHandle'], **extra} for entry_id, msg in by_id.items()
+    ]
+    if not entries:
+        return []
+    call = getattr(client, operation)
+    labels = queue_labels(queue_url)
+    failed = []
+    for start in range(0, len(entries), SQS_BATCH_SIZE):
+        chunk = entries[start:start + SQS_BATCH_SIZE]
+        try:
+            with metrics.ack_seconds.time(**labels, operation=operation):
+                response = call(QueueUrl=queue_url, Entries=chunk)
+        except (BotoCoreError, ClientError) as exc:
+            # Falló el lote completo (error de AWS, de red o timeout): sus mensajes quedan para reintento
+            logger.warning('%s falló en %s: %s', operation, queue_url, exc)
+            if isinstance(exc, ClientError):
+                code = exc.response.get('Error', {}).get('Code')
+            else:
+                code = type(exc).__name__
+            failed.extend({'message': by_id[entry['Id']], 'code': code, 'error': str(exc)} for entry in chunk)
+            continue
+        for entry in response.get('Failed', []):
+            failed.append({
+                'message': by_id[entry['Id']],
+                'code': entry.get('Code'),
+                'error': entry.get('Message'),
+            })
+    for entry in failed:
+        metrics.ack_failures.inc(**labels, operation=operation, code=entry['code'] or 'unknown')
+    return failed
+
+def delete_messages(queue_url, messages, client=None):
+    """Elimina mensajes de la cola en lotes de 10 y devuelve las entradas que fallaron"""
+    failed = _run_batches(queue_url, messages, 'delete_message_batch', client or get_queue_client(queue_url))
+    if failed:
+        logger.warning('No se pudieron eliminar %d mensajes de %s; se reintentarán', len(failed), queue_url)
+    return failed
+
+def is_peek_queue(queue_url):
+    """Indica si la cola se observa sin consumir (MONITOR_PEEK_QUEUES, por URL o por nombre)"""
+    peek_queues = settings.MONITOR_PEEK_QUEUES
+    return queue_url in peek_queues or queue_url.split('/')[-1] in peek_queues
+
+def sample_messages(messages, rate):
+    """Elige una fracción de los mensajes de forma determinística según su MessageId"""
+    if rate >= 1:
+        return messages
+    # El mismo mensaje recibido varias veces siempre queda dentro o fuera de la muestra
+    return [
+        msg for msg in messages
+        if int(hashlib.sha1(msg['MessageId'].encode()).hexdigest()[:8], 16) / 0xFFFFFFFF < rate
+    ]
+
+def acknowledge_messages(queue_url, messages, client=None, peek=False):
+    """Confirma un lote ya guardado: lo borra de la cola (en modo observación no hace nada)"""
+    if peek:
+        # No se devuelve con visibilidad 0: se volvería a recibir en el acto y cada recepción
+        # suma a ApproximateReceiveCount. Vuelve sola al vencer MONITOR_PEEK_VISIBILITY_TIMEOUT
+        return []
+    return delete_messages(queue_url, messages, client=client)
+
+def ingest_messages(queue_url, messages, client=None, peek=False):
+    """Guarda un lote recibido y lo confirma en SQS; devuelve un resumen con los fallos"""
+    if peek:
+        # Modo observación: se guarda una muestra y los mensajes quedan en la cola sin borrarse
+        sampled = sample_messages(messages, settings.MONITOR_PEEK_SAMPLE_RATE)
+        created = store_messages(queue_url, sampled)
+        skipped = len(messages) - len(sampled)
+    else:
+        created = store_messages(queue_url, messages)
+        skipped = 0
+    # Solo se confirman en SQS una vez confirmada la escritura en la base
+    failed = acknowledge_messages(queue_url, messages, client=client, peek=peek)
+    return {
+        'received': len(messages),
+        'created': len(created),
+        'duplicates': len(messages) - skipped - len(created),
+        'failed': failed,
+    }
+
+def fetch_messages_from_queue(queue_url, max_messages=10, wait_time=1, peek=None):
+    """Recibe mensajes de una cola y los guarda en la base de datos"""
+    client = get_queue_client(queue_url)
+    if peek is None:
+        peek = is_peek_queue(queue_url)
+    messages = receive_messages(
+        queue_url, max_messages=max_messages, wait_time=wait_time, client=client,
+        visibility_timeout=settings.MONITOR_PEEK_VISIBILITY_TIMEOUT if peek else None,
+    )
+    if messages:
+        ingest_messages(queue_url, messages, client=client, peek=peek)
     return messages
 
-def fetch_all_messages():
-    """Recorre todas las colas y obtiene sus mensajes"""
-    queues = list_queues()
-    for queue_url in queues:
-        fetch_messages_from_queue(queue_url)
+def fetch_all_messages(max_messages=10, wait_time=1, max_workers=None):
+    """Recorre en paralelo las colas del inventario y las de MONITOR_TARGETS y obtiene sus mensajes"""
+    from .collector import get_target_queues, target_clients
+    from .inventory import get_inventory
+    from .poller import poll_queues
+    queue_targets = get_target_queues(block=True)
+    queue_urls = list(dict.fromkeys(get_inventory(block=True)['queues'] + list(queue_targets)))
+    return poll_queues(
+        queue_urls, max_messages=max_messages, wait_time=wait_time,
+        max_workers=max_workers, clients=target_clients(queue_targets),
+    )
 
 def fetch_monitor_messages(max_messages=10, wait_time=5):
     """Obtiene mensajes específicamente de la cola de monitoreo"""
-    # URL de la cola de monitoreo
-    monitor_queue_url = 'https://sqs.us-east-1.amazonaws.com/381492023522/mentaqueue-monitor'
-    return fetch_messages_from_queue(monitor_queue_url, max_messages=max_messages, wait_time=wait_time)
-
-def get_sns_client():
-    """Inicializa el cliente de SNS usando las credenciales configuradas"""
-    params = {'region_name': settings.AWS_REGION}
-    if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
-        params.update({
-            'aws_access_key_id': settings.AWS_ACCESS_KEY_ID,
-            'aws_secret_access_key': settings.AWS_SECRET_ACCESS_KEY,
-        })
-        if getattr(settings, 'AWS_SESSION_TOKEN', None):
-            params['aws_session_token'] = settings.AWS_SESSION_TOKEN
-    return boto3.client('sns', **params)
-
-def list_topics():
-    """Devuelve la lista de ARNs de los topics SNS"""
-    client = get_sns_client()
-    response = client.list_topics()
-    topics = response.get('Topics', [])
-    return [t['TopicArn'] for t in topics]
+    return fetch_messages_from_queue(MONITOR_QUEUE_URL, max_messages=max_messages, wait_time=wait_time)
+
+def get_sns_client(region_name=None):
+    """Devuelve el cliente compartido de SNS configurado con las credenciales de settings"""
+    return get_client('sns', region_name)
+
+def list_topics(region_name=None):
+    """Devuelve la lista completa de ARNs de los topics SNS (recorre todas las páginas)"""
+    client = get_sns_client(region_name)
+    topics = []
+    for page in client.get_paginator('list_topics').paginate():
+        topics.extend(t['TopicArn'] for t in page.get('Topics', []))
+    return topics
 
 def list_subscriptions_for_topic(topic_arn):
     """Devuelve la lista de suscripciones de SNS para un topic"""
@@ -116,24 +308,47 @@ def list_subscriptions_for_topic(topic_arn):
         subs.extend(page.get('Subscriptions', []))
     return subs
 
-def get_queue_url_from_arn(queue_arn):
+# Dominio de los endpoints de SQS según la partición del ARN
+PARTITION_DOMAINS = {
+    'aws': 'amazonaws.com',
+    'aws-us-gov': 'amazonaws.com',
+    'aws-cn': 'amazonaws.com.cn',
+}
+
+def queue_url_from_arn(queue_arn):
+    """Deriva la URL de una cola desde su ARN sin llamar a AWS; None si el ARN no es reconocible"""
+    parts = queue_arn.split(':')
+    if len(parts) != 6 or parts[0] != 'arn' or parts[2] != 'sqs':
+        return None
+    _, partition, _, region, account, name = parts
+    domain = PARTITION_DOMAINS.get(partition)
+    if not domain:
+        return None
+    return f'https://sqs.{region}.{domain}/{account}/{name}'
+
+def get_queue_url_from_arn(queue_arn, client=None):
     """Dado un ARN de cola SQS, devuelve su URL si existe"""
-    sqs = get_sqs_client()
-    queue_name = queue_arn.split(':')[-1]
+    queue_url = queue_url_from_arn(queue_arn)
+    if queue_url:
+        return queue_url
+    # Particiones desconocidas: se resuelve con GetQueueUrl
+    sqs = client or get_sqs_client()
+    parts = queue_arn.split(':')
+    params = {'QueueName': parts[-1]}
+    if len(parts) == 6 and parts[4]:
+        params['QueueOwnerAWSAccountId'] = parts[4]
     try:
-        response = sqs.get_queue_url(QueueName=queue_name)
+        response = sqs.get_queue_url(**params)
         return response.get('QueueUrl')
     except sqs.exceptions.QueueDoesNotExist:
         return None
 
 def fetch_messages_by_topic(topic_arn, max_messages=10, wait_time=1):
-    """Recorre las colas suscritas a un topic SNS y guarda sus mensajes"""
-    messages = []
-    subs = list_subscriptions_for_topic(topic_arn)
-    for sub in subs:
-        if sub.get('Protocol') == 'sqs' and sub.get('Endpoint'):
-            queue_url = get_queue_url_from_arn(sub['Endpoint'])
-            if queue_url:
-                msgs = fetch_messages_from_queue(queue_url, max_messages=max_messages, wait_time=wait_time)
-                messages.extend(msgs)
-    return messages 
\ No newline at end of file
+    """Recorre en paralelo las colas suscritas a un topic SNS y guarda sus mensajes"""
+    from .poller import poll_queues
+    from .topology import invalidate_topology, subscribed_queue_urls
+    results = poll_queues(subscribed_queue_urls(topic_arn), max_messages=max_messages, wait_time=wait_time)
+    # Una cola que ya no existe indica que la topología cacheada quedó vieja
+    if any(result.get('error') for result in results.values()):
+        invalidate_topology()
+    return results
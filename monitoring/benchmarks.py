@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .models import Message, MessageCounter, MessageRollup, QueueMetricSample
+import json
+import statistics
+import time
+import tracemalloc
+
+# Prefijo de las colas sembradas por los benchmarks, para poder limpiarlas después
+BENCH_PREFIX = 'bench-'
+
+@contextmanager
+def _manual_received_at():
+    """Permite asignar received_at a mano al sembrar (auto_now_add lo pisaría)"""
+    field = Message._meta.get_field('received_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+def bench_queue_names(queues):
+    return [f'{BENCH_PREFIX}queue-{index}' for index in range(queues)]
+
+def bench_topic_arns(topics):
+    return [f'arn:aws:sns:us-east-1:000000000000:{BENCH_PREFIX}topic-{index}' for index in range(topics)]
+
+def seed_messages(rows, queues=20, topics=5, days=30, batch_size=10000, body_size=512):
+    """Inserta mensajes sintéticos repartidos entre colas, topics y los últimos días"""
+    queue_names = bench_queue_names(queues)
+    topic_arns = bench_topic_arns(topics)
+    now = timezone.now()
+    step = timedelta(days=days) / max(rows, 1)
+    body = json.dumps({'payload': 'x' * body_size})
+    states = ['RECEIVED', 'RECEIVED', 'RECEIVED', 'PROCESSED']
+    run_id = int(time.time() * 1000)
+    with _manual_received_at():
+        for start in range(0, rows, batch_size):
+            batch = []
+            for index in range(start, min(start + batch_size, rows)):
+                batch.append(Message(
+                    message_id=f'{BENCH_PREFIX}{run_id}-{index}',
+                    queue_name=queue_names[index % queues],
+                    # Una parte de los mensajes no viene de SNS
+                    topic_arn=topic_arns[index % topics] if index % 4 else None,
+                    subject=None,
+                    body=body,
+                    attributes={},
+                    state=states[index % len(states)],
+                    received_at=now - step * (rows - index),
+                ))
+            Message.objects.bulk_create(batch)
+    return rows
+
+def delete_seeded_messages(batch_size=50000):
+    """Elimina los mensajes sembrados por los benchmarks"""
+    deleted = 0
+    while True:
+        ids = list(
+            Message.objects.filter(message_id__startswith=BENCH_PREFIX).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += Message.objects.filter(id__in=ids).delete()[0]
+
+def time_call(func, iterations=20, warmup=2):
+    """Ejecuta func varias veces y devuelve p50/p99/máximo en milisegundos"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+def analyze():
+    """Actualiza las estadísticas del planificador tras sembrar datos"""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+def database_profile():
+    """Configuración efectiva de la conexión actual, para acompañar los resultados"""
+    profile = {'vendor': connection.vendor, 'profile': settings.DB_PROFILE}
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                profile[pragma] = cursor.fetchone()[0]
+    else:
+        profile['conn_max_age'] = connection.settings_dict['CONN_MAX_AGE']
+        profile['pool'] = bool(connection.settings_dict['OPTIONS'].get('pool'))
+    return profile
+
+def sqs_messages(count, prefix, body_size=512):
+    """Mensajes con la forma de ReceiveMessage (entrega directa) y MessageId únicos"""
+    body = json.dumps({'payload': 'x' * body_size})
+    sent = str(int(time.time() * 1000))
+    return [
+        {
+            'MessageId': f'{BENCH_PREFIX}{prefix}-{index}',
+            'ReceiptHandle': f'{prefix}-{index}',
+            'Body': body,
+            'Attributes': {'SentTimestamp': sent},
+        }
+        for index in range(count)
+    ]
+
+def peak_memory_kb(func):
+    """Ejecuta func una vez y devuelve el pico de memoria asignada por Python, en KiB"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+def setup_fake_load(client_sqs, client_sns, queues=20, topics=5):
+    """Crea colas y topics sintéticos en el backend falso; cada cola se suscribe a un topic"""
+    topic_arns = [
+        client_sns.create_topic(Name=f'{BENCH_PREFIX}topic-{index}')['TopicArn'] for index in range(topics)
+    ]
+    queue_urls = []
+    for index in range(queues):
+        url = client_sqs.create_queue(QueueName=f'{BENCH_PREFIX}queue-{index}')['QueueUrl']
+        arn = client_sqs.get_queue_attributes(QueueUrl=url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        client_sns.subscribe(TopicArn=topic_arns[index % topics], Protocol='sqs', Endpoint=arn)
+        queue_urls.append(url)
+    return queue_urls, topic_arns
+
+def publish_load(client_sns, topic_arns, messages, body_size=512):
+    """Publica mensajes repartidos entre los topics; SNS los copia a cada cola suscrita"""
+    body = json.dumps({'payload': 'x' * body_size})
+    for index in range(messages):
+        client_sns.publish(TopicArn=topic_arns[index % len(topic_arns)], Message=body, Subject=f'bench {index}')
+
+def delete_bench_data():
+    """Borra mensajes, contadores, rollups y muestras de las colas y topics de benchmark"""
+    from .retention import purge_queryset
+    deleted = purge_queryset(Message.objects.filter(queue_name__startswith=BENCH_PREFIX))
+    MessageCounter.objects.filter(name__contains=BENCH_PREFIX).delete()
+    MessageRollup.objects.filter(name__contains=BENCH_PREFIX).delete()
+    QueueMetricSample.objects.filter(queue_name__startswith=BENCH_PREFIX).delete()
+    return deleted
+
+def sample_bodies(count, body_size=512):
+    """Cuerpos sintéticos con las formas que llegan a SQS: sobre de SNS, EventBridge y entrega directa"""
+    payload = {'id': 0, 'status': 'ok', 'items': [{'sku': 'x' * 16, 'qty': 1}], 'note': 'x' * body_size}
+    bodies = []
+    for index in range(count):
+        payload['id'] = index
+        inner = json.dumps(payload)
+        shape = index % 4
+        if shape < 2:
+            bodies.append(json.dumps({
+                'Type': 'Notification',
+                'MessageId': f'{BENCH_PREFIX}{index}',
+                'TopicArn': bench_topic_arns(1)[0],
+                'Subject': 'bench',
+                'Message': inner,
+                'Timestamp': '2024-01-01T00:00:00.000Z',
+                'MessageAttributes': {'kind': {'Type': 'String', 'Value': 'bench'}},
+            }))
+        elif shape == 2:
+            bodies.append(json.dumps({
+                'id': f'{BENCH_PREFIX}{index}', 'detail-type': 'bench', 'source': 'bench',
+                'time': '2024-01-01T00:00:00Z', 'detail': payload,
+            }))
+        else:
+            bodies.append(inner)
+    return bodies
+
+def time_per_item(func, items, repeat=5):
+    """Mejor tiempo por elemento (en microsegundos) de aplicar func a todos los items"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / max(len(items), 1) * 1e6, 3)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from .compression import compress
+from .models import MessageBlob
+import hashlib
+
+def offload_bodies(rows):
+    """Calcula tamaño y hash de cada cuerpo y mueve los grandes a MessageBlob (sin duplicar)"""
+    threshold = settings.MONITOR_BLOB_THRESHOLD
+    large = {}
+    for row in rows:
+        data = row.body.encode('utf-8')
+        row.body_size = len(data)
+        row.body_sha256 = hashlib.sha256(data).hexdigest()
+        if threshold and row.body_size > threshold:
+            large.setdefault(row.body_sha256, data)
+    if not large:
+        return
+    codec = settings.MONITOR_BLOB_CODEC
+    existing = dict(MessageBlob.objects.filter(sha256__in=list(large)).values_list('sha256', 'id'))
+    missing = [
+        MessageBlob(sha256=sha256, codec=codec, size=len(data), data=compress(data, codec))
+        for sha256, data in large.items()
+        if sha256 not in existing
+    ]
+    if missing:
+        MessageBlob.objects.bulk_create(missing, ignore_conflicts=True)
+        existing.update(
+            MessageBlob.objects.filter(sha256__in=[blob.sha256 for blob in missing]).values_list('sha256', 'id')
+        )
+    preview = settings.MONITOR_BODY_PREVIEW
+    for row in rows:
+        if row.body_sha256 in large:
+            row.body_blob_id = existing[row.body_sha256]
+            row.body = row.body[:preview]
+
+def delete_orphan_blobs(chunk_size=1000):
+    """Borra los blobs que ya no referencia ningún mensaje"""
+    from .partitions import referenced_ids
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            MessageBlob.objects.filter(messages__isnull=True, id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        last_id = ids[-1]
+        # Los mensajes sellados en particiones no tienen clave foránea, pero siguen usando su blob
+        orphans = set(ids) - referenced_ids('body_blob', ids)
+        deleted += MessageBlob.objects.filter(id__in=orphans).delete()[0]
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .aws_clients import get_client
+from .aws_service import list_queues, region_from_queue_url
+from .refresh import trigger_refresh
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'aws-targets'
+
+def target_name(target):
+    """Nombre legible de un destino de MONITOR_TARGETS para logs y reportes"""
+    return target.get('name') or target.get('role_arn') or target.get('region') or settings.AWS_REGION
+
+def target_client(target, region_name=None, service_name='sqs'):
+    """Cliente del destino (SQS por defecto): asume su rol si tiene uno (las credenciales se renuevan solas)"""
+    return get_client(
+        service_name,
+        region_name or target.get('region'),
+        role_arn=target.get('role_arn'),
+        external_id=target.get('external_id'),
+    )
+
+def resolve_target_queues(target):
+    """URLs de las colas de un destino: las indicadas en 'queues' o las que coinciden con 'queue_prefix'"""
+    if target.get('queues'):
+        return list(target['queues'])
+    prefixes = target.get('queue_prefix') or [None]
+    if isinstance(prefixes, str):
+        prefixes = [prefixes]
+    client = target_client(target)
+    urls = {}
+    for prefix in prefixes:
+        urls.update(dict.fromkeys(list_queues(prefix=prefix, client=client)))
+    return list(urls)
+
+def build_target_queues(targets=None):
+    """Resuelve las colas de todos los destinos en paralelo; devuelve {url: índice del destino}"""
+    targets = settings.MONITOR_TARGETS if targets is None else targets
+    queue_targets = {}
+    if not targets:
+        return queue_targets
+    with ThreadPoolExecutor(max_workers=min(settings.SQS_POLL_CONCURRENCY, len(targets))) as executor:
+        futures = [executor.submit(resolve_target_queues, target) for target in targets]
+        for index, future in enumerate(futures):
+            try:
+                urls = future.result()
+            except (BotoCoreError, ClientError) as exc:
+                # Un destino con error (rol inválido, región caída) no impide resolver los demás
+                logger.warning('No se pudieron listar las colas de %s: %s', target_name(targets[index]), exc)
+                continue
+            for url in urls:
+                queue_targets.setdefault(url, index)
+    return queue_targets
+
+def refresh_target_queues():
+    queue_targets = {'collected_at': timezone.now(), 'queues': build_target_queues()}
+    cache.set(CACHE_KEY, queue_targets, timeout=None)
+    return queue_targets
+
+def get_target_queues(block=False):
+    """Colas de los destinos, cacheadas con el mismo vencimiento que el inventario"""
+    if not settings.MONITOR_TARGETS:
+        return {}
+    queue_targets = cache.get(CACHE_KEY)
+    stale = queue_targets is None or (
+        timezone.now() - queue_targets['collected_at'] > timedelta(seconds=settings.MONITOR_INVENTORY_TTL)
+    )
+    if stale:
+        if block:
+            return refresh_target_queues()['queues']
+        # Sin block nunca se lista AWS en línea (por ejemplo, durante una request)
+        trigger_refresh(CACHE_KEY, refresh_target_queues)
+    return queue_targets['queues'] if queue_targets else {}
+
+def invalidate_target_queues():
+    cache.delete(CACHE_KEY)
+
+def target_clients(queue_targets):
+    """Cliente de cada cola según su destino y la región de su URL"""
+    targets = settings.MONITOR_TARGETS
+    return {
+        url: target_client(targets[index], region_from_queue_url(url))
+        for url, index in queue_targets.items()
+    }
+
+def collect_targets(max_messages=10, wait_time=1, max_workers=None):
+    """Consulta en paralelo las colas de todos los destinos configurados"""
+    from .poller import poll_queues
+    queue_targets = get_target_queues(block=True)
+    return poll_queues(
+        list(queue_targets), max_messages=max_messages, wait_time=wait_time,
+        max_workers=max_workers, clients=target_clients(queue_targets),
+    )
@@ -0,0 +1,31 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+# Codecs disponibles: nombre -> (comprimir, descomprimir). zstd solo si está instalado 'zstandard'
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd_compress, _zstd_decompress)
+
+def compress(data, codec):
+    """Comprime bytes con el codec indicado"""
+    if codec not in CODECS:
+        raise ValueError(f'Codec de compresión no disponible: {codec}')
+    return CODECS[codec][0](data)
+
+def decompress(data, codec):
+    """Descomprime bytes guardados con el codec indicado"""
+    if codec not in CODECS:
+        raise ValueError(f'Codec de compresión no disponible: {codec}')
+    return CODECS[codec][1](bytes(data))
@@ -0,0 +1,260 @@
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.db import DatabaseError
+from .aws_clients import credentials_expired
+from .aws_service import (
+    acknowledge_messages, get_queue_client, ingest_messages, is_peek_queue, receive_messages, sample_messages,
+)
+from .retention import run_retention
+from .spool import drain_spool
+from collections import OrderedDict
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# MessageIds recordados por cola observada, para reconocer las relecturas sin ir a la base
+PEEK_SEEN_SIZE = 10000
+
+class QueueConsumer:
+    """Consume varias colas de forma continua con varios receptores por cola y un único escritor"""
+
+    def __init__(self, queue_urls, receivers_per_queue=2, max_messages=10, wait_time=20,
+                 max_backoff=5, on_batch=None, retention_interval=0, peek=None, clients=None,
+                 spool=None):
+        self.queue_urls = list(queue_urls)
+        self.receivers_per_queue = receivers_per_queue
+        self.max_messages = max_messages
+        self.wait_time = wait_time
+        self.max_backoff = max_backoff
+        self.on_batch = on_batch
+        self.retention_interval = retention_interval
+        # peek=None respeta MONITOR_PEEK_QUEUES; True o False fuerza el modo en todas las colas
+        self.peek = {url: is_peek_queue(url) if peek is None else peek for url in self.queue_urls}
+        self._peek_seen = {url: OrderedDict() for url in self.queue_urls if self.peek[url]}
+        # MessageIds ya recibidos que el escritor todavía no guardó
+        self._peek_pending = {url: set() for url in self._peek_seen}
+        self._peek_lock = threading.Lock()
+        self._last_retention = time.monotonic()
+        # clients permite pasar clientes propios (por ejemplo, con un rol de otra cuenta)
+        self.clients = {url: (clients or {}).get(url) or get_queue_client(url) for url in self.queue_urls}
+        self._own_clients = {url for url in self.queue_urls if not (clients or {}).get(url)}
+        # Con spool, los receptores escriben a disco y confirman en SQS; el escritor vacía el spool
+        self.spool = spool
+        self._stop = threading.Event()
+        # Cola acotada: si la base va lenta, los receptores esperan en vez de acumular mensajes
+        self._batches = queue.Queue(maxsize=max(1, len(self.queue_urls) * receivers_per_queue * 2))
+        self._receivers = []
+
+    def stop(self):
+        """Pide la detención; los lotes ya recibidos se guardan antes de salir"""
+        self._stop.set()
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def _next_backoff(self, backoff, queue_url=None):
+        limit = self.max_backoff
+        if queue_url in self._peek_seen:
+            limit = max(limit, settings.MONITOR_PEEK_MAX_BACKOFF)
+        return min(max(backoff * 2, 1), limit)
+
+    def _unseen(self, queue_url, messages):
+        """Mensajes de la muestra que esta cola observada no había devuelto antes"""
+        seen, pending = self._peek_seen[queue_url], self._peek_pending[queue_url]
+        fresh = []
+        with self._peek_lock:
+            for msg in sample_messages(messages, settings.MONITOR_PEEK_SAMPLE_RATE):
+                if msg['MessageId'] in seen:
+                    seen.move_to_end(msg['MessageId'])
+                elif msg['MessageId'] not in pending:
+                    pending.add(msg['MessageId'])
+                    fresh.append(msg)
+        return fresh
+
+    def _settle(self, queue_url, messages, stored):
+        """Pasa los mensajes en vuelo a vistos si se guardaron; si no, se toman en la próxima relectura"""
+        if queue_url not in self._peek_seen:
+            return
+        seen, pending = self._peek_seen[queue_url], self._peek_pending[queue_url]
+        with self._peek_lock:
+            for msg in messages:
+                pending.discard(msg['MessageId'])
+                if stored:
+                    seen[msg['MessageId']] = True
+                    seen.move_to_end(msg['MessageId'])
+            while len(seen) > PEEK_SEEN_SIZE:
+                seen.popitem(last=False)
+
+    def _receive_loop(self, queue_url):
+        backoff = 0
+        while not self._stop.is_set():
+            if self.spool and self._spool_full():
+                continue
+            # Solo se espera entre consultas cuando la cola estuvo vacía
+            if backoff and self._stop.wait(backoff):
+                break
+            try:
+                messages = receive_messages(
+                    queue_url, max_messages=self.max_messages, wait_time=self.wait_time, client=self.clients[queue_url],
+                    visibility_timeout=settings.MONITOR_PEEK_VISIBILITY_TIMEOUT if self.peek[queue_url] else None,
+                )
+            except (BotoCoreError, ClientError) as exc:
+                logger.warning('Error recibiendo mensajes de %s: %s', queue_url, exc)
+                if credentials_expired(exc) and queue_url in self._own_clients:
+                    # El registro de clientes ya se vació: se toma uno con las credenciales vigentes
+                    self.clients[queue_url] = get_queue_client(queue_url)
+                backoff = self._next_backoff(backoff)
+                continue
+            if messages and queue_url in self._peek_seen:
+                # Una relectura sin mensajes nuevos cuenta como recepción vacía: sin esta espera
+                # los mismos mensajes se recibirían una y otra vez
+                messages = self._unseen(queue_url, messages)
+            if messages:
+                if self.spool:
+                    if not self._spool_batch(queue_url, messages):
+                        backoff = self._next_backoff(backoff)
+                        continue
+                else:
+                    self._batches.put((queue_url, messages))
+                backoff = 0
+            else:
+                backoff = self._next_backoff(backoff, queue_url)
+
+    def _spool_full(self):
+        # Contrapresión: si la base no da abasto, se deja de recibir hasta que el spool baje
+        if self.spool.pending_bytes() <= settings.MONITOR_SPOOL_MAX_BYTES:
+            return False
+        self._stop.wait(0.5)
+        return True
+
+    def _spool_batch(self, queue_url, messages):
+        """Escribe el lote en el spool y recién después lo confirma en SQS"""
+        peek = self.peek[queue_url]
+        sampled = sample_messages(messages, settings.MONITOR_PEEK_SAMPLE_RATE) if peek else messages
+        try:
+            if sampled:
+                self.spool.append(queue_url, sampled)
+        except OSError:
+            # Sin confirmar: SQS los vuelve a entregar cuando vence la visibilidad
+            logger.exception('No se pudo escribir en el spool un lote de %s', queue_url)
+            self._settle(queue_url, sampled, stored=False)
+            return False
+        # En disco cuenta como guardado: el escritor lo pasa a la base aunque el proceso se reinicie
+        self._settle(queue_url, sampled, stored=True)
+        acknowledge_messages(queue_url, messages, client=self.clients[queue_url], peek=peek)
+        return True
+
+    def _start_receivers(self):
+        for queue_url in self.queue_urls:
+            for index in range(self.receivers_per_queue):
+                thread = threading.Thread(
+                    target=self._receive_loop,
+                    args=(queue_url,),
+                    name=f'receiver-{queue_url.split("/")[-1]}-{index}',
+                    daemon=True,
+                )
+                thread.start()
+                self._receivers.append(thread)
+
+    def _receivers_alive(self):
+        return any(thread.is_alive() for thread in self._receivers)
+
+    def _maybe_run_retention(self):
+        # La retención corre en el mismo hilo escritor para no competir por el lock de SQLite
+        if not self.retention_interval or self._stop.is_set():
+            return
+        if time.monotonic() - self._last_retention < self.retention_interval:
+            return
+        self._last_retention = time.monotonic()
+        try:
+            run_retention()
+        except DatabaseError:
+            logger.exception('Falló la pasada de retención')
+
+    def _drain_spool(self):
+        try:
+            return drain_spool(self.spool, settings.MONITOR_SPOOL_BATCH, on_batch=self.on_batch)
+        except Exception:
+            # Base caída o error de disco al apartar mensajes: el checkpoint no avanzó y el mismo
+            # tramo se reintenta en la próxima vuelta (los mensajes dañados los aparta drain_spool)
+            logger.exception('Falló el paso del spool a la base')
+            return None
+
+    def _run_spool(self):
+        # La primera vuelta reprocesa lo que haya quedado de una ejecución anterior
+        while True:
+            drained = self._drain_spool()
+            if not drained:
+                if self._stop.is_set() and not self._receivers_alive():
+                    # Si la base falla al salir, lo pendiente queda en disco para el próximo arranque
+                    if drained is None or not self.spool.pending_bytes():
+                        break
+                time.sleep(0.2)
+            self._maybe_run_retention()
+
+    def _ingest(self, queue_url, messages):
+        return ingest_messages(queue_url, messages, client=self.clients[queue_url], peek=self.peek[queue_url])
+
+    def _ingest_each(self, queue_url, messages):
+        """Guarda el lote mensaje por mensaje para dejar afuera solo los que no se pueden guardar"""
+        result = {'received': len(messages), 'created': 0, 'duplicates': 0, 'failed': []}
+        for msg in messages:
+            try:
+                single = self._ingest(queue_url, [msg])
+            except Exception as exc:
+                # Queda sin confirmar: SQS lo vuelve a entregar y la redrive policy de la cola lo
+                # termina mandando a su DLQ
+                logger.exception('Se saltea el mensaje %s de %s: no se pudo guardar', msg.get('MessageId'), queue_url)
+                result['failed'].append({'message': msg, 'code': type(exc).__name__, 'error': str(exc)})
+                self._settle(queue_url, [msg], stored=False)
+                continue
+            self._settle(queue_url, [msg], stored=True)
+            result['created'] += single['created']
+            result['duplicates'] += single['duplicates']
+            result['failed'].extend(single['failed'])
+        return result
+
+    def _run_queue(self):
+        backoff = 0
+        while True:
+            try:
+                queue_url, messages = self._batches.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set() and not self._receivers_alive() and self._batches.empty():
+                    break
+            else:
+                try:
+                    result = self._ingest(queue_url, messages)
+                except DatabaseError:
+                    # El lote no se confirmó en SQS: vuelve a estar visible al vencer su visibilidad
+                    logger.exception('No se pudo guardar un lote de %d mensajes de %s', len(messages), queue_url)
+                    self._settle(queue_url, messages, stored=False)
+                    backoff = self._next_backoff(backoff)
+                    self._stop.wait(backoff)
+                    continue
+                except Exception:
+                    # Un mensaje que no se puede decodificar o guardar no debe frenar al escritor
+                    logger.exception(
+                        'Falló un lote de %d mensajes de %s; se reintenta de a uno', len(messages), queue_url,
+                    )
+                    result = self._ingest_each(queue_url, messages)
+                else:
+                    self._settle(queue_url, messages, stored=True)
+                backoff = 0
+                if self.on_batch:
+                    self.on_batch(queue_url, result)
+            self._maybe_run_retention()
+
+    def run(self):
+        """Procesa lotes hasta que se pida la detención y no queden lotes en vuelo"""
+        self._start_receivers()
+        if self.spool:
+            self._run_spool()
+        else:
+            self._run_queue()
+        for thread in self._receivers:
+            thread.join()
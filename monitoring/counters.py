@@ -0,0 +1,97 @@
+from collections import Counter
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from .models import Message, MessageCounter, MessagePartition
+
+def queue_key(account_id, region, queue_name):
+    """Clave de una cola: las homónimas de otras cuentas o regiones son colas distintas"""
+    return (account_id or '', region or '', queue_name)
+
+def queue_lookup(key):
+    """Filtro de Message para los mensajes de la cola con esa clave"""
+    account_id, region, queue_name = key
+    return {'queue_name': queue_name, 'account_id': account_id or None, 'region': region or None}
+
+def _counter_key(kind, account_id, region, name):
+    # Las colas se identifican por (cuenta, región, nombre) y los topics por su ARN
+    return queue_key(account_id, region, name) if kind == MessageCounter.QUEUE else name
+
+def _adjust(kind, deltas, touch=False):
+    now = timezone.now()
+    for key, delta in deltas.items():
+        account_id, region, name = key if kind == MessageCounter.QUEUE else ('', '', key)
+        if not name or not delta:
+            continue
+        lookup = {'kind': kind, 'account_id': account_id, 'region': region, 'name': name}
+        MessageCounter.objects.get_or_create(**lookup)
+        changes = {'count': F('count') + delta}
+        if touch:
+            changes['last_received_at'] = now
+        MessageCounter.objects.filter(**lookup).update(**changes)
+
+def increment_counters(rows):
+    """Suma los mensajes recién guardados a los contadores de su cola y su topic"""
+    _adjust(
+        MessageCounter.QUEUE, Counter(queue_key(row.account_id, row.region, row.queue_name) for row in rows), touch=True,
+    )
+    # El topic cuenta eventos: las copias del fan-out no lo inflan
+    _adjust(MessageCounter.TOPIC, Counter(row.topic_arn for row in rows if not row.duplicate), touch=True)
+
+def decrement_counters(queue_counts, topic_counts):
+    """Resta mensajes eliminados; recibe diccionarios clave de cola -> cantidad y ARN -> cantidad"""
+    _adjust(MessageCounter.QUEUE, {key: -count for key, count in queue_counts.items()})
+    _adjust(MessageCounter.TOPIC, {name: -count for name, count in topic_counts.items()})
+
+def partition_queue_counts(counts):
+    """Conteos por cola guardados al sellar una partición, como clave de cola -> cantidad"""
+    queues = counts.get('queues', {})
+    if isinstance(queues, dict):
+        # Particiones selladas antes de separar las colas por cuenta y región
+        return {queue_key(None, None, name): count for name, count in queues.items()}
+    return {queue_key(account_id, region, name): count for account_id, region, name, count in queues}
+
+def get_counts(kind, keys=None):
+    """Devuelve un diccionario clave -> cantidad con una sola consulta (ver _counter_key)"""
+    counters = MessageCounter.objects.filter(kind=kind)
+    if keys is not None:
+        keys = set(keys)
+        names = {key[-1] for key in keys} if kind == MessageCounter.QUEUE else keys
+        counters = counters.filter(name__in=list(names))
+    counts = {
+        _counter_key(kind, account_id, region, name): count
+        for account_id, region, name, count in counters.values_list('account_id', 'region', 'name', 'count')
+    }
+    if keys is not None:
+        counts = {key: count for key, count in counts.items() if key in keys}
+    return counts
+
+def rebuild_counters():
+    """Recalcula todos los contadores desde la tabla de mensajes con un GROUP BY por tipo"""
+    MessageCounter.objects.all().delete()
+    scopes = (
+        (MessageCounter.QUEUE, ('account_id', 'region', 'queue_name')),
+        (MessageCounter.TOPIC, ('topic_arn',)),
+    )
+    for kind, fields in scopes:
+        messages = Message.objects.all() if kind == MessageCounter.QUEUE else Message.objects.filter(duplicate=False)
+        rows = (
+            messages.exclude(**{f'{fields[-1]}__isnull': True})
+            .values(*fields)
+            .annotate(total=Count('id'), last=Max('received_at'))
+            .order_by()
+        )
+        MessageCounter.objects.bulk_create([
+            MessageCounter(
+                kind=kind,
+                account_id=row.get('account_id') or '',
+                region=row.get('region') or '',
+                name=row[fields[-1]],
+                count=row['total'],
+                last_received_at=row['last'],
+            )
+            for row in rows
+        ])
+    # Las filas selladas en particiones se suman con los conteos guardados al sellarlas
+    for counts in MessagePartition.objects.values_list('counts', flat=True):
+        _adjust(MessageCounter.QUEUE, partition_queue_counts(counts))
+        _adjust(MessageCounter.TOPIC, counts.get('topics', {}))
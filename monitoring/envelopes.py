@@ -0,0 +1,152 @@
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Decodificación del cuerpo de los mensajes en una sola pasada. Cada decodificador recibe el
+# documento JSON ya parseado y devuelve un Envelope, o None si no reconoce la forma; el
+# primero que lo reconoce gana. La lista se configura con MONITOR_ENVELOPE_DECODERS.
+
+def json_backend():
+    """Backend de JSON a usar: orjson si está instalado y no se pidió lo contrario"""
+    if settings.MONITOR_JSON_BACKEND == 'orjson' or (settings.MONITOR_JSON_BACKEND == 'auto' and orjson):
+        if orjson is None:
+            raise ValueError("MONITOR_JSON_BACKEND='orjson' pero el paquete orjson no está instalado")
+        return 'orjson'
+    return 'json'
+
+def loads(data, backend=None):
+    if (backend or json_backend()) == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _looks_like_json(text):
+    # Evita intentar parsear (y capturar la excepción) en cuerpos que claramente no son JSON
+    stripped = text.lstrip()[:1]
+    return stripped == '{' or stripped == '['
+
+def try_loads(text, backend=None):
+    """Parsea text si parece JSON; devuelve None si no lo es o no es válido"""
+    if not isinstance(text, str) or not _looks_like_json(text):
+        return None
+    try:
+        return loads(text, backend)
+    except ValueError:
+        return None
+
+
+@dataclass
+class Envelope:
+    kind: str
+    body: str
+    payload: object = None
+    topic_arn: str = None
+    subject: str = None
+    envelope_id: str = None
+    published_at: object = None
+    attributes: dict = field(default_factory=dict)
+
+
+def _string(document, key):
+    """Valor del campo si es texto; None si falta o el productor mandó otro tipo"""
+    value = document.get(key)
+    return value if isinstance(value, str) else None
+
+def _timestamp(value):
+    """Fecha ISO 8601 del sobre, o None si no es texto o no es una fecha válida"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return None
+
+def sns_attributes(attributes):
+    """Convierte los MessageAttributes del sobre de SNS al formato de SQS (DataType/StringValue)"""
+    converted = {}
+    if not isinstance(attributes, dict):
+        return converted
+    for name, value in attributes.items():
+        # Se descartan los atributos que no tienen la forma {'Type': ..., 'Value': ...}
+        if not isinstance(value, dict):
+            continue
+        data_type = value.get('Type')
+        if not isinstance(data_type, str):
+            data_type = 'String'
+        key = 'BinaryValue' if data_type.startswith('Binary') else 'StringValue'
+        converted[name] = {'DataType': data_type, key: value.get('Value')}
+    return converted
+
+def decode_sns(document, backend=None):
+    """Notificación de SNS entregada a SQS con su sobre (sin RawMessageDelivery)"""
+    if not isinstance(document, dict) or not _string(document, 'TopicArn') or 'Message' not in document:
+        return None
+    message = document['Message']
+    return Envelope(
+        kind='sns',
+        body=message if isinstance(message, str) else json.dumps(message),
+        payload=try_loads(message, backend) if isinstance(message, str) else message,
+        topic_arn=document['TopicArn'],
+        subject=_string(document, 'Subject'),
+        envelope_id=_string(document, 'MessageId'),
+        published_at=_timestamp(document.get('Timestamp')),
+        attributes=sns_attributes(document.get('MessageAttributes')),
+    )
+
+def decode_eventbridge(document, backend=None):
+    """Evento de EventBridge enviado a SQS como destino de una regla"""
+    if not isinstance(document, dict) or not _string(document, 'detail-type'):
+        return None
+    if not isinstance(document.get('detail'), dict):
+        return None
+    return Envelope(
+        kind='eventbridge',
+        body=None,
+        payload=document['detail'],
+        subject=document['detail-type'],
+        envelope_id=_string(document, 'id'),
+        published_at=_timestamp(document.get('time')),
+    )
+
+DEFAULT_DECODERS = ['monitoring.envelopes.decode_sns', 'monitoring.envelopes.decode_eventbridge']
+
+_decoders = {}
+
+def get_decoders():
+    paths = tuple(settings.MONITOR_ENVELOPE_DECODERS or DEFAULT_DECODERS)
+    decoders = _decoders.get(paths)
+    if decoders is None:
+        decoders = _decoders[paths] = [import_string(path) for path in paths]
+    return decoders
+
+def decode(raw_body, backend=None):
+    """Parsea el cuerpo una sola vez y lo pasa por los decodificadores configurados"""
+    backend = backend or json_backend()
+    document = try_loads(raw_body, backend)
+    if document is not None:
+        for decoder in get_decoders():
+            try:
+                envelope = decoder(document, backend)
+            except Exception:
+                # Un cuerpo con forma inesperada no debe frenar la ingesta: se guarda como raw
+                logger.warning(
+                    'El decodificador %s falló; el mensaje se guarda sin decodificar',
+                    getattr(decoder, '__name__', decoder), exc_info=True,
+                )
+                break
+            if envelope is not None:
+                if envelope.body is None:
+                    # El cuerpo guardado es el documento completo (por ejemplo, un evento de EventBridge)
+                    envelope.body = raw_body
+                return envelope
+    # Entrega directa (raw): el cuerpo es el mensaje tal cual
+    return Envelope(kind='raw', body=raw_body, payload=document)
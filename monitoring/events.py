@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import MessageEvent
+import hashlib
+import threading
+import time
+
+# Identidad de evento: una publicación en SNS llega a cada cola suscrita con un MessageId de SQS
+# distinto, pero con el mismo MessageId de SNS en el sobre. Las entregas se agrupan en un
+# MessageEvent; solo la primera se guarda completa y cuenta para el topic.
+
+_lock = threading.Lock()
+# key -> (id del evento, momento en que se cacheó)
+_recent = OrderedDict()
+
+def event_key(row):
+    """Clave del evento de un mensaje, o None si no puede venir de un fan-out"""
+    if row.envelope_id and row.envelope in ('sns', 'eventbridge'):
+        return f'{row.envelope}:{row.envelope_id}'
+    if not row.topic_arn:
+        return None
+    # Entrega directa de SNS sin sobre: se identifica por el contenido dentro de una ventana de
+    # tiempo, para no fusionar mensajes idénticos enviados en momentos distintos
+    window = settings.MONITOR_EVENT_HASH_WINDOW
+    bucket = int(row.published_at.timestamp() // window) if row.published_at and window else 0
+    digest = hashlib.sha256(f'{row.topic_arn}\n{bucket}\n{row.body}'.encode('utf-8')).hexdigest()
+    return f'sha256:{digest}'
+
+def _cached(keys):
+    ttl = settings.MONITOR_EVENT_CACHE_TTL
+    now = time.monotonic()
+    found = {}
+    with _lock:
+        for key in keys:
+            entry = _recent.get(key)
+            if entry is None:
+                continue
+            if now - entry[1] > ttl:
+                del _recent[key]
+                continue
+            _recent.move_to_end(key)
+            found[key] = entry[0]
+    return found
+
+def _remember(ids):
+    now = time.monotonic()
+    with _lock:
+        for key, event_id in ids.items():
+            _recent[key] = (event_id, now)
+            _recent.move_to_end(key)
+        while len(_recent) > settings.MONITOR_EVENT_CACHE_SIZE:
+            _recent.popitem(last=False)
+
+def forget_events():
+    """Vacía la caché de eventos recientes de este proceso"""
+    with _lock:
+        _recent.clear()
+
+def assign_events(rows):
+    """Asocia cada mensaje nuevo a su evento y marca como copia las entregas repetidas"""
+    by_key = {}
+    for row in rows:
+        key = event_key(row)
+        if key:
+            by_key.setdefault(key, []).append(row)
+    if not by_key:
+        return
+    # Las copias suelen llegar segundos después: la caché evita ir a la base por cada una
+    ids = _cached(by_key)
+    missing = [key for key in by_key if key not in ids]
+    created = set()
+    if missing:
+        ids.update(MessageEvent.objects.filter(key__in=missing).values_list('key', 'id'))
+        new_keys = [key for key in missing if key not in ids]
+        if new_keys:
+            now = timezone.now()
+            MessageEvent.objects.bulk_create([
+                MessageEvent(
+                    key=key,
+                    topic_arn=by_key[key][0].topic_arn,
+                    published_at=by_key[key][0].published_at,
+                    fanout=len(by_key[key]),
+                    last_received_at=now,
+                )
+                for key in new_keys
+            ], ignore_conflicts=True)
+            ids.update(MessageEvent.objects.filter(key__in=new_keys).values_list('key', 'id'))
+            created.update(new_keys)
+    # Una actualización por cada cantidad distinta de entregas nuevas, no una por evento
+    increments = {}
+    for key, key_rows in by_key.items():
+        if key not in created:
+            increments.setdefault(len(key_rows), []).append(ids[key])
+    now = timezone.now()
+    for increment, event_ids in increments.items():
+        MessageEvent.objects.filter(id__in=event_ids).update(fanout=F('fanout') + increment, last_received_at=now)
+    preview = settings.MONITOR_BODY_PREVIEW
+    for key, key_rows in by_key.items():
+        for index, row in enumerate(key_rows):
+            row.event_id = ids[key]
+            row.duplicate = key not in created or index > 0
+            if row.duplicate:
+                # El contenido completo queda en la primera entrega (o en el blob compartido)
+                row.body = row.body[:preview]
+                row.payload = None
+    # Solo se cachean ids de eventos confirmados: si la transacción de ingesta se deshace,
+    # la próxima entrega crea el evento en vez de apuntar a una fila inexistente
+    transaction.on_commit(lambda: _remember(ids))
+
+def delete_orphan_events(chunk_size=1000):
+    """Borra los eventos sin entregas que ya no pueden recibir copias nuevas"""
+    # Margen mayor que la vida de la caché: ningún proceso puede seguir apuntando a ellos
+    from .partitions import referenced_ids
+    cutoff = timezone.now() - timedelta(seconds=max(settings.MONITOR_EVENT_CACHE_TTL * 2, 86400))
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            MessageEvent.objects.filter(deliveries__isnull=True, last_received_at__lt=cutoff, id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        last_id = ids[-1]
+        # Las entregas selladas en particiones siguen mostrando su evento
+        orphans = set(ids) - referenced_ids('event', ids)
+        deleted += MessageEvent.objects.filter(id__in=orphans).delete()[0]
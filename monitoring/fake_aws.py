@@ -0,0 +1,316 @@
+from collections import deque
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+import hashlib
+import itertools
+import json
+import threading
+import time
+import uuid
+
+# Backend en memoria que imita el subconjunto de SQS, SNS y CloudWatch que usa el monitor.
+# Se activa con MONITOR_AWS_BACKEND='fake' (ver aws_clients.get_client) y sirve para
+# benchmarks y pruebas sin depender de AWS.
+
+ACCOUNT_ID = '000000000000'
+# Región usada cuando no hay AWS_REGION configurada
+DEFAULT_REGION = 'us-east-1'
+# Máximo de elementos por página que devuelve AWS en cada listado
+PAGE_LIMITS = {
+    'list_queues': 1000,
+    'list_topics': 100,
+    'list_subscriptions': 100,
+    'list_subscriptions_by_topic': 100,
+    'get_metric_data': 500,
+}
+
+def _error(code, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class QueueDoesNotExist(ClientError):
+    pass
+
+
+class _Exceptions:
+    QueueDoesNotExist = QueueDoesNotExist
+
+
+class FakeQueue:
+    def __init__(self, name, url, region):
+        self.name = name
+        self.url = url
+        self.arn = f'arn:aws:sqs:{region}:{ACCOUNT_ID}:{name}'
+        self.visible = deque()
+        # receipt handle -> (mensaje, momento en que vuelve a ser visible)
+        self.in_flight = {}
+        self.sent = 0
+
+    def restore_expired(self, now):
+        expired = [handle for handle, (_, visible_at) in self.in_flight.items() if visible_at <= now]
+        for handle in expired:
+            message, _ = self.in_flight.pop(handle)
+            self.visible.append(message)
+
+
+class FakeBackend:
+    """Estado compartido de todas las colas, topics y suscripciones falsas"""
+
+    def __init__(self, latency=0.0, visibility_timeout=30, page_size=None):
+        self.latency = latency
+        self.visibility_timeout = visibility_timeout
+        # Achica las páginas de los listados para ejercitar NextToken sin crear miles de recursos
+        self.page_size = page_size
+        self.queues = {}
+        self.topics = {}
+        self._condition = threading.Condition()
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        with self._condition:
+            self.queues.clear()
+            self.topics.clear()
+
+    def _call(self):
+        # Demora simulada de ida y vuelta por llamada a la API
+        if self.latency:
+            time.sleep(self.latency)
+
+    def queue(self, queue_url, operation):
+        queue = self.queues.get(queue_url)
+        if queue is None:
+            raise QueueDoesNotExist(
+                {'Error': {'Code': 'AWS.SimpleQueueService.NonExistentQueue', 'Message': queue_url}}, operation
+            )
+        return queue
+
+    def create_queue(self, name, region):
+        url = f'https://sqs.{region}.amazonaws.com/{ACCOUNT_ID}/{name}'
+        with self._condition:
+            self.queues.setdefault(url, FakeQueue(name, url, region))
+        return url
+
+    def enqueue(self, queue_url, body, attributes=None):
+        with self._condition:
+            queue = self.queue(queue_url, 'SendMessage')
+            message = {
+                'MessageId': str(uuid.uuid4()),
+                'Body': body,
+                'MD5OfBody': hashlib.md5(body.encode('utf-8')).hexdigest(),
+                'Attributes': {
+                    'SentTimestamp': str(int(time.time() * 1000)),
+                    'ApproximateReceiveCount': '0',
+                },
+                'MessageAttributes': attributes or {},
+            }
+            queue.visible.append(message)
+            queue.sent += 1
+            self._condition.notify_all()
+        return message['MessageId']
+
+    def receive(self, queue_url, max_messages, wait_time, visibility_timeout):
+        deadline = time.monotonic() + wait_time
+        with self._condition:
+            queue = self.queue(queue_url, 'ReceiveMessage')
+            while True:
+                now = time.monotonic()
+                queue.restore_expired(now)
+                if queue.visible or now >= deadline:
+                    break
+                # Long polling: espera hasta que llegue un mensaje o venza WaitTimeSeconds
+                self._condition.wait(min(deadline - now, 0.1))
+            batch = []
+            timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+            while queue.visible and len(batch) < max_messages:
+                message = queue.visible.popleft()
+                count = int(message['Attributes']['ApproximateReceiveCount']) + 1
+                message['Attributes']['ApproximateReceiveCount'] = str(count)
+                handle = f'{message["MessageId"]}-{next(self._ids)}'
+                queue.in_flight[handle] = (message, now + timeout)
+                batch.append({**message, 'ReceiptHandle': handle})
+        return batch
+
+    def settle(self, queue_url, handle, visibility_timeout=None):
+        """Borra un mensaje en vuelo, o cambia su visibilidad si se indica visibility_timeout"""
+        with self._condition:
+            queue = self.queue(queue_url, 'DeleteMessage')
+            entry = queue.in_flight.pop(handle, None)
+            if entry is None:
+                return False
+            if visibility_timeout is not None:
+                if visibility_timeout:
+                    queue.in_flight[handle] = (entry[0], time.monotonic() + visibility_timeout)
+                else:
+                    queue.visible.appendleft(entry[0])
+                    self._condition.notify_all()
+            return True
+
+    def publish(self, topic_arn, message, subject=None, attributes=None):
+        subscriptions = self.topics.get(topic_arn)
+        if subscriptions is None:
+            raise _error('NotFound', 'Publish', topic_arn)
+        message_id = str(uuid.uuid4())
+        envelope = json.dumps({
+            'Type': 'Notification',
+            'MessageId': message_id,
+            'TopicArn': topic_arn,
+            'Subject': subject,
+            'Message': message,
+            'Timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+        })
+        for subscription in subscriptions:
+            queue_url = self.queue_url_from_arn(subscription['Endpoint'])
+            if queue_url:
+                body = message if subscription.get('RawMessageDelivery') else envelope
+                self.enqueue(queue_url, body, attributes)
+        return message_id
+
+    def queue_url_from_arn(self, queue_arn):
+        for queue in self.queues.values():
+            if queue.arn == queue_arn:
+                return queue.url
+        return None
+
+    def pending(self):
+        """Mensajes que quedan en todas las colas (visibles o en vuelo)"""
+        with self._condition:
+            return sum(len(queue.visible) + len(queue.in_flight) for queue in self.queues.values())
+
+
+class _Paginator:
+    """Corta el listado en páginas encadenadas con NextToken, como los paginadores de boto3"""
+
+    def __init__(self, items, limit):
+        self._items = items
+        self._limit = limit
+
+    def paginate(self, PaginationConfig=None, **params):
+        key, items = self._items(**params)
+        size = min((PaginationConfig or {}).get('PageSize') or self._limit, self._limit)
+        start = int((PaginationConfig or {}).get('StartingToken') or 0)
+        while True:
+            page = {key: items[start:start + size]}
+            start += size
+            if start < len(items):
+                page['NextToken'] = str(start)
+            yield page
+            if 'NextToken' not in page:
+                return
+
+
+class FakeClient:
+    """Cliente con la misma interfaz que los de boto3 para las operaciones que usa el monitor"""
+
+    exceptions = _Exceptions
+
+    def __init__(self, backend, service_name, region_name):
+        self.backend = backend
+        self.service_name = service_name
+        self.region_name = region_name
+
+    def get_paginator(self, operation):
+        limit = PAGE_LIMITS[operation]
+        if self.backend.page_size:
+            limit = min(limit, self.backend.page_size)
+        return _Paginator(getattr(self, f'_list_{operation}'), limit)
+
+    # SQS
+
+    def create_queue(self, QueueName, **params):
+        return {'QueueUrl': self.backend.create_queue(QueueName, self.region_name)}
+
+    def get_queue_url(self, QueueName, QueueOwnerAWSAccountId=None):
+        for queue in self.backend.queues.values():
+            if queue.name == QueueName and queue.arn.split(':')[3] == self.region_name:
+                return {'QueueUrl': queue.url}
+        raise QueueDoesNotExist({'Error': {'Code': 'AWS.SimpleQueueService.NonExistentQueue'}}, 'GetQueueUrl')
+
+    def _list_list_queues(self, QueueNamePrefix=''):
+        return 'QueueUrls', [
+            queue.url for queue in list(self.backend.queues.values())
+            if queue.name.startswith(QueueNamePrefix or '') and queue.arn.split(':')[3] == self.region_name
+        ]
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, **params):
+        self.backend._call()
+        return {'MessageId': self.backend.enqueue(QueueUrl, MessageBody, MessageAttributes)}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **params):
+        self.backend._call()
+        messages = self.backend.receive(QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, VisibilityTimeout)
+        return {'Messages': messages} if messages else {}
+
+    def _settle_batch(self, QueueUrl, Entries):
+        self.backend._call()
+        successful, failed = [], []
+        for entry in Entries:
+            if self.backend.settle(QueueUrl, entry['ReceiptHandle'], entry.get('VisibilityTimeout')):
+                successful.append({'Id': entry['Id']})
+            else:
+                failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid', 'SenderFault': True})
+        return {'Successful': successful, 'Failed': failed}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        return self._settle_batch(QueueUrl, Entries)
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        return self._settle_batch(QueueUrl, Entries)
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None):
+        self.backend._call()
+        with self.backend._condition:
+            queue = self.backend.queue(QueueUrl, 'GetQueueAttributes')
+            return {'Attributes': {
+                'ApproximateNumberOfMessages': str(len(queue.visible)),
+                'ApproximateNumberOfMessagesNotVisible': str(len(queue.in_flight)),
+                'ApproximateNumberOfMessagesDelayed': '0',
+                'QueueArn': queue.arn,
+            }}
+
+    # SNS
+
+    def create_topic(self, Name, **params):
+        arn = f'arn:aws:sns:{self.region_name}:{ACCOUNT_ID}:{Name}'
+        self.backend.topics.setdefault(arn, [])
+        return {'TopicArn': arn}
+
+    def subscribe(self, TopicArn, Protocol, Endpoint, Attributes=None, **params):
+        subscriptions = self.backend.topics.setdefault(TopicArn, [])
+        subscription = {
+            'SubscriptionArn': f'{TopicArn}:{uuid.uuid4()}',
+            'TopicArn': TopicArn,
+            'Protocol': Protocol,
+            'Endpoint': Endpoint,
+            'RawMessageDelivery': (Attributes or {}).get('RawMessageDelivery') == 'true',
+        }
+        subscriptions.append(subscription)
+        return {'SubscriptionArn': subscription['SubscriptionArn']}
+
+    def publish(self, TopicArn, Message, Subject=None, MessageAttributes=None, **params):
+        self.backend._call()
+        return {'MessageId': self.backend.publish(TopicArn, Message, Subject, MessageAttributes)}
+
+    def _region_topics(self):
+        return [arn for arn in list(self.backend.topics) if arn.split(':')[3] == self.region_name]
+
+    def _list_list_topics(self):
+        return 'Topics', [{'TopicArn': arn} for arn in self._region_topics()]
+
+    def _list_list_subscriptions(self):
+        return 'Subscriptions', [
+            subscription for arn in self._region_topics() for subscription in self.backend.topics[arn]
+        ]
+
+    def _list_list_subscriptions_by_topic(self, TopicArn):
+        return 'Subscriptions', list(self.backend.topics.get(TopicArn, []))
+
+    # CloudWatch: sin métricas, el monitor muestra la edad del mensaje más viejo como desconocida
+
+    def _list_get_metric_data(self, MetricDataQueries, **params):
+        return 'MetricDataResults', []
+
+
+backend = FakeBackend()
+
+def get_fake_client(service_name, region_name):
+    return FakeClient(backend, service_name, region_name or DEFAULT_REGION)
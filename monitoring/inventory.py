@@ -0,0 +1,50 @@
+from datetime import timedelta
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .aws_service import list_queues, list_topics
+from .refresh import trigger_refresh
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'aws-inventory'
+
+def monitored_regions():
+    """Regiones a inventariar (MONITOR_REGIONS, o la región por defecto)"""
+    return settings.MONITOR_REGIONS or [settings.AWS_REGION]
+
+def build_inventory():
+    """Lista todas las colas y topics de las regiones configuradas, recorriendo todas las páginas"""
+    # dict conserva el orden y descarta repetidos (prefijos que se solapan)
+    queues, topics = {}, {}
+    for region in monitored_regions():
+        try:
+            for prefix in settings.MONITOR_QUEUE_PREFIXES or [None]:
+                queues.update(dict.fromkeys(list_queues(prefix=prefix, region_name=region)))
+            topics.update(dict.fromkeys(list_topics(region_name=region)))
+        except (BotoCoreError, ClientError) as exc:
+            # Una región con error no impide inventariar las demás
+            logger.warning('No se pudo inventariar la región %s: %s', region, exc)
+    return {'collected_at': timezone.now(), 'queues': list(queues), 'topics': list(topics)}
+
+def refresh_inventory():
+    inventory = build_inventory()
+    cache.set(CACHE_KEY, inventory, timeout=None)
+    return inventory
+
+def get_inventory(block=False):
+    """Inventario cacheado. Si venció se renueva en segundo plano, salvo que block lo pida en línea"""
+    inventory = cache.get(CACHE_KEY)
+    stale = inventory is None or (
+        timezone.now() - inventory['collected_at'] > timedelta(seconds=settings.MONITOR_INVENTORY_TTL)
+    )
+    if stale:
+        if block:
+            return refresh_inventory()
+        trigger_refresh(CACHE_KEY, refresh_inventory)
+    return inventory or {'collected_at': None, 'queues': [], 'topics': []}
+
+def invalidate_inventory():
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Max
+from django.db.models.functions import Substr
+from .models import Message
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# El consumidor guarda los mensajes en otro proceso: cada proceso web consulta el id más nuevo
+# con un único hilo y reparte en memoria lo que encuentra entre sus clientes conectados.
+# Con un único escritor por base los ids se confirman en orden y alcanza con pedir id > último.
+
+EVENT_FIELDS = ('id', 'message_id', 'queue_name', 'topic_arn', 'subject', 'state', 'received_at')
+
+class Subscription:
+    """Cliente en vivo: cola acotada de eventos con filtros por cola y topic"""
+
+    def __init__(self, loop, queue_name=None, topic_arn=None, maxsize=100):
+        self.loop = loop
+        self.queue_name = queue_name
+        self.topic_arn = topic_arn
+        self.events = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event):
+        if self.queue_name and event['queue_name'] != self.queue_name:
+            return False
+        if self.topic_arn and event['topic_arn'] != self.topic_arn:
+            return False
+        return True
+
+    def offer(self, event):
+        """Encola un evento; si el cliente no da abasto se descarta el más viejo"""
+        if self.events.full():
+            self.events.get_nowait()
+            self.dropped += 1
+        self.events.put_nowait(event)
+
+    async def get(self):
+        return await self.events.get()
+
+def latest_message_id():
+    return Message.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+def recent_events(after_id, queue_name=None, topic_arn=None, limit=500):
+    """Eventos de los mensajes guardados después de after_id, del más viejo al más nuevo"""
+    messages = Message.objects.filter(id__gt=after_id)
+    if queue_name:
+        messages = messages.filter(queue_name=queue_name)
+    if topic_arn:
+        messages = messages.filter(topic_arn=topic_arn)
+    # Solo el extracto: el cuerpo completo no se lee de la base
+    rows = messages.order_by('id').values(*EVENT_FIELDS, preview=Substr('body', 1, 200))[:limit]
+    return [
+        {**row, 'received_at': row['received_at'].isoformat() if row['received_at'] else None}
+        for row in rows
+    ]
+
+class LiveBroker:
+    """Reparte en memoria los mensajes recién guardados entre los clientes conectados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._poller = None
+        self._last_id = None
+
+    def subscribe(self, queue_name=None, topic_arn=None, loop=None):
+        """Registra un cliente; se debe llamar desde el event loop que lo va a consumir"""
+        subscription = Subscription(
+            loop or asyncio.get_running_loop(),
+            queue_name=queue_name,
+            topic_arn=topic_arn,
+            maxsize=settings.MONITOR_LIVE_QUEUE_SIZE,
+        )
+        with self._lock:
+            self._subscribers.add(subscription)
+            # Un solo hilo de sondeo por proceso, sin importar cuántos clientes haya
+            if settings.MONITOR_LIVE_POLL_INTERVAL and self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name='live-poller', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events):
+        """Puede llamarse desde cualquier hilo (por ejemplo, el de sondeo)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            matching = [event for event in events if subscription.matches(event)]
+            if not matching:
+                continue
+            try:
+                for event in matching:
+                    subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # El event loop del cliente ya se cerró
+                self.unsubscribe(subscription)
+
+    def poll_once(self):
+        """Publica los mensajes guardados (por cualquier proceso) desde la consulta anterior"""
+        if self._last_id is None:
+            # Los clientes solo ven lo que llega después de conectarse
+            self._last_id = latest_message_id()
+            return 0
+        events = recent_events(self._last_id, limit=settings.MONITOR_LIVE_POLL_BATCH)
+        if events:
+            self._last_id = events[-1]['id']
+            self.publish(events)
+        return len(events)
+
+    def _poll_loop(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        # Sin clientes se deja de consultar; el próximo subscribe arranca otro hilo
+                        self._poller = None
+                        self._last_id = None
+                        return
+                try:
+                    self.poll_once()
+                except DatabaseError:
+                    logger.exception('Falló la consulta de mensajes nuevos para el tail en vivo')
+                time.sleep(settings.MONITOR_LIVE_POLL_INTERVAL)
+        finally:
+            connection.close()
+
+broker = LiveBroker()
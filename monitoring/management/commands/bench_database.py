@@ -0,0 +1,138 @@
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.utils import timezone
+from monitoring.aws_service import store_messages
+from monitoring.benchmarks import BENCH_PREFIX, database_profile, delete_bench_data, sqs_messages
+from monitoring.models import Message
+import json
+import statistics
+import threading
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Mide el throughput de escritores (ingesta) y lectores (listados) concurrentes sobre la base '
+        'configurada con DB_PROFILE. Usar sobre una base descartable.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=2, help='Hilos que guardan lotes como el consumidor')
+        parser.add_argument('--readers', type=int, default=4, help='Hilos que leen páginas como el dashboard')
+        parser.add_argument('--seconds', type=float, default=10, help='Duración de la medición')
+        parser.add_argument('--batch', type=int, default=100, help='Mensajes por lote de escritura')
+        parser.add_argument('--page-size', type=int, default=50, help='Filas leídas por consulta')
+        parser.add_argument('--keep', action='store_true', help='No borrar los datos de benchmark al terminar')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+        parser.add_argument('--output', help='Guardar el resultado como JSON en este archivo')
+        parser.add_argument('--compare', help='Comparar contra un resultado JSON guardado antes')
+
+    def handle(self, *args, **options):
+        run_id = int(time.time() * 1000)
+        stop = threading.Event()
+        stats = {'writer': [], 'reader': []}
+        threads = [
+            threading.Thread(target=self._writer, args=(f'{run_id}-{index}', options, stop, stats['writer']))
+            for index in range(options['writers'])
+        ] + [
+            threading.Thread(target=self._reader, args=(options, stop, stats['reader']))
+            for _ in range(options['readers'])
+        ]
+        results = {'created_at': timezone.now().isoformat(), 'database': database_profile(), 'config': {
+            key: options[key] for key in ('writers', 'readers', 'seconds', 'batch', 'page_size')
+        }}
+        try:
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(options['seconds'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            results['writers'] = self._summary(stats['writer'], elapsed, per_item=options['batch'])
+            results['readers'] = self._summary(stats['reader'], elapsed)
+        finally:
+            if not options['keep']:
+                self.stderr.write('Eliminando datos de benchmark...')
+                delete_bench_data()
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._report(results)
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self._compare(json.load(handle), results)
+
+    def _run(self, func, stop, samples):
+        # Cada hilo usa su propia conexión; se cierra al terminar
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    func()
+                except OperationalError as exc:
+                    # En SQLite sin WAL ni busy_timeout: "database is locked"
+                    samples.append(('error', str(exc)))
+                else:
+                    samples.append(('ok', (time.perf_counter() - start) * 1000))
+        finally:
+            connection.close()
+
+    def _writer(self, name, options, stop, samples):
+        queue_url = f'https://sqs.us-east-1.amazonaws.com/000000000000/{BENCH_PREFIX}db-{name}'
+        batches = iter(range(10 ** 9))
+
+        def write():
+            close_old_connections()
+            store_messages(queue_url, sqs_messages(options['batch'], f'{name}-{next(batches)}'))
+        self._run(write, stop, samples)
+
+    def _reader(self, options, stop, samples):
+        def read():
+            close_old_connections()
+            # Las mismas formas que message_list y el conteo del dashboard
+            list(
+                Message.objects.filter(queue_name__startswith=BENCH_PREFIX)
+                .order_by('-received_at', '-id').values('id', 'message_id', 'received_at')[:options['page_size']]
+            )
+            Message.objects.filter(queue_name__startswith=BENCH_PREFIX).count()
+        self._run(read, stop, samples)
+
+    def _summary(self, samples, elapsed, per_item=1):
+        latencies = sorted(value for status, value in samples if status == 'ok')
+        errors = [value for status, value in samples if status == 'error']
+        return {
+            'operations': len(latencies),
+            'per_sec': round(len(latencies) * per_item / elapsed, 1) if elapsed else None,
+            'p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+            'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3) if latencies else None,
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+        }
+
+    def _report(self, results):
+        database = results['database']
+        self.stdout.write(f'perfil: {json.dumps(database)}')
+        for role, unit in (('writers', 'msg/s'), ('readers', 'consultas/s')):
+            stats = results[role]
+            self.stdout.write(
+                f'{role}: {stats["per_sec"]} {unit}, p50 {stats["p50_ms"]} ms, p99 {stats["p99_ms"]} ms, '
+                f'{stats["errors"]} errores'
+            )
+            if stats['first_error']:
+                self.stdout.write(self.style.WARNING(f'  primer error: {stats["first_error"]}'))
+
+    def _compare(self, before, after):
+        """Muestra la variación porcentual respecto de otro perfil o de una corrida anterior"""
+        self.stdout.write(f'Comparación {before["database"].get("profile")} -> {after["database"].get("profile")}:')
+        for role in ('writers', 'readers'):
+            for stat in ('per_sec', 'p50_ms', 'p99_ms', 'errors'):
+                old, new = before.get(role, {}).get(stat), after.get(role, {}).get(stat)
+                if old is None or new is None:
+                    continue
+                change = f' ({(new - old) / old * 100:+.1f}%)' if old else ''
+                self.stdout.write(f'  {role} {stat}: {old} -> {new}{change}')
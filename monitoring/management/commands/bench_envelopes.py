@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from monitoring import envelopes
+from monitoring.aws_service import build_message
+from monitoring.benchmarks import bench_queue_names, sample_bodies, time_per_item
+import json
+
+class Command(BaseCommand):
+    help = 'Mide el costo por mensaje de decodificar los sobres de SNS/EventBridge con cada backend de JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Cantidad de cuerpos sintéticos')
+        parser.add_argument('--body-size', type=int, default=512, help='Tamaño aproximado del contenido')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones (se toma la mejor)')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        bodies = sample_bodies(options['messages'], options['body_size'])
+        queue_url = f'https://sqs.us-east-1.amazonaws.com/000000000000/{bench_queue_names(1)[0]}'
+        messages = [
+            {'MessageId': str(index), 'Body': body, 'Attributes': {'SentTimestamp': '1704067200000'}}
+            for index, body in enumerate(bodies)
+        ]
+        backends = ['json'] + (['orjson'] if envelopes.orjson else [])
+        # Referencia: el parseo que hacía la ingesta antes (solo el sobre, el contenido quedaba como texto)
+        results = {'envelope_only_json': time_per_item(json.loads, bodies, options['repeat'])}
+        for backend in backends:
+            results[f'decode_{backend}'] = time_per_item(
+                lambda body, backend=backend: envelopes.decode(body, backend), bodies, options['repeat'],
+            )
+        # Camino completo de la ingesta, con el backend configurado
+        results[f'build_message_{envelopes.json_backend()}'] = time_per_item(
+            lambda msg: build_message(msg, queue_url), messages, options['repeat'],
+        )
+        report = {'messages': len(bodies), 'body_size': options['body_size'], 'us_per_message': results}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, micros in results.items():
+            rate = f'{1e6 / micros:,.0f} msg/s' if micros else '-'
+            self.stdout.write(f'{name}: {micros:.2f} µs por mensaje ({rate})')
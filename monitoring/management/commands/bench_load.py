@@ -0,0 +1,207 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from monitoring import fake_aws, queue_metrics
+from monitoring.aws_clients import get_client
+from monitoring.aws_service import fetch_all_messages
+from monitoring.benchmarks import (
+    BENCH_PREFIX, analyze, bench_queue_names, delete_bench_data, peak_memory_kb, publish_load,
+    seed_messages, setup_fake_load, time_call,
+)
+from monitoring.collector import invalidate_target_queues
+from monitoring.counters import rebuild_counters
+from monitoring.inventory import invalidate_inventory
+from monitoring.models import Message
+from monitoring.topology import invalidate_topology
+import json
+import subprocess
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class Command(BaseCommand):
+    help = (
+        'Genera carga sobre un SQS/SNS falso en memoria y mide el throughput de ingesta y la latencia '
+        'de los listados con distintos volúmenes de mensajes guardados. Usar sobre una base descartable.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help='Mensajes a publicar en SNS para medir la ingesta')
+        parser.add_argument('--queues', type=int, default=20, help='Cantidad de colas sintéticas')
+        parser.add_argument('--topics', type=int, default=5, help='Cantidad de topics sintéticos')
+        parser.add_argument(
+            '--rows', type=int, action='append', dest='rows', default=None,
+            help='Filas guardadas para medir los listados (se puede repetir). Por defecto 10k, 100k y 1M',
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Repeticiones por página')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Demora simulada por llamada a la API')
+        parser.add_argument('--workers', type=int, default=None, help='Hilos de polling (SQS_POLL_CONCURRENCY)')
+        parser.add_argument('--keep', action='store_true', help='No borrar los datos de benchmark al terminar')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+        parser.add_argument('--output', help='Guardar el resultado como JSON en este archivo')
+        parser.add_argument('--compare', help='Comparar contra un resultado JSON guardado antes')
+
+    def handle(self, *args, **options):
+        rows = sorted(options['rows'] or [10000, 100000, 1000000])
+        region = settings.AWS_REGION or fake_aws.DEFAULT_REGION
+        fake_aws.backend.reset()
+        fake_aws.backend.latency = options['latency_ms'] / 1000
+        overrides = {
+            'MONITOR_AWS_BACKEND': 'fake',
+            # Sin actualización periódica: el scheduler competiría con la medición
+            'MONITOR_REFRESH_INTERVAL': 0,
+            'MONITOR_REGIONS': [region],
+            'MONITOR_QUEUE_PREFIXES': [BENCH_PREFIX],
+            'MONITOR_TARGETS': [],
+            'MONITOR_PEEK_QUEUES': [],
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            # Con DEBUG cada consulta queda registrada en memoria y distorsiona la medición
+            'DEBUG': False,
+        }
+        with override_settings(**overrides):
+            self._reset_caches()
+            sqs = get_client('sqs', region)
+            sns = get_client('sns', region)
+            queue_urls, topic_arns = setup_fake_load(sqs, sns, queues=options['queues'], topics=options['topics'])
+            results = {
+                'commit': self._commit(),
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'config': {
+                    'messages': options['messages'],
+                    'queues': options['queues'],
+                    'topics': options['topics'],
+                    'latency_ms': options['latency_ms'],
+                    'workers': options['workers'] or settings.SQS_POLL_CONCURRENCY,
+                },
+            }
+            try:
+                results['fetch'] = self._bench_fetch(sns, topic_arns, options)
+                results['pages'] = {
+                    str(count): self._bench_pages(count, queue_urls, topic_arns, options) for count in rows
+                }
+            finally:
+                if not options['keep']:
+                    self.stderr.write('Eliminando datos de benchmark...')
+                    delete_bench_data()
+                self._reset_caches()
+            if resource:
+                # ru_maxrss está en KiB en Linux
+                results['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._report(results)
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self._compare(json.load(handle), results)
+
+    def _reset_caches(self):
+        invalidate_inventory()
+        invalidate_topology()
+        invalidate_target_queues()
+        cache.delete(queue_metrics.CACHE_KEY)
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            return None
+
+    def _bench_fetch(self, sns, topic_arns, options):
+        """Publica la carga y mide cuánto tarda el camino de ingesta en vaciar las colas"""
+        self.stderr.write(f'Publicando {options["messages"]} mensajes...')
+        publish_load(sns, topic_arns, options['messages'])
+        delivered = fake_aws.backend.pending()
+        rounds = 0
+        start = time.perf_counter()
+        while fake_aws.backend.pending():
+            results = fetch_all_messages(max_messages=10, wait_time=0, max_workers=options['workers'])
+            rounds += 1
+            if not sum(result['received'] for result in results.values()):
+                # Lo que queda está en vuelo (no se pudo confirmar): no tiene sentido seguir
+                break
+        elapsed = time.perf_counter() - start
+        stored = Message.objects.filter(queue_name__startswith=BENCH_PREFIX).count()
+        # Pico de memoria de una ronda de polling con todas las colas llenas
+        publish_load(sns, topic_arns, len(topic_arns) * 10)
+        peak_kb = peak_memory_kb(lambda: fetch_all_messages(max_messages=10, wait_time=0, max_workers=options['workers']))
+        return {
+            'delivered': delivered,
+            'stored': stored,
+            'rounds': rounds,
+            'seconds': round(elapsed, 3),
+            'messages_per_sec': round(delivered / elapsed, 1) if elapsed else None,
+            'round_peak_kb': peak_kb,
+        }
+
+    def _bench_pages(self, count, queue_urls, topic_arns, options):
+        """Completa la base hasta count filas de benchmark y mide las páginas de los listados"""
+        existing = Message.objects.filter(queue_name__startswith=BENCH_PREFIX).count()
+        if count > existing:
+            self.stderr.write(f'Sembrando hasta {count} mensajes...')
+            seed_messages(count - existing, queues=options['queues'], topics=options['topics'])
+        rebuild_counters()
+        analyze()
+        # Métricas y topología en caché, como en una request normal
+        queue_metrics.collect_queue_metrics(queue_urls)
+        client = Client()
+        pages = {
+            'queue_list': reverse('queue_list'),
+            'message_list': reverse('message_list', args=[bench_queue_names(options['queues'])[0]]),
+            'topic_list': reverse('topic_list'),
+        }
+        # La ingesta previa también deja filas: se informa el total real
+        results = {'rows': Message.objects.filter(queue_name__startswith=BENCH_PREFIX).count(), 'views': {}}
+        for name, url in pages.items():
+            def get(url=url):
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+            results['views'][name] = {**time_call(get, iterations=options['iterations']), 'peak_kb': peak_memory_kb(get)}
+        return results
+
+    def _report(self, results):
+        fetch = results['fetch']
+        self.stdout.write(
+            f'ingesta: {fetch["delivered"]} mensajes en {fetch["seconds"]:.2f} s '
+            f'({fetch["messages_per_sec"]} msg/s, {fetch["rounds"]} rondas, pico {fetch["round_peak_kb"]} KiB por ronda)'
+        )
+        for pages in results['pages'].values():
+            for name, stats in pages['views'].items():
+                self.stdout.write(
+                    f'{name} @ {pages["rows"]} filas: p50 {stats["p50_ms"]:.2f} ms, p99 {stats["p99_ms"]:.2f} ms, '
+                    f'pico {stats["peak_kb"]} KiB'
+                )
+        if 'peak_rss_kb' in results:
+            self.stdout.write(f'memoria residente máxima: {results["peak_rss_kb"]} KiB')
+
+    def _compare(self, before, after):
+        """Muestra la variación porcentual de cada métrica respecto de un resultado anterior"""
+        self.stdout.write(f'Comparación {before.get("commit")} -> {after.get("commit")}:')
+        metrics = [('ingesta msg/s', ('fetch', 'messages_per_sec'))]
+        for count, pages in after['pages'].items():
+            for name in pages['views']:
+                for stat in ('p50_ms', 'p99_ms'):
+                    metrics.append((f'{name} @ {count} {stat}', ('pages', count, 'views', name, stat)))
+        for label, path in metrics:
+            old, new = before, after
+            for key in path:
+                old = old.get(key) if isinstance(old, dict) else None
+                new = new.get(key) if isinstance(new, dict) else None
+            if not old or new is None:
+                continue
+            self.stdout.write(f'  {label}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)')
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from monitoring.benchmarks import (
+    analyze, bench_queue_names, bench_topic_arns, delete_seeded_messages, seed_messages, time_call,
+)
+from monitoring.models import Message
+import json
+
+class Command(BaseCommand):
+    help = (
+        'Siembra mensajes sintéticos y mide la latencia de las consultas de los listados '
+        'sin y con los índices de Message. Usar sobre una base de datos descartable.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Cantidad de mensajes a sembrar')
+        parser.add_argument('--queues', type=int, default=20, help='Cantidad de colas sintéticas')
+        parser.add_argument('--topics', type=int, default=5, help='Cantidad de topics sintéticos')
+        parser.add_argument('--page-size', type=int, default=50, help='Filas leídas por consulta')
+        parser.add_argument('--iterations', type=int, default=20, help='Repeticiones por consulta')
+        parser.add_argument('--keep', action='store_true', help='No borrar los mensajes sembrados al terminar')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        queue_name = bench_queue_names(options['queues'])[0]
+        topic_arn = bench_topic_arns(options['topics'])[0]
+        queries = {
+            'message_list': lambda: Message.objects.filter(queue_name=queue_name).order_by('-received_at', '-id'),
+            'topic_message_list': lambda: Message.objects.filter(topic_arn=topic_arn).order_by('-received_at', '-id'),
+            'admin_state_filter': lambda: Message.objects.filter(state='PROCESSED').order_by('-received_at'),
+        }
+
+        self.stderr.write(f'Sembrando {options["rows"]} mensajes...')
+        seed_messages(options['rows'], queues=options['queues'], topics=options['topics'])
+        results = {'rows': options['rows'], 'vendor': connection.vendor, 'phases': {}}
+        try:
+            for phase, with_indexes in (('before', False), ('after', True)):
+                self._set_indexes(with_indexes)
+                analyze()
+                results['phases'][phase] = {
+                    name: {
+                        **time_call(lambda build=build: list(build()[:page_size]), iterations=options['iterations']),
+                        'plan': build()[:page_size].explain(),
+                    }
+                    for name, build in queries.items()
+                }
+        finally:
+            self._set_indexes(True)
+            if not options['keep']:
+                self.stderr.write('Eliminando mensajes sembrados...')
+                delete_seeded_messages()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name in queries:
+            before = results['phases']['before'][name]
+            after = results['phases']['after'][name]
+            self.stdout.write(
+                f'{name}: p50 {before["p50_ms"]:.2f} ms -> {after["p50_ms"]:.2f} ms, '
+                f'p99 {before["p99_ms"]:.2f} ms -> {after["p99_ms"]:.2f} ms'
+            )
+            self.stdout.write(f'  plan: {after["plan"]}')
+
+    def _set_indexes(self, enabled):
+        """Crea o elimina los índices declarados en Message.Meta"""
+        existing = set(connection.introspection.get_constraints(connection.cursor(), Message._meta.db_table))
+        with connection.schema_editor() as schema_editor:
+            for index in Message._meta.indexes:
+                if enabled and index.name not in existing:
+                    schema_editor.add_index(Message, index)
+                elif not enabled and index.name in existing:
+                    schema_editor.remove_index(Message, index)
@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from monitoring.aws_service import fetch_monitor_messages
-import time
+from monitoring.aws_service import MONITOR_QUEUE_URL, fetch_messages_from_queue
+from monitoring.collector import collect_targets, get_target_queues, target_clients
+from monitoring.consumer import QueueConsumer
+from monitoring.metrics import start_metrics_server
+from monitoring.spool import Spool
+import signal
 
 class Command(BaseCommand):
     help = 'Obtiene mensajes de la cola SQS de monitoreo y los guarda en la base de datos'
@@ -13,12 +18,59 @@ class Command(BaseCommand):
             dest='continuous',
             help='Ejecutar en modo continuo, monitoreando constantemente la cola',
         )
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            default=None,
+            help='URL de una cola a consumir (se puede repetir). Por defecto, la cola de monitoreo',
+        )
+        parser.add_argument(
+            '--targets',
+            action='store_true',
+            dest='targets',
+            help='Consumir también las colas de los destinos de MONITOR_TARGETS (otras cuentas o regiones)',
+        )
+        parser.add_argument(
+            '--peek',
+            action='store_true',
+            dest='peek',
+            default=None,
+            help='Observar las colas sin consumirlas: los mensajes se guardan y quedan en la cola',
+        )
+        parser.add_argument(
+            '--receivers',
+            type=int,
+            dest='receivers',
+            default=2,
+            help='Cantidad de receptores concurrentes por cola (en modo continuo)',
+        )
         parser.add_argument(
             '--interval',
             type=int,
             dest='interval',
             default=5,
-            help='Intervalo en segundos entre verificaciones (en modo continuo)',
+            help='Espera máxima en segundos entre consultas cuando la cola está vacía (en modo continuo)',
+        )
+        parser.add_argument(
+            '--retention-interval',
+            type=int,
+            dest='retention_interval',
+            default=settings.MONITOR_RETENTION_INTERVAL,
+            help='Segundos entre pasadas de retención en modo continuo (0 la desactiva)',
+        )
+        parser.add_argument(
+            '--spool-dir',
+            dest='spool_dir',
+            default=settings.MONITOR_SPOOL_DIR,
+            help='Directorio del spool en disco entre SQS y la base (en modo continuo; vacío lo desactiva)',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            dest='metrics_port',
+            default=settings.MONITOR_METRICS_PORT,
+            help='Puerto donde exponer /metrics para Prometheus (0 lo desactiva)',
         )
         parser.add_argument(
             '--max-messages',
@@ -37,33 +89,97 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         continuous = options['continuous']
-        interval = options['interval']
+        queue_urls = options['queues'] or [MONITOR_QUEUE_URL]
         max_messages = options['max_messages']
         wait_time = options['wait_time']
-        
+        queue_targets = get_target_queues(block=True) if options['targets'] else {}
+        if options['targets'] and not options['queues']:
+            # Con --targets y sin --queue se consumen solo las colas de los destinos
+            queue_urls = []
+        queue_urls = list(dict.fromkeys(queue_urls + list(queue_targets)))
+
         self.stdout.write(
-            self.style.SUCCESS(f'Iniciando monitoreo de cola SQS dedicada para monitoreo')
+            self.style.SUCCESS(f'Iniciando monitoreo de {len(queue_urls)} cola(s) SQS')
         )
-        
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'])
+            self.stdout.write(f'Métricas en http://0.0.0.0:{options["metrics_port"]}/metrics')
+
         if continuous:
-            self.stdout.write(
-                self.style.WARNING(f'Modo continuo activado. Presiona Ctrl+C para detener.')
+            self._consume(
+                queue_urls, options['receivers'], max_messages, wait_time,
+                options['interval'], options['retention_interval'], options['peek'],
+                target_clients(queue_targets), options['spool_dir'],
             )
-            while True:
-                try:
-                    self._fetch_messages(max_messages, wait_time)
-                    time.sleep(interval)
-                except KeyboardInterrupt:
-                    self.stdout.write(self.style.WARNING('Monitoreo detenido por el usuario'))
-                    break
+        elif queue_targets:
+            self._collect_targets(max_messages, wait_time)
+            for queue_url in options['queues'] or []:
+                self._fetch_messages(queue_url, max_messages, wait_time, options['peek'])
+        else:
+            for queue_url in queue_urls:
+                self._fetch_messages(queue_url, max_messages, wait_time, options['peek'])
+
+    def _consume(self, queue_urls, receivers, max_messages, wait_time, max_backoff, retention_interval, peek,
+                 clients=None, spool_dir=None):
+        spool = Spool(spool_dir, segment_bytes=settings.MONITOR_SPOOL_SEGMENT_BYTES) if spool_dir else None
+        if spool and spool.pending_bytes():
+            self.stdout.write(f'Spool con {spool.pending_bytes()} bytes pendientes de una ejecución anterior')
+        consumer = QueueConsumer(
+            queue_urls,
+            receivers_per_queue=receivers,
+            max_messages=max_messages,
+            wait_time=wait_time,
+            max_backoff=max_backoff,
+            on_batch=self._report_batch,
+            retention_interval=retention_interval,
+            peek=peek,
+            clients=clients,
+            spool=spool,
+        )
+
+        def request_stop(signum, frame):
+            if not consumer.stopping:
+                self.stdout.write(
+                    self.style.WARNING('Deteniendo: se terminan de guardar los lotes en curso...')
+                )
+            consumer.stop()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(
+            self.style.WARNING('Modo continuo activado. Presiona Ctrl+C para detener.')
+        )
+        try:
+            consumer.run()
+        finally:
+            if spool:
+                spool.close()
+        self.stdout.write(self.style.WARNING('Monitoreo detenido'))
+
+    def _report_batch(self, queue_url, result):
+        message = (
+            f'{queue_url.split("/")[-1]}: {result["received"]} recibidos, '
+            f'{result["created"]} nuevos, {len(result["failed"])} sin confirmar'
+        )
+        if result['failed']:
+            self.stdout.write(self.style.WARNING(message))
         else:
-            self._fetch_messages(max_messages, wait_time)
-    
-    def _fetch_messages(self, max_messages, wait_time):
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def _collect_targets(self, max_messages, wait_time):
+        results = collect_targets(max_messages=max_messages, wait_time=wait_time)
+        for queue_url, result in results.items():
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f'{queue_url.split("/")[-1]}: {result["error"]}'))
+            else:
+                self._report_batch(queue_url, result)
+
+    def _fetch_messages(self, queue_url, max_messages, wait_time, peek):
         start_time = timezone.now()
-        messages = fetch_monitor_messages(max_messages=max_messages, wait_time=wait_time)
+        messages = fetch_messages_from_queue(queue_url, max_messages=max_messages, wait_time=wait_time, peek=peek)
         end_time = timezone.now()
-        
+
         if messages:
             self.stdout.write(
                 self.style.SUCCESS(
@@ -73,4 +189,4 @@ class Command(BaseCommand):
         else:
             self.stdout.write(
                 self.style.WARNING('No se encontraron mensajes nuevos')
-            ) 
\ No newline at end of file
+            )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from monitoring.retention import run_retention
+
+class Command(BaseCommand):
+    help = 'Elimina los mensajes que exceden las políticas de retención (MONITOR_RETENTION)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archive-dir',
+            dest='archive_dir',
+            default=None,
+            help='Directorio donde archivar los mensajes (JSONL gzip) antes de borrarlos',
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            dest='vacuum',
+            default=None,
+            help='Ejecutar VACUUM al terminar para liberar espacio en disco',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            dest='chunk_size',
+            default=None,
+            help='Cantidad de filas borradas por transacción',
+        )
+
+    def handle(self, *args, **options):
+        summary = run_retention(
+            archive_dir=options['archive_dir'],
+            vacuum=options['vacuum'],
+            chunk_size=options['chunk_size'],
+        )
+        if not summary:
+            self.stdout.write(self.style.WARNING('No hay mensajes para eliminar'))
+            return
+        for scope, deleted in summary.items():
+            self.stdout.write(f'{scope}: {deleted} mensajes eliminados')
+        self.stdout.write(
+            self.style.SUCCESS(f'Se eliminaron {sum(summary.values())} mensajes')
+        )
@@ -0,0 +1,211 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import threading
+import time
+
+# Métricas en formato de exposición de Prometheus (texto 0.0.4), sin dependencias externas.
+# Cada proceso (web o consumidor) lleva sus propios valores y los expone en /metrics.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Segundos: desde lecturas locales hasta long polling de 20 segundos
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+BATCH_BUCKETS = (0, 1, 2, 5, 10)
+
+# Códigos de error de AWS que indican limitación de tasa
+THROTTLING_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestThrottledException', 'TooManyRequestsException', 'RequestLimitExceeded',
+    'SlowDown', 'PriorDequeueCooldown',
+}
+
+_registry = []
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items
+        )
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # clave -> [conteo por bucket..., suma, total]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return state[-1] if state else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with _lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {state[-1]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(float(state[-2]))}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+# Cada cola se identifica por nombre, cuenta y región, igual que en los contadores
+QUEUE_LABELS = ['queue', 'account', 'region']
+
+receive_seconds = Histogram(
+    'sqs_receive_seconds', 'Duración de ReceiveMessage (incluye la espera de long polling)', QUEUE_LABELS,
+)
+receive_batch_size = Histogram(
+    'sqs_receive_batch_size', 'Mensajes devueltos por cada ReceiveMessage', QUEUE_LABELS, buckets=BATCH_BUCKETS,
+)
+empty_receives = Counter('sqs_empty_receives_total', 'ReceiveMessage que no devolvieron mensajes', QUEUE_LABELS)
+messages_received = Counter('sqs_messages_received_total', 'Mensajes recibidos de SQS', QUEUE_LABELS)
+parse_seconds = Histogram(
+    'monitor_parse_seconds', 'Tiempo de decodificar un lote (JSON de SNS) en filas de Message', QUEUE_LABELS,
+)
+db_insert_seconds = Histogram(
+    'monitor_db_insert_seconds', 'Duración de la transacción que guarda un lote en la base', QUEUE_LABELS,
+)
+messages_stored = Counter('monitor_messages_stored_total', 'Mensajes nuevos guardados en la base', QUEUE_LABELS)
+duplicates_skipped = Counter(
+    'monitor_duplicates_skipped_total', 'Mensajes descartados por estar ya guardados', QUEUE_LABELS,
+)
+ack_seconds = Histogram(
+    'sqs_ack_seconds', 'Duración de cada DeleteMessageBatch (el modo observación no confirma)',
+    [*QUEUE_LABELS, 'operation'],
+)
+ack_failures = Counter(
+    'sqs_ack_failures_total', 'Entradas de DeleteMessageBatch que fallaron y quedan para reintento',
+    [*QUEUE_LABELS, 'operation', 'code'],
+)
+aws_requests = Counter(
+    'aws_requests_total', 'Intentos HTTP contra AWS, incluidos los reintentos', ['service', 'operation'],
+)
+aws_retries = Counter('aws_retries_total', 'Reintentos hechos por botocore', ['service', 'operation'])
+aws_throttles = Counter(
+    'aws_throttled_requests_total', 'Intentos rechazados por limitación de tasa', ['service', 'operation'],
+)
+aws_errors = Counter('aws_errors_total', 'Intentos que terminaron en error', ['service', 'operation', 'code'])
+spool_append_seconds = Histogram('monitor_spool_append_seconds', 'Duración de escribir un lote en el spool (con fsync)')
+spool_messages = Counter(
+    'monitor_spool_messages_total',
+    'Mensajes escritos en el spool (appended), pasados a la base (stored) o apartados (dead_letter)',
+    ['stage'],
+)
+
+def render():
+    """Todas las métricas del proceso en formato de texto de Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def _on_response(event_name=None, parsed_response=None, context=None, exception=None, **kwargs):
+    """Se ejecuta por cada intento HTTP de botocore (los reintentos incluidos)"""
+    _, service, operation = event_name.split('.', 2)
+    aws_requests.inc(service=service, operation=operation)
+    if ((context or {}).get('retries') or {}).get('attempt', 1) > 1:
+        aws_retries.inc(service=service, operation=operation)
+    if exception is not None:
+        aws_errors.inc(service=service, operation=operation, code=type(exception).__name__)
+        return
+    code = ((parsed_response or {}).get('Error') or {}).get('Code')
+    if code:
+        aws_errors.inc(service=service, operation=operation, code=code)
+        if code in THROTTLING_CODES:
+            aws_throttles.inc(service=service, operation=operation)
+
+def instrument_client(client):
+    """Registra el contador de intentos, reintentos y throttling en un cliente de boto3"""
+    events = getattr(getattr(client, 'meta', None), 'events', None)
+    if events is not None:
+        events.register('response-received', _on_response)
+    return client
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, address=''):
+    """Expone /metrics desde un hilo aparte (para procesos sin Django web, como el consumidor)"""
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server
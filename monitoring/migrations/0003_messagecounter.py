@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 08:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_counters(apps, schema_editor):
+    Message = apps.get_model('monitoring', 'Message')
+    MessageCounter = apps.get_model('monitoring', 'MessageCounter')
+    for kind, field in (('queue', 'queue_name'), ('topic', 'topic_arn')):
+        rows = (
+            Message.objects.exclude(**{f'{field}__isnull': True})
+            .values(field)
+            .annotate(total=Count('id'), last=Max('received_at'))
+            .order_by()
+        )
+        MessageCounter.objects.bulk_create([
+            MessageCounter(kind=kind, name=row[field], count=row['total'], last_received_at=row['last'])
+            for row in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_message_subject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('queue', 'Cola'), ('topic', 'Topic')], max_length=10)),
+                ('name', models.CharField(max_length=512)),
+                ('count', models.BigIntegerField(default=0)),
+                ('last_received_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'name'), name='unique_counter_kind_name')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
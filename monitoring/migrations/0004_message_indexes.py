@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_messagecounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['queue_name', '-received_at', '-id'], name='message_queue_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('topic_arn__isnull', False)), fields=['topic_arn', '-received_at', '-id'], name='message_topic_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['state', '-received_at'], name='message_state_recent_idx'),
+        ),
+    ]
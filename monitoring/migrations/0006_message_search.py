@@ -0,0 +1,42 @@
+from django.db import migrations
+
+FTS_TABLE = 'monitoring_message_fts'
+PG_INDEX = 'monitoring_message_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(subject, body, attributes, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Los cuerpos ya desplazados a MessageBlob se indexan por su extracto
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, subject, body, attributes) "
+            f"SELECT id, coalesce(subject, ''), body, coalesce(attributes, '') FROM monitoring_message"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON monitoring_message USING gin ("
+            f"to_tsvector('simple', coalesce(subject, '') || ' ' || body || ' ' || coalesce(attributes::text, '')))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_message_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MessageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', 'Minuto'), ('1h', 'Hora'), ('1d', 'Día')], max_length=2)),
+                ('kind', models.CharField(choices=[('queue', 'Cola'), ('topic', 'Topic')], max_length=10)),
+                ('name', models.CharField(max_length=512)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('lag_count', models.BigIntegerField(default=0)),
+                ('lag_sum', models.FloatField(default=0)),
+                ('lag_max', models.FloatField(default=0)),
+                ('lag_histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'bucket_start'], name='rollup_resolution_start_idx')],
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'kind', 'name', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_message_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueMetricSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue_name', models.CharField(max_length=255)),
+                ('sampled_at', models.DateTimeField()),
+                ('visible', models.BigIntegerField(default=0)),
+                ('not_visible', models.BigIntegerField(default=0)),
+                ('delayed', models.BigIntegerField(default=0)),
+                ('oldest_age_seconds', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['queue_name', '-sampled_at'], name='queue_metric_recent_idx'), models.Index(fields=['sampled_at'], name='queue_metric_sampled_idx')],
+            },
+        ),
+    ]
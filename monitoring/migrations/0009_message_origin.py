@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_queue_metric_samples'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='account_id',
+            field=models.CharField(blank=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='region',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0009_message_origin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='envelope',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='envelope_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='payload',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
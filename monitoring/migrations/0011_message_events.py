@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 08:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_message_envelope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=300, unique=True)),
+                ('topic_arn', models.CharField(blank=True, max_length=512, null=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('fanout', models.PositiveIntegerField(default=0)),
+                ('first_received_at', models.DateTimeField(auto_now_add=True)),
+                ('last_received_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_topic_recent_idx',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='duplicate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='monitoring.messageevent'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('duplicate', False), ('topic_arn__isnull', False)), fields=['topic_arn', '-received_at', '-id'], name='message_topic_recent_idx'),
+        ),
+    ]
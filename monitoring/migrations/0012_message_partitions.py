@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0011_message_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessagePartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=100, unique=True)),
+                ('period_start', models.DateTimeField(unique=True)),
+                ('period_end', models.DateTimeField()),
+                ('min_id', models.BigIntegerField(blank=True, null=True)),
+                ('max_id', models.BigIntegerField(blank=True, null=True)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('columns', models.JSONField(default=list)),
+                ('counts', models.JSONField(default=dict)),
+                ('sealed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 08:49
+
+from collections import Counter
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def rekey_queue_counters(apps, schema_editor):
+    """Separa los contadores de colas por cuenta y región, incluidas las filas selladas en particiones"""
+    Message = apps.get_model('monitoring', 'Message')
+    MessageCounter = apps.get_model('monitoring', 'MessageCounter')
+    MessagePartition = apps.get_model('monitoring', 'MessagePartition')
+    quote = schema_editor.connection.ops.quote_name
+    totals = Counter()
+    last = {}
+    rows = (
+        Message.objects.values('account_id', 'region', 'queue_name')
+        .annotate(total=Count('id'), last=Max('received_at'))
+        .order_by()
+    )
+    for row in rows:
+        key = (row['account_id'] or '', row['region'] or '', row['queue_name'])
+        totals[key] += row['total']
+        last[key] = row['last']
+    for partition in MessagePartition.objects.all():
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT account_id, region, queue_name, count(*) FROM {quote(partition.table_name)} '
+                f'GROUP BY account_id, region, queue_name'
+            )
+            queues = [list(row) for row in cursor.fetchall()]
+        partition.counts = {**(partition.counts or {}), 'queues': queues}
+        partition.save(update_fields=['counts'])
+        for account_id, region, queue_name, count in queues:
+            totals[(account_id or '', region or '', queue_name)] += count
+    MessageCounter.objects.filter(kind='queue').delete()
+    MessageCounter.objects.bulk_create([
+        MessageCounter(
+            kind='queue', account_id=account_id, region=region, name=name, count=count,
+            last_received_at=last.get((account_id, region, name)),
+        )
+        for (account_id, region, name), count in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0012_message_partitions'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='messagecounter',
+            name='unique_counter_kind_name',
+        ),
+        migrations.AddField(
+            model_name='messagecounter',
+            name='account_id',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='messagecounter',
+            name='region',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='queuemetricsample',
+            name='account_id',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='queuemetricsample',
+            name='region',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddConstraint(
+            model_name='messagecounter',
+            constraint=models.UniqueConstraint(fields=('kind', 'account_id', 'region', 'name'), name='unique_counter_key'),
+        ),
+        migrations.RunPython(rekey_queue_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0013_counter_queue_origin'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='messagerollup',
+            name='unique_rollup_bucket',
+        ),
+        migrations.AddField(
+            model_name='messagerollup',
+            name='account_id',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='messagerollup',
+            name='region',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddConstraint(
+            model_name='messagerollup',
+            constraint=models.UniqueConstraint(fields=('resolution', 'kind', 'account_id', 'region', 'name', 'bucket_start'), name='unique_rollup_key'),
+        ),
+    ]
@@ -1,16 +1,193 @@
 from django.db import models
+from django.utils.functional import cached_property
+from .compression import decompress
 
 # Create your models here.
 
+class MessageBlob(models.Model):
+    """Cuerpo de mensaje grande, comprimido y direccionado por su hash (se guarda una sola vez)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    codec = models.CharField(max_length=10)
+    size = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def text(self):
+        return decompress(self.data, self.codec).decode('utf-8')
+
+    def __str__(self):
+        return f'{self.sha256} ({self.size} bytes)'
+
+
+class MessageEvent(models.Model):
+    """Evento lógico (una publicación en SNS o EventBridge) que puede llegar a varias colas"""
+    # 'sns:<MessageId>', 'eventbridge:<id>' o 'sha256:<hash del contenido>' (ver events.py)
+    key = models.CharField(max_length=300, unique=True)
+    topic_arn = models.CharField(max_length=512, blank=True, null=True)
+    published_at = models.DateTimeField(blank=True, null=True)
+    # Cantidad de entregas recibidas (una por cola suscrita)
+    fanout = models.PositiveIntegerField(default=0)
+    first_received_at = models.DateTimeField(auto_now_add=True)
+    last_received_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.key} ({self.fanout} entregas)'
+
+
 class Message(models.Model):
     message_id = models.CharField(max_length=255, unique=True)
     queue_name = models.CharField(max_length=255)
+    # Cuenta y región de la cola de origen (permite distinguir colas homónimas)
+    account_id = models.CharField(max_length=12, blank=True, null=True)
+    region = models.CharField(max_length=32, blank=True, null=True)
     topic_arn = models.CharField(max_length=512, blank=True, null=True)
     subject = models.CharField(max_length=255, blank=True, null=True)
+    # Si el cuerpo supera MONITOR_BLOB_THRESHOLD, body guarda solo un extracto
     body = models.TextField()
+    body_size = models.PositiveIntegerField(blank=True, null=True)
+    body_sha256 = models.CharField(max_length=64, blank=True, null=True)
+    body_blob = models.ForeignKey(
+        MessageBlob, blank=True, null=True, on_delete=models.PROTECT, related_name='messages'
+    )
     attributes = models.JSONField(blank=True, null=True)
+    # Resultado de decodificar el sobre (ver envelopes.py): tipo ('sns', 'eventbridge' o 'raw'),
+    # id asignado por SNS o EventBridge y contenido ya parseado si era JSON
+    envelope = models.CharField(max_length=20, blank=True, null=True)
+    envelope_id = models.CharField(max_length=255, blank=True, null=True)
+    payload = models.JSONField(blank=True, null=True)
+    # Entregas del mismo evento: solo la primera guarda el contenido completo y cuenta para el topic
+    event = models.ForeignKey(
+        MessageEvent, blank=True, null=True, on_delete=models.SET_NULL, related_name='deliveries'
+    )
+    duplicate = models.BooleanField(default=False)
     state = models.CharField(max_length=50, default='RECEIVED')
+    # Publicación en SNS (o envío a SQS si no vino de SNS); sirve para medir la demora
+    published_at = models.DateTimeField(blank=True, null=True)
     received_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Listados por cola y por topic ordenados por fecha (el id desempata el orden)
+            models.Index(fields=['queue_name', '-received_at', '-id'], name='message_queue_recent_idx'),
+            models.Index(
+                fields=['topic_arn', '-received_at', '-id'],
+                name='message_topic_recent_idx',
+                condition=models.Q(topic_arn__isnull=False, duplicate=False),
+            ),
+            # Filtro por estado del admin
+            models.Index(fields=['state', '-received_at'], name='message_state_recent_idx'),
+        ]
+
     def __str__(self):
         return f'{self.queue_name} - {self.message_id}'
+
+    @cached_property
+    def full_body(self):
+        """Cuerpo completo, descomprimiendo el blob si el mensaje fue desplazado"""
+        if self.body_blob_id:
+            return self.body_blob.text()
+        if self.duplicate and self.event_id:
+            # Las copias de un evento guardan solo un extracto; el contenido está en la primera entrega
+            primary = Message.objects.filter(event_id=self.event_id, duplicate=False).only('body').first()
+            if primary:
+                return primary.body
+        return self.body
+
+
+class MessagePartition(models.Model):
+    """Período de mensajes sellado en su propia tabla (ver partitions.py)"""
+    table_name = models.CharField(max_length=100, unique=True)
+    period_start = models.DateTimeField(unique=True)
+    period_end = models.DateTimeField()
+    # Rango de ids, para encontrar un mensaje por pk sin recorrer todas las particiones
+    min_id = models.BigIntegerField(blank=True, null=True)
+    max_id = models.BigIntegerField(blank=True, null=True)
+    rows = models.BigIntegerField(default=0)
+    # Columnas de la tabla al crearla: las migraciones posteriores de Message no la modifican
+    columns = models.JSONField(default=list)
+    # Mensajes por cola y por topic, para descontarlos de MessageCounter al borrar la partición
+    counts = models.JSONField(default=dict)
+    sealed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.table_name} ({self.rows} mensajes)'
+
+
+class MessageCounter(models.Model):
+    """Cantidad de mensajes guardados por cola o por topic, mantenida al ingerir"""
+    QUEUE = 'queue'
+    TOPIC = 'topic'
+    KIND_CHOICES = [(QUEUE, 'Cola'), (TOPIC, 'Topic')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Las colas homónimas de otras cuentas o regiones se cuentan aparte; en los topics el ARN ya las distingue
+    account_id = models.CharField(max_length=12, blank=True, default='')
+    region = models.CharField(max_length=32, blank=True, default='')
+    name = models.CharField(max_length=512)
+    count = models.BigIntegerField(default=0)
+    last_received_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'account_id', 'region', 'name'], name='unique_counter_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.name}: {self.count}'
+
+
+class MessageRollup(models.Model):
+    """Cantidad de mensajes y demora de entrega agregadas por intervalo, cola o topic"""
+    MINUTE = '1m'
+    HOUR = '1h'
+    DAY = '1d'
+    RESOLUTION_CHOICES = [(MINUTE, 'Minuto'), (HOUR, 'Hora'), (DAY, 'Día')]
+
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    kind = models.CharField(max_length=10, choices=MessageCounter.KIND_CHOICES)
+    # Misma clave que los contadores: cuenta y región separan las colas homónimas
+    account_id = models.CharField(max_length=12, blank=True, default='')
+    region = models.CharField(max_length=32, blank=True, default='')
+    name = models.CharField(max_length=512)
+    bucket_start = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+    # Estadísticas de demora (segundos entre published_at y received_at)
+    lag_count = models.BigIntegerField(default=0)
+    lag_sum = models.FloatField(default=0)
+    lag_max = models.FloatField(default=0)
+    lag_histogram = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'kind', 'account_id', 'region', 'name', 'bucket_start'],
+                name='unique_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start'], name='rollup_resolution_start_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.resolution} {self.kind} {self.name} {self.bucket_start}: {self.count}'
+
+
+class QueueMetricSample(models.Model):
+    """Muestra del backlog real de una cola en SQS (atributos aproximados de la cola)"""
+    account_id = models.CharField(max_length=12, blank=True, default='')
+    region = models.CharField(max_length=32, blank=True, default='')
+    queue_name = models.CharField(max_length=255)
+    sampled_at = models.DateTimeField()
+    visible = models.BigIntegerField(default=0)
+    not_visible = models.BigIntegerField(default=0)
+    delayed = models.BigIntegerField(default=0)
+    oldest_age_seconds = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue_name', '-sampled_at'], name='queue_metric_recent_idx'),
+            models.Index(fields=['sampled_at'], name='queue_metric_sampled_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.queue_name} {self.sampled_at}: {self.visible}'
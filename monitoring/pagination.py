@@ -0,0 +1,50 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+
+def encode_cursor(message):
+    """Codifica la posición (received_at, id) de un mensaje para la URL"""
+    raw = f'{message.received_at.isoformat()}|{message.pk}'
+    return urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Devuelve (received_at, id) o None si el cursor no es válido"""
+    try:
+        received_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(received_at), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+def get_page_size(request):
+    """Tamaño de página pedido en ?page_size=, acotado por MONITOR_MAX_PAGE_SIZE"""
+    try:
+        page_size = int(request.GET.get('page_size', settings.MONITOR_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.MONITOR_PAGE_SIZE
+    return max(1, min(page_size, settings.MONITOR_MAX_PAGE_SIZE))
+
+def keyset_page(queryset, cursor=None, page_size=None, older=None):
+    """Pagina por (received_at, id) descendente sin OFFSET ni COUNT; older completa desde las particiones"""
+    page_size = page_size or settings.MONITOR_PAGE_SIZE
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        received_at, pk = position
+        queryset = queryset.filter(Q(received_at__lt=received_at) | Q(received_at=received_at, id__lt=pk))
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = list(queryset.order_by('-received_at', '-id')[:page_size + 1])
+    if older and len(rows) <= page_size:
+        # Las filas anteriores a la tabla principal están en las particiones selladas
+        last = (rows[-1].received_at, rows[-1].pk) if rows else position
+        rows += older(last, page_size + 1 - len(rows))
+    items = rows[:page_size]
+    return {
+        'items': items,
+        'page_size': page_size,
+        'is_first': position is None,
+        'next_cursor': encode_cursor(items[-1]) if len(rows) > page_size else None,
+    }
+
+def paginate_messages(request, queryset, older=None):
+    """Aplica la paginación por cursor a partir de los parámetros de la request"""
+    return keyset_page(queryset, cursor=request.GET.get('cursor'), page_size=get_page_size(request), older=older)
@@ -0,0 +1,333 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, prefetch_related_objects
+from django.utils import timezone
+from .counters import decrement_counters, partition_queue_counts
+from .models import Message, MessagePartition
+from .search import FTS_TABLE, PG_VECTOR
+
+# Particiones por tiempo de la tabla de mensajes. La tabla principal guarda el período en curso;
+# cada período terminado se sella en su propia tabla (monitoring_message_d20240101 por día,
+# _w por semana) y se anota en MessagePartition. En PostgreSQL esas tablas son particiones
+# nativas (PARTITION BY RANGE) de monitoring_message_archive. Los listados, el detalle y la
+# búsqueda consultan solo las particiones que se cruzan con su ventana, y la retención borra
+# períodos enteros con un DROP TABLE en vez de borrar fila por fila.
+
+PERIODS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+ARCHIVE_TABLE = f'{Message._meta.db_table}_archive'
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+def _period():
+    period = settings.MONITOR_PARTITION_PERIOD
+    if period not in PERIODS:
+        raise ValueError(f"MONITOR_PARTITION_PERIOD debe ser '', 'day' o 'week', no {period!r}")
+    return period
+
+def period_bounds(moment, period=None):
+    """Inicio y fin (UTC) del período que contiene moment; las semanas empiezan el lunes"""
+    period = period or _period()
+    start = moment.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        start -= timedelta(days=start.weekday())
+    return start, start + PERIODS[period]
+
+def partition_table(start, period=None):
+    return f'{Message._meta.db_table}_{(period or _period())[0]}{start:%Y%m%d}'
+
+def _adapt(moment):
+    return connection.ops.adapt_datetimefield_value(moment)
+
+def _column(name):
+    return Message._meta.get_field(name).column
+
+def _table_columns(table):
+    with connection.cursor() as cursor:
+        return [column.name for column in connection.introspection.get_table_description(cursor, table)]
+
+def _create_archive_table(cursor):
+    # Tabla padre con particionado declarativo; las particiones se le agregan al sellar
+    live = _quote(Message._meta.db_table)
+    archive = _quote(ARCHIVE_TABLE)
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {archive} (LIKE {live} INCLUDING DEFAULTS) PARTITION BY RANGE (received_at)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {_quote(ARCHIVE_TABLE + "_id")} ON {archive} (id)')
+    for name, columns in (('queue', 'queue_name'), ('topic', 'topic_arn')):
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {_quote(f"{ARCHIVE_TABLE}_{name}")} ON {archive} '
+            f'({columns}, received_at DESC, id DESC)'
+        )
+    for column in ('event_id', 'body_blob_id'):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {_quote(f"{ARCHIVE_TABLE}_{column}")} ON {archive} ({column})')
+    cursor.execute(
+        f'CREATE INDEX IF NOT EXISTS {_quote(ARCHIVE_TABLE + "_search")} ON {archive} '
+        f'USING gin ({PG_VECTOR.replace("m.", "")})'
+    )
+
+def _create_partition(start, end, table):
+    """Crea la tabla de un período y la registra"""
+    live = _quote(Message._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            _create_archive_table(cursor)
+            cursor.execute(
+                f'CREATE TABLE {_quote(table)} PARTITION OF {_quote(ARCHIVE_TABLE)} FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        else:
+            # Mismas columnas que la tabla principal, sin restricciones: los datos ya fueron validados
+            cursor.execute(f'CREATE TABLE {_quote(table)} AS SELECT * FROM {live} WHERE 0')
+            cursor.execute(f'CREATE UNIQUE INDEX {_quote(table + "_id")} ON {_quote(table)} (id)')
+            for name, columns in (('queue', 'queue_name'), ('topic', 'topic_arn')):
+                cursor.execute(
+                    f'CREATE INDEX {_quote(f"{table}_{name}")} ON {_quote(table)} ({columns}, received_at, id)'
+                )
+            for column in ('event_id', 'body_blob_id'):
+                cursor.execute(f'CREATE INDEX {_quote(f"{table}_{column}")} ON {_quote(table)} ({column})')
+    return MessagePartition.objects.create(
+        table_name=table, period_start=start, period_end=end, columns=_table_columns(table),
+    )
+
+def _refresh_stats(partition):
+    """Recalcula rango de ids, filas y conteos por cola y topic de una partición"""
+    table = _quote(partition.table_name)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(id), max(id), count(*) FROM {table}')
+        partition.min_id, partition.max_id, partition.rows = cursor.fetchone()
+        # Por cola: [cuenta, región, nombre, cantidad] (JSON no admite tuplas como claves)
+        cursor.execute(
+            f'SELECT account_id, region, queue_name, count(*) FROM {table} GROUP BY account_id, region, queue_name'
+        )
+        queues = [list(row) for row in cursor.fetchall()]
+        cursor.execute(
+            f'SELECT topic_arn, count(*) FROM {table} WHERE topic_arn IS NOT NULL AND duplicate = %s GROUP BY topic_arn',
+            [False],
+        )
+        topics = dict(cursor.fetchall())
+    partition.counts = {'queues': queues, 'topics': topics}
+    partition.save()
+
+def seal_partitions(now=None, chunk_size=None):
+    """Mueve los períodos terminados de la tabla principal a sus particiones; devuelve filas por tabla"""
+    if not settings.MONITOR_PARTITION_PERIOD:
+        return {}
+    chunk_size = chunk_size or settings.MONITOR_RETENTION_CHUNK_SIZE
+    now = now or timezone.now()
+    # Se espera un margen tras el fin del período por si llegan filas con el reloj atrasado
+    limit, _ = period_bounds(now - timedelta(seconds=settings.MONITOR_PARTITION_SEAL_AFTER))
+    live = _quote(Message._meta.db_table)
+    partitions = {partition.period_start: partition for partition in MessagePartition.objects.all()}
+    moved = {}
+    last_id = 0
+    while True:
+        # Los ids crecen con received_at: se recorre por rangos de pk sin necesitar un índice por fecha
+        first_id = Message.objects.filter(id__gt=last_id).aggregate(first=Min('id'))['first']
+        if first_id is None:
+            break
+        last_id = first_id + chunk_size - 1
+        window = Message.objects.filter(id__range=(first_id, last_id), received_at__lt=limit)
+        moment = window.aggregate(oldest=Min('received_at'))['oldest']
+        if moment is None:
+            break
+        # Copia y borrado por conjuntos en la misma transacción corta: una caída no deja filas en los dos lados
+        with transaction.atomic(), connection.cursor() as cursor:
+            while moment is not None:
+                start, end = period_bounds(moment)
+                partition = partitions.get(start)
+                if partition is None:
+                    partition = partitions[start] = _create_partition(start, end, partition_table(start))
+                columns = ', '.join(_quote(column) for column in partition.columns)
+                cursor.execute(
+                    f'INSERT INTO {_quote(partition.table_name)} ({columns}) SELECT {columns} FROM {live} '
+                    f'WHERE id BETWEEN %s AND %s AND received_at >= %s AND received_at < %s',
+                    [first_id, last_id, _adapt(start), _adapt(end)],
+                )
+                moved[partition.table_name] = moved.get(partition.table_name, 0) + cursor.rowcount
+                # Siguiente período con filas en la ventana; los días sin mensajes no crean tablas vacías
+                moment = window.filter(received_at__gte=end).aggregate(oldest=Min('received_at'))['oldest']
+            cursor.execute(
+                f'DELETE FROM {live} WHERE id BETWEEN %s AND %s AND received_at < %s', [first_id, last_id, _adapt(limit)],
+            )
+    for partition in partitions.values():
+        if partition.table_name in moved:
+            _refresh_stats(partition)
+    return moved
+
+def _partition_rows(partition, fields, chunk_size):
+    """Filas de una partición como diccionarios (para archivarlas antes de borrarla)"""
+    last_id = 0
+    while True:
+        rows = _query(partition, fields, {}, after_id=last_id, limit=chunk_size, ascending=True)
+        if not rows:
+            return
+        last_id = rows[-1].pk
+        yield [
+            {field: getattr(row, _column(field) if field in ('body_blob', 'event') else field, None) for field in fields}
+            for row in rows
+        ]
+
+def _delete_search_rows(cursor, partition):
+    """Quita del índice FTS5 (que no se particiona) las filas del rango de ids de la partición"""
+    bounds = [partition.min_id, partition.max_id]
+    # Filas con el reloj atrasado pueden tener ids dentro del rango y vivir en otra tabla: se conservan
+    others = [Message._meta.db_table, *MessagePartition.objects.filter(
+        min_id__lte=partition.max_id, max_id__gte=partition.min_id,
+    ).exclude(pk=partition.pk).values_list('table_name', flat=True)]
+    keep = ' UNION ALL '.join(f'SELECT id FROM {_quote(table)} WHERE id BETWEEN %s AND %s' for table in others)
+    cursor.execute(
+        f'DELETE FROM {FTS_TABLE} WHERE rowid BETWEEN %s AND %s AND rowid NOT IN ({keep})',
+        bounds * (len(others) + 1),
+    )
+
+def drop_partition(partition, archive=None, archive_fields=None, chunk_size=None):
+    """Borra un período entero; el costo no depende de la cantidad de filas (salvo si se archiva)"""
+    table = _quote(partition.table_name)
+    if archive:
+        for rows in _partition_rows(partition, archive_fields, chunk_size or settings.MONITOR_RETENTION_CHUNK_SIZE):
+            archive.write(rows)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite' and partition.rows:
+                _delete_search_rows(cursor, partition)
+            cursor.execute(f'DROP TABLE {table}')
+        counts = partition.counts or {}
+        decrement_counters(partition_queue_counts(counts), counts.get('topics', {}))
+        partition.delete()
+    return partition.rows
+
+def drop_expired_partitions(now=None, archive=None, archive_fields=None, chunk_size=None):
+    """Borra las particiones cuyo período terminó hace más de MONITOR_PARTITION_RETENTION_DAYS"""
+    days = settings.MONITOR_PARTITION_RETENTION_DAYS
+    if not days:
+        return {}
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return {
+        partition.table_name: drop_partition(partition, archive, archive_fields, chunk_size)
+        for partition in MessagePartition.objects.filter(period_end__lte=cutoff).order_by('period_start')
+    }
+
+# Consultas sobre las particiones
+
+def overlapping(since=None, until=None):
+    """Particiones que se cruzan con la ventana [since, until), de la más nueva a la más vieja"""
+    partitions = MessagePartition.objects.order_by('-period_start')
+    if since:
+        partitions = partitions.filter(period_end__gt=since)
+    if until:
+        partitions = partitions.filter(period_start__lt=until)
+    return list(partitions)
+
+def _query(partition, fields, filters, before=None, after_id=None, limit=None, ascending=False):
+    """Mensajes de una partición como instancias de Message (RawQuerySet), con filtros por igualdad"""
+    available = set(partition.columns)
+    columns = ['id', *(_column(field) for field in fields if field != 'id')]
+    select = ', '.join(_quote(column) for column in columns if column in available)
+    clauses, params = [], []
+    for field, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f'{_quote(_column(field))} IN ({", ".join(["%s"] * len(value))})')
+            params.extend(value)
+        else:
+            clauses.append(f'{_quote(_column(field))} = %s')
+            params.append(value)
+    if before:
+        received_at = _adapt(before[0])
+        clauses.append('(received_at < %s OR (received_at = %s AND id < %s))')
+        params.extend([received_at, received_at, before[1]])
+    if after_id is not None:
+        clauses.append('id > %s')
+        params.append(after_id)
+    where = f' WHERE {" AND ".join(clauses)}' if clauses else ''
+    order = 'received_at, id' if ascending else 'received_at DESC, id DESC'
+    sql = f'SELECT {select} FROM {_quote(partition.table_name)}{where} ORDER BY {order}'
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    rows = list(Message.objects.raw(sql, params))
+    for row in rows:
+        row.partition = partition.table_name
+    return rows
+
+def older_messages(filters, fields, related=()):
+    """Función para keyset_page que completa la página con filas de las particiones"""
+    def fetch(before, limit):
+        rows = []
+        partitions = MessagePartition.objects.order_by('-period_start')
+        if before:
+            partitions = partitions.filter(period_start__lte=before[0])
+        for partition in partitions:
+            rows += _query(partition, fields, filters, before=before, limit=limit - len(rows))
+            if len(rows) >= limit:
+                break
+        if related:
+            prefetch_related_objects(rows, *related)
+        return rows
+    return fetch
+
+def _containing(ids):
+    ids = list(ids)
+    if not ids:
+        return []
+    return list(
+        MessagePartition.objects.filter(min_id__lte=max(ids), max_id__gte=min(ids)).order_by('-period_start')
+    )
+
+def get_messages(ids, fields):
+    """Mensajes sellados por pk, buscando solo en las particiones cuyo rango de ids los incluye"""
+    found = {}
+    missing = set(ids)
+    for partition in _containing(missing):
+        for row in _query(partition, fields, {'id': sorted(missing)}):
+            found[row.pk] = row
+        missing -= set(found)
+        if not missing:
+            break
+    return found
+
+def get_message(pk):
+    """Mensaje sellado completo (para el detalle), o None si no está en ninguna partición"""
+    fields = [field.name for field in Message._meta.concrete_fields]
+    message = get_messages([pk], fields).get(pk)
+    if message is None:
+        return None
+    prefetch_related_objects([message], 'body_blob', 'event')
+    if message.duplicate and message.event_id and not message.body_blob_id:
+        # El contenido completo de una copia está en la primera entrega, sellada en la misma partición
+        partition = MessagePartition.objects.get(table_name=message.partition)
+        fields = ('body', 'body_blob', 'event', 'duplicate')
+        primary = _query(partition, fields, {'event': message.event_id, 'duplicate': False}, limit=1)
+        if primary:
+            message.full_body = primary[0].full_body
+    return message
+
+def event_deliveries(message, fields, limit):
+    """Entregas del evento de un mensaje sellado, en orden de llegada"""
+    partition = MessagePartition.objects.get(table_name=message.partition)
+    return list(reversed(_query(partition, fields, {'event': message.event_id}, limit=limit)))
+
+def referenced_ids(field, ids):
+    """Ids de blobs o eventos (según field) que todavía usan las filas selladas"""
+    column = _column(field)
+    referenced = set()
+    if not ids:
+        return referenced
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        for table in MessagePartition.objects.values_list('table_name', flat=True):
+            cursor.execute(f'SELECT DISTINCT {column} FROM {_quote(table)} WHERE {column} IN ({placeholders})', list(ids))
+            referenced.update(row[0] for row in cursor.fetchall())
+    return referenced
+
+def source_sql(columns, since=None, until=None):
+    """Tabla (o UNION ALL de tablas) a consultar para una ventana de tiempo, con las columnas pedidas"""
+    live = Message._meta.db_table
+    partitions = overlapping(since, until)
+    if not partitions:
+        return _quote(live)
+    selects = [f'SELECT {", ".join(_quote(column) for column in columns)} FROM {_quote(live)}']
+    for partition in partitions:
+        available = set(partition.columns)
+        select = ', '.join(_quote(column) if column in available else f'NULL AS {_quote(column)}' for column in columns)
+        selects.append(f'SELECT {select} FROM {_quote(partition.table_name)}')
+    return f'({" UNION ALL ".join(selects)})'
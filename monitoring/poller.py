@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from .aws_service import get_queue_client, ingest_messages, is_peek_queue, receive_messages
+import logging
+
+logger = logging.getLogger(__name__)
+
+def poll_queues(queue_urls, max_messages=10, wait_time=1, max_workers=None, clients=None):
+    """Hace long polling de varias colas en paralelo y guarda los lotes desde un único escritor"""
+    queue_urls = list(queue_urls)
+    if not queue_urls:
+        return {}
+    max_workers = max_workers or settings.SQS_POLL_CONCURRENCY
+    # Los clientes de boto3 son thread-safe: uno por región (y por cuenta) sirve a todos los hilos
+    clients = {url: (clients or {}).get(url) or get_queue_client(url) for url in queue_urls}
+    results = {}
+    peek = {url: is_peek_queue(url) for url in queue_urls}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queue_urls))) as executor:
+        futures = {
+            executor.submit(
+                receive_messages, url, max_messages, wait_time, clients[url],
+                settings.MONITOR_PEEK_VISIBILITY_TIMEOUT if peek[url] else None,
+            ): url
+            for url in queue_urls
+        }
+        # Los hilos solo reciben; la escritura en la base se serializa en este hilo
+        # para no provocar "database is locked" en SQLite
+        for future in as_completed(futures):
+            queue_url = futures[future]
+            try:
+                messages = future.result()
+            except (BotoCoreError, ClientError) as exc:
+                logger.warning('Error recibiendo mensajes de %s: %s', queue_url, exc)
+                results[queue_url] = {'received': 0, 'created': 0, 'duplicates': 0, 'failed': [], 'error': str(exc)}
+                continue
+            try:
+                results[queue_url] = ingest_messages(
+                    queue_url, messages, client=clients[queue_url], peek=peek[queue_url],
+                )
+            except Exception as exc:
+                # Sin confirmar en SQS: el lote vuelve a estar visible y las demás colas se guardan igual
+                logger.exception('Error guardando %d mensajes de %s', len(messages), queue_url)
+                results[queue_url] = {
+                    'received': len(messages), 'created': 0, 'duplicates': 0, 'failed': [], 'error': str(exc),
+                }
+    return results
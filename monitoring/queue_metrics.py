@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .aws_clients import get_client
+from .aws_service import queue_key_from_url, region_from_queue_url
+from .collector import get_target_queues, target_client
+from .models import QueueMetricSample
+from .refresh import trigger_refresh
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'queue-metrics'
+
+# Atributos de backlog que devuelve GetQueueAttributes
+ATTRIBUTES = {
+    'ApproximateNumberOfMessages': 'visible',
+    'ApproximateNumberOfMessagesNotVisible': 'not_visible',
+    'ApproximateNumberOfMessagesDelayed': 'delayed',
+}
+
+# GetMetricData acepta hasta 500 consultas por llamada
+CLOUDWATCH_BATCH_SIZE = 500
+
+def _client(service_name, queue_url, queue_targets):
+    """Cliente de la región de la cola; las de MONITOR_TARGETS usan el rol de su destino"""
+    region = region_from_queue_url(queue_url)
+    if queue_url in queue_targets:
+        return target_client(settings.MONITOR_TARGETS[queue_targets[queue_url]], region, service_name)
+    return get_client(service_name, region)
+
+def _queue_attributes(queue_url, client):
+    response = client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=list(ATTRIBUTES))
+    attributes = response.get('Attributes', {})
+    return {field: int(attributes.get(name, 0)) for name, field in ATTRIBUTES.items()}
+
+def fetch_queue_attributes(queue_urls, queue_targets=None):
+    """Consulta los atributos de backlog de todas las colas en paralelo; devuelve clave de cola -> valores"""
+    queue_targets = queue_targets or {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.SQS_POLL_CONCURRENCY, len(queue_urls)))) as executor:
+        futures = {
+            url: executor.submit(_queue_attributes, url, _client('sqs', url, queue_targets)) for url in queue_urls
+        }
+        for url, future in futures.items():
+            try:
+                results[queue_key_from_url(url)] = future.result()
+            except (BotoCoreError, ClientError) as exc:
+                logger.warning('No se pudieron leer los atributos de %s: %s', url, exc)
+    return results
+
+def fetch_oldest_ages(queue_urls, queue_targets=None):
+    """Edad del mensaje más viejo de cada cola, con una llamada a CloudWatch cada 500 colas por cuenta y región"""
+    queue_targets = queue_targets or {}
+    # La dimensión QueueName solo es única dentro de una cuenta y una región: cada grupo se
+    # consulta con las credenciales de su destino y en su región
+    groups = {}
+    for url in queue_urls:
+        groups.setdefault((queue_targets.get(url), region_from_queue_url(url)), []).append(url)
+    ages = {}
+    for urls in groups.values():
+        client = _client('cloudwatch', urls[0], queue_targets)
+        ages.update(_fetch_region_ages(client, [queue_key_from_url(url) for url in urls]))
+    return ages
+
+def _fetch_region_ages(client, keys):
+    now = timezone.now()
+    ages = {}
+    for start in range(0, len(keys), CLOUDWATCH_BATCH_SIZE):
+        chunk = keys[start:start + CLOUDWATCH_BATCH_SIZE]
+        queries = [
+            {
+                'Id': f'q{index}',
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/SQS',
+                        'MetricName': 'ApproximateAgeOfOldestMessage',
+                        'Dimensions': [{'Name': 'QueueName', 'Value': key[-1]}],
+                    },
+                    'Period': 60,
+                    'Stat': 'Maximum',
+                },
+            }
+            for index, key in enumerate(chunk)
+        ]
+        try:
+            paginator = client.get_paginator('get_metric_data')
+            pages = paginator.paginate(
+                MetricDataQueries=queries,
+                StartTime=now - timedelta(minutes=10),
+                EndTime=now,
+                ScanBy='TimestampDescending',
+            )
+            for page in pages:
+                for result in page.get('MetricDataResults', []):
+                    key = chunk[int(result['Id'][1:])]
+                    # Con ScanBy descendente el primer valor es el más reciente
+                    if result.get('Values') and key not in ages:
+                        ages[key] = result['Values'][0]
+        except (BotoCoreError, ClientError) as exc:
+            logger.warning('No se pudo consultar ApproximateAgeOfOldestMessage: %s', exc)
+    return ages
+
+def collect_queue_metrics(queue_urls):
+    """Toma una muestra del backlog de todas las colas, la guarda y la deja en la caché"""
+    queue_urls = list(queue_urls)
+    queue_targets = get_target_queues()
+    metrics = fetch_queue_attributes(queue_urls, queue_targets)
+    ages = fetch_oldest_ages(queue_urls, queue_targets) if metrics else {}
+    sampled_at = timezone.now()
+    for key, values in metrics.items():
+        values['oldest_age_seconds'] = ages.get(key)
+    QueueMetricSample.objects.bulk_create([
+        QueueMetricSample(account_id=account_id, region=region, queue_name=name, sampled_at=sampled_at, **values)
+        for (account_id, region, name), values in metrics.items()
+    ])
+    snapshot = {'collected_at': sampled_at, 'queues': metrics}
+    cache.set(CACHE_KEY, snapshot, timeout=None)
+    return snapshot
+
+def get_queue_metrics(queue_urls):
+    """Devuelve la última muestra cacheada; si venció, la renueva en segundo plano"""
+    snapshot = cache.get(CACHE_KEY)
+    ttl = timedelta(seconds=settings.MONITOR_QUEUE_METRICS_TTL)
+    stale = snapshot is None or timezone.now() - snapshot['collected_at'] > ttl
+    if queue_urls and stale:
+        # Muchos visitantes a la vez disparan una sola consulta a AWS
+        trigger_refresh(CACHE_KEY, collect_queue_metrics, list(queue_urls))
+    return snapshot or {'collected_at': None, 'queues': {}}
+
+def get_trends(keys, minutes=None):
+    """Variación de mensajes visibles respecto de la muestra más vieja dentro de la ventana, por clave de cola"""
+    keys = set(keys)
+    minutes = minutes or settings.MONITOR_QUEUE_METRICS_TREND_MINUTES
+    since = timezone.now() - timedelta(minutes=minutes)
+    samples = (
+        QueueMetricSample.objects.filter(queue_name__in=[key[-1] for key in keys], sampled_at__gte=since)
+        .order_by('queue_name', 'account_id', 'region', 'sampled_at')
+        .values_list('account_id', 'region', 'queue_name', 'visible')
+    )
+    history = {}
+    for account_id, region, name, visible in samples:
+        if (account_id, region, name) in keys:
+            history.setdefault((account_id, region, name), []).append(visible)
+    return {
+        key: {'delta': values[-1] - values[0], 'history': values}
+        for key, values in history.items()
+    }
+
+def prune_samples(now=None):
+    """Borra las muestras más viejas que MONITOR_QUEUE_METRICS_RETENTION_DAYS"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.MONITOR_QUEUE_METRICS_RETENTION_DAYS)
+    return QueueMetricSample.objects.filter(sampled_at__lt=cutoff).delete()[0]
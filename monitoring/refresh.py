@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from .aws_service import fetch_all_messages
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Nombre de la actualización que recorre todas las colas
+ALL_QUEUES = 'all'
+
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+def _running_key(name):
+    return f'refresh:{name}:running'
+
+def _status_key(name):
+    return f'refresh:{name}:status'
+
+def _run(name, func, args, kwargs):
+    started_at = timezone.now()
+    error = None
+    try:
+        func(*args, **kwargs)
+    except Exception as exc:
+        logger.exception('Falló la actualización %s', name)
+        error = str(exc)
+    finally:
+        cache.set(_status_key(name), {
+            'started_at': started_at,
+            'finished_at': timezone.now(),
+            'error': error,
+        }, timeout=None)
+        cache.delete(_running_key(name))
+        # El hilo no pasa por el ciclo de request: cerrar su conexión a mano
+        close_old_connections()
+
+def trigger_refresh(name, func, *args, **kwargs):
+    """Lanza func en segundo plano; si ya hay una actualización con ese nombre no hace nada"""
+    # cache.add es atómico: solo la primera solicitud toma el lock, las demás se agrupan con ella
+    if not cache.add(_running_key(name), True, timeout=settings.MONITOR_REFRESH_TIMEOUT):
+        return False
+    thread = threading.Thread(
+        target=_run, args=(name, func, args, kwargs), name=f'refresh-{name}', daemon=True
+    )
+    thread.start()
+    return True
+
+def refresh_status(name):
+    """Devuelve cuándo terminó la última actualización y si hay una en curso"""
+    status = cache.get(_status_key(name)) or {'started_at': None, 'finished_at': None, 'error': None}
+    status['running'] = bool(cache.get(_running_key(name)))
+    return status
+
+def _scheduler_loop(interval):
+    while True:
+        trigger_refresh(ALL_QUEUES, fetch_all_messages)
+        time.sleep(interval)
+
+def ensure_scheduler():
+    """Arranca (una sola vez por proceso) la actualización periódica de todas las colas, si está configurada"""
+    global _scheduler
+    interval = settings.MONITOR_REFRESH_INTERVAL
+    if not interval or _scheduler is not None:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_scheduler_loop, args=(interval,), name='refresh-scheduler', daemon=True
+            )
+            _scheduler.start()
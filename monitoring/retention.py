@@ -0,0 +1,187 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from pathlib import Path
+from .counters import decrement_counters, queue_key, queue_lookup
+from .blobs import delete_orphan_blobs
+from .events import delete_orphan_events
+from .models import Message, MessageBlob, MessageCounter
+from .partitions import drop_expired_partitions, seal_partitions
+from .queue_metrics import prune_samples
+from .rollups import prune_rollups
+from .search import index_messages, unindex_messages
+import gzip
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columnas que se guardan en el archivo antes de borrar
+ARCHIVE_FIELDS = (
+    'id', 'message_id', 'queue_name', 'account_id', 'region', 'topic_arn', 'subject', 'body', 'body_blob',
+    'attributes', 'state', 'received_at', 'event', 'duplicate',
+)
+
+# Columnas mínimas para descontar contadores al borrar sin archivo
+PURGE_FIELDS = ('id', 'queue_name', 'account_id', 'region', 'topic_arn', 'event', 'duplicate')
+
+class Archive:
+    """Archivo JSONL comprimido con gzip donde se copian los mensajes antes de borrarlos"""
+
+    def __init__(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f'messages-{timezone.now():%Y%m%dT%H%M%S}.jsonl.gz'
+        self.rows = 0
+
+    def write(self, rows):
+        # Los cuerpos desplazados a MessageBlob se archivan completos
+        blob_ids = {row['body_blob'] for row in rows if row.get('body_blob')}
+        blobs = MessageBlob.objects.in_bulk(blob_ids) if blob_ids else {}
+        for row in rows:
+            blob_id = row.pop('body_blob', None)
+            if blob_id:
+                row['body'] = blobs[blob_id].text()
+        with gzip.open(self.path, 'at', encoding='utf-8') as archive:
+            for row in rows:
+                archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        self.rows += len(rows)
+
+def get_policy(kind, name):
+    """Política de retención de una cola o topic: {'max_age_days': ..., 'max_rows': ...}"""
+    retention = settings.MONITOR_RETENTION
+    overrides = retention.get('queues' if kind == MessageCounter.QUEUE else 'topics', {})
+    if name in overrides:
+        return {**retention.get('default', {}), **overrides[name]}
+    # La política por defecto se aplica a cada cola; los topics solo si se configuran
+    return retention.get('default', {}) if kind == MessageCounter.QUEUE else {}
+
+def expired_messages(queryset, policy, now=None):
+    """Filtra los mensajes que exceden la antigüedad o la cantidad de filas de la política"""
+    now = now or timezone.now()
+    condition = Q()
+    if policy.get('max_age_days'):
+        condition |= Q(received_at__lt=now - timedelta(days=policy['max_age_days']))
+    if policy.get('max_rows'):
+        # Primera fila que queda fuera del límite, en el orden de los listados
+        cutoff = (
+            queryset.order_by('-received_at', '-id')
+            .values_list('received_at', 'id')[policy['max_rows']:policy['max_rows'] + 1]
+        )
+        for received_at, pk in cutoff:
+            condition |= Q(received_at__lt=received_at) | Q(received_at=received_at, id__lte=pk)
+    if not condition:
+        return queryset.none()
+    return queryset.filter(condition)
+
+def promote_copies(rows, deleted_ids):
+    """Pasa el contenido de las primeras entregas que se borran a una copia que sobrevive; devuelve sus eventos"""
+    primaries = {row['event']: row['id'] for row in rows if row['event'] and not row['duplicate']}
+    if not primaries:
+        return set()
+    survivors = {}
+    copies = (
+        Message.objects.filter(event_id__in=list(primaries), duplicate=True)
+        .exclude(id__in=deleted_ids).order_by('id').values_list('event_id', 'id')
+    )
+    for event_id, pk in copies:
+        survivors.setdefault(event_id, pk)
+    if not survivors:
+        return set()
+    sources = Message.objects.select_related('body_blob').in_bulk([primaries[event_id] for event_id in survivors])
+    promoted = []
+    bodies = {}
+    for event_id, pk in survivors.items():
+        source = sources[primaries[event_id]]
+        Message.objects.filter(id=pk).update(
+            body=source.body, body_blob=source.body_blob_id, payload=source.payload, duplicate=False,
+        )
+        promoted.append(pk)
+        bodies[pk] = source.full_body
+    # La copia promovida pasa a ser la fila del evento en la búsqueda
+    promoted_rows = list(Message.objects.filter(id__in=promoted))
+    index_messages(promoted_rows, {row.message_id: bodies[row.pk] for row in promoted_rows})
+    return set(survivors)
+
+def purge_queryset(queryset, archive=None, chunk_size=None):
+    """Borra los mensajes del queryset en lotes cortos, cada uno en su propia transacción"""
+    chunk_size = chunk_size or settings.MONITOR_RETENTION_CHUNK_SIZE
+    deleted = 0
+    while True:
+        fields = ARCHIVE_FIELDS if archive else PURGE_FIELDS
+        rows = list(queryset.order_by('id').values(*fields)[:chunk_size])
+        if not rows:
+            return deleted
+        # Transacciones chicas: el lock de escritura de SQLite se libera entre lotes
+        with transaction.atomic():
+            if archive:
+                archive.write(rows)
+            ids = [row['id'] for row in rows]
+            # Si quedan copias del evento, una de ellas conserva el contenido y sigue contando para el topic
+            promoted = promote_copies(rows, ids)
+            Message.objects.filter(id__in=ids).delete()
+            unindex_messages(ids)
+            decrement_counters(
+                Counter(queue_key(row['account_id'], row['region'], row['queue_name']) for row in rows),
+                Counter(
+                    row['topic_arn'] for row in rows
+                    if row['topic_arn'] and not row['duplicate'] and row['event'] not in promoted
+                ),
+            )
+        deleted += len(rows)
+
+def compact_database(vacuum=False):
+    """Devuelve al sistema el espacio liberado por los borrados"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            if vacuum:
+                cursor.execute('VACUUM')
+            cursor.execute('PRAGMA optimize')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'VACUUM ANALYZE {Message._meta.db_table}')
+
+def run_retention(archive_dir=None, vacuum=None, chunk_size=None):
+    """Aplica las políticas de retención de todas las colas y topics; devuelve lo borrado por cada una"""
+    archive_dir = archive_dir if archive_dir is not None else settings.MONITOR_ARCHIVE_DIR
+    archive = Archive(archive_dir) if archive_dir else None
+    now = timezone.now()
+    summary = {}
+    # Los períodos terminados pasan a su partición y los vencidos se borran enteros
+    seal_partitions(now=now, chunk_size=chunk_size)
+    dropped = drop_expired_partitions(
+        now=now, archive=archive, archive_fields=ARCHIVE_FIELDS, chunk_size=chunk_size,
+    )
+    summary.update({f'partition:{table}': rows for table, rows in dropped.items()})
+    for kind in (MessageCounter.QUEUE, MessageCounter.TOPIC):
+        counters = MessageCounter.objects.filter(kind=kind).values_list('account_id', 'region', 'name')
+        for account_id, region, name in list(counters):
+            policy = get_policy(kind, name)
+            if not policy:
+                continue
+            # max_rows se aplica a cada cola por separado, aunque haya homónimas en otras cuentas o regiones
+            if kind == MessageCounter.QUEUE:
+                lookup = queue_lookup(queue_key(account_id, region, name))
+            else:
+                lookup = {'topic_arn': name}
+            expired = expired_messages(Message.objects.filter(**lookup), policy, now=now)
+            deleted = purge_queryset(expired, archive=archive, chunk_size=chunk_size)
+            if deleted:
+                label = f'{kind}:{name}'
+                summary[label] = summary.get(label, 0) + deleted
+    prune_rollups(now=now)
+    prune_samples(now=now)
+    if summary:
+        delete_orphan_blobs(chunk_size=chunk_size or settings.MONITOR_RETENTION_CHUNK_SIZE)
+    delete_orphan_events(chunk_size=chunk_size or settings.MONITOR_RETENTION_CHUNK_SIZE)
+    if vacuum is None:
+        vacuum = settings.MONITOR_VACUUM
+    if summary or vacuum:
+        compact_database(vacuum=vacuum)
+    if summary:
+        logger.info('Retención: %d mensajes eliminados', sum(summary.values()))
+    return summary
@@ -0,0 +1,146 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .counters import queue_key
+from .models import MessageCounter, MessageRollup
+
+# Límites superiores (en segundos) de los buckets del histograma de demora; el último es +inf
+LAG_BOUNDS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600]
+
+RESOLUTIONS = {
+    MessageRollup.MINUTE: timedelta(minutes=1),
+    MessageRollup.HOUR: timedelta(hours=1),
+    MessageRollup.DAY: timedelta(days=1),
+}
+
+def bucket_start(moment, resolution):
+    if resolution == MessageRollup.MINUTE:
+        return moment.replace(second=0, microsecond=0)
+    if resolution == MessageRollup.HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _empty_stats():
+    return {'count': 0, 'lag_count': 0, 'lag_sum': 0.0, 'lag_max': 0.0, 'lag_histogram': [0] * (len(LAG_BOUNDS) + 1)}
+
+def _merge_histograms(target, source):
+    for index, value in enumerate(source):
+        if index < len(target):
+            target[index] += value
+    return target
+
+def record_rollups(rows):
+    """Suma un lote de mensajes recién guardados a los buckets de 1m, 1h y 1d"""
+    buckets = defaultdict(_empty_stats)
+    for row in rows:
+        received_at = row.received_at or timezone.now()
+        lag = None
+        if row.published_at:
+            lag = max((received_at - row.published_at).total_seconds(), 0.0)
+        # Igual que los contadores: la cola se identifica por cuenta, región y nombre, y el topic
+        # (cuyo ARN ya los incluye) suma una vez por evento
+        topic_arn = None if getattr(row, 'duplicate', False) else row.topic_arn
+        keys = (
+            (MessageCounter.QUEUE, queue_key(row.account_id, row.region, row.queue_name)),
+            (MessageCounter.TOPIC, ('', '', topic_arn)),
+        )
+        for kind, key in keys:
+            if not key[-1]:
+                continue
+            for resolution in RESOLUTIONS:
+                stats = buckets[(resolution, kind, key, bucket_start(received_at, resolution))]
+                stats['count'] += 1
+                if lag is not None:
+                    stats['lag_count'] += 1
+                    stats['lag_sum'] += lag
+                    stats['lag_max'] = max(stats['lag_max'], lag)
+                    stats['lag_histogram'][bisect_left(LAG_BOUNDS, lag)] += 1
+    # Unas pocas filas por lote: cola y topic por cada resolución
+    for (resolution, kind, (account_id, region, name), start), stats in buckets.items():
+        rollup, _ = MessageRollup.objects.select_for_update().get_or_create(
+            resolution=resolution, kind=kind, account_id=account_id, region=region, name=name, bucket_start=start,
+            defaults={'lag_histogram': [0] * (len(LAG_BOUNDS) + 1)},
+        )
+        rollup.count += stats['count']
+        rollup.lag_count += stats['lag_count']
+        rollup.lag_sum += stats['lag_sum']
+        rollup.lag_max = max(rollup.lag_max, stats['lag_max'])
+        rollup.lag_histogram = _merge_histograms(list(rollup.lag_histogram), stats['lag_histogram'])
+        rollup.save()
+
+def prune_rollups(now=None):
+    """Borra los buckets finos viejos; su información queda en las resoluciones mayores"""
+    now = now or timezone.now()
+    deleted = 0
+    for resolution, days in settings.MONITOR_ROLLUP_RETENTION_DAYS.items():
+        if days:
+            deleted += MessageRollup.objects.filter(
+                resolution=resolution, bucket_start__lt=now - timedelta(days=days)
+            ).delete()[0]
+    return deleted
+
+def histogram_percentile(histogram, percentile):
+    """Aproxima un percentil con el límite superior del bucket que lo contiene (inf para el último)"""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * percentile / 100
+    cumulative = 0
+    for index, value in enumerate(histogram):
+        cumulative += value
+        if cumulative >= threshold:
+            return LAG_BOUNDS[index] if index < len(LAG_BOUNDS) else float('inf')
+    return None
+
+def pick_resolution(span):
+    """Resolución que da una cantidad razonable de puntos para el rango pedido"""
+    if span <= timedelta(hours=6):
+        return MessageRollup.MINUTE
+    if span <= timedelta(days=7):
+        return MessageRollup.HOUR
+    return MessageRollup.DAY
+
+def series(kind, name=None, span=timedelta(hours=24), now=None, account_id=None, region=None):
+    """Serie temporal lista para graficar; sin nombre (o sin cuenta y región) agrega todas las que coinciden"""
+    now = now or timezone.now()
+    resolution = pick_resolution(span)
+    rollups = MessageRollup.objects.filter(
+        resolution=resolution, kind=kind, bucket_start__gte=bucket_start(now - span, resolution)
+    )
+    if name:
+        rollups = rollups.filter(name=name)
+    if account_id:
+        rollups = rollups.filter(account_id=account_id)
+    if region:
+        rollups = rollups.filter(region=region)
+    merged = defaultdict(_empty_stats)
+    for rollup in rollups.order_by('bucket_start').iterator():
+        stats = merged[rollup.bucket_start]
+        stats['count'] += rollup.count
+        stats['lag_count'] += rollup.lag_count
+        stats['lag_sum'] += rollup.lag_sum
+        stats['lag_max'] = max(stats['lag_max'], rollup.lag_max)
+        _merge_histograms(stats['lag_histogram'], rollup.lag_histogram)
+    minutes = RESOLUTIONS[resolution].total_seconds() / 60
+    points = []
+    for start, stats in sorted(merged.items()):
+        def percentile(value):
+            # El límite del bucket nunca puede superar la demora máxima observada
+            bound = histogram_percentile(stats['lag_histogram'], value)
+            return round(min(bound, stats['lag_max']), 3) if bound is not None else None
+        points.append({
+            'start': start.isoformat(),
+            'count': stats['count'],
+            'per_minute': round(stats['count'] / minutes, 3),
+            'lag_avg': round(stats['lag_sum'] / stats['lag_count'], 3) if stats['lag_count'] else None,
+            'lag_p50': percentile(50),
+            'lag_p95': percentile(95),
+            'lag_p99': percentile(99),
+            'lag_max': round(stats['lag_max'], 3) if stats['lag_count'] else None,
+        })
+    return {
+        'kind': kind, 'name': name, 'account_id': account_id, 'region': region, 'resolution': resolution,
+        'points': points,
+    }
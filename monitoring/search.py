@@ -0,0 +1,146 @@
+from django.db import connection
+from django.db.models import Q
+from .models import Message
+import json
+
+# Tabla FTS5 (SQLite) con el texto indexado; su rowid es el id de Message
+FTS_TABLE = 'monitoring_message_fts'
+
+# Columnas que usan la búsqueda y sus filtros (también en las particiones selladas)
+SEARCH_COLUMNS = (
+    'id', 'subject', 'body', 'attributes', 'queue_name', 'topic_arn', 'state', 'account_id', 'region', 'received_at',
+    'event_id', 'duplicate',
+)
+
+# Filtros que también se cumplen si alguna copia del evento llegó a esa cola, cuenta o región
+DELIVERY_FILTERS = (('queue_name', 'queue'), ('account_id', 'account'), ('region', 'region'))
+
+# Expresión indexada con GIN en PostgreSQL (debe coincidir con la de la migración 0006)
+PG_VECTOR = (
+    "to_tsvector('simple', coalesce(m.subject, '') || ' ' || m.body || ' ' || coalesce(m.attributes::text, ''))"
+)
+
+def _attributes_text(attributes):
+    return json.dumps(attributes, ensure_ascii=False) if attributes else ''
+
+def index_messages(rows, bodies=None):
+    """Agrega al índice los mensajes recién guardados; bodies permite pasar el cuerpo completo"""
+    if connection.vendor != 'sqlite' or not rows:
+        # En PostgreSQL el índice GIN se mantiene solo
+        return
+    bodies = bodies or {}
+    documents = [
+        (row.pk, row.subject or '', bodies.get(row.message_id, row.body), _attributes_text(row.attributes))
+        for row in rows
+        if row.pk
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, subject, body, attributes) VALUES (%s, %s, %s, %s)',
+            documents,
+        )
+
+def unindex_messages(ids):
+    """Quita mensajes borrados del índice"""
+    if connection.vendor != 'sqlite' or not ids:
+        return
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(ids))
+
+def _fts_query(text):
+    """Convierte el texto del usuario en una consulta FTS5 segura (cada término entre comillas)"""
+    terms = []
+    for term in text.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms)
+
+def _filters_sql(filters, source):
+    # Se busca sobre una fila por evento (la primera entrega, que guarda el contenido completo)
+    clauses, params = ['m.duplicate = %s'], [False]
+    for column, lookup in (('topic_arn', 'topic'), ('state', 'state')):
+        if filters.get(lookup):
+            clauses.append(f'm.{column} = %s')
+            params.append(filters[lookup])
+    for column, lookup in DELIVERY_FILTERS:
+        if filters.get(lookup):
+            clauses.append(
+                f'(m.{column} = %s OR (m.event_id IS NOT NULL AND EXISTS '
+                f'(SELECT 1 FROM {source} d WHERE d.event_id = m.event_id AND d.{column} = %s)))'
+            )
+            params.extend([filters[lookup], filters[lookup]])
+    if filters.get('since'):
+        clauses.append('m.received_at >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(filters['since']))
+    if filters.get('until'):
+        clauses.append('m.received_at < %s')
+        params.append(connection.ops.adapt_datetimefield_value(filters['until']))
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+def _ranked_ids(text, filters, limit, offset):
+    """Devuelve [(id, extracto)] ordenados por relevancia"""
+    from .partitions import source_sql
+    # Tabla principal más las particiones que se cruzan con la ventana pedida
+    table = source_sql(SEARCH_COLUMNS, filters.get('since'), filters.get('until'))
+    where, params = _filters_sql(filters, table)
+    if connection.vendor == 'sqlite':
+        query = _fts_query(text)
+        if not query:
+            return []
+        sql = (
+            f"SELECT m.id, snippet({FTS_TABLE}, 1, '[', ']', '…', 16) FROM {FTS_TABLE} f "
+            f'JOIN {table} m ON m.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s{where} ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s'
+        )
+        params = [query, *params, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT m.id, ts_headline('simple', left(m.body, 10000), q, 'StartSel=[, StopSel=]') "
+            f"FROM {table} m, plainto_tsquery('simple', %s) q "
+            f'WHERE {PG_VECTOR} @@ q{where} ORDER BY ts_rank({PG_VECTOR}, q) DESC, m.id DESC LIMIT %s OFFSET %s'
+        )
+        params = [text, *params, limit, offset]
+    else:
+        # Otros motores: búsqueda por subcadena sin ranking
+        queryset = Message.objects.filter(Q(body__icontains=text) | Q(subject__icontains=text), duplicate=False)
+        for field, lookup in (('topic_arn', 'topic'), ('state', 'state')):
+            if filters.get(lookup):
+                queryset = queryset.filter(**{field: filters[lookup]})
+        for field, lookup in DELIVERY_FILTERS:
+            if filters.get(lookup):
+                queryset = queryset.filter(
+                    Q(**{field: filters[lookup]}) | Q(**{f'event__deliveries__{field}': filters[lookup]})
+                ).distinct()
+        if filters.get('since'):
+            queryset = queryset.filter(received_at__gte=filters['since'])
+        if filters.get('until'):
+            queryset = queryset.filter(received_at__lt=filters['until'])
+        ids = queryset.order_by('-received_at', '-id').values_list('id', flat=True)[offset:offset + limit]
+        return [(pk, '') for pk in ids]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+def search_messages(text, filters=None, page=1, page_size=50):
+    """Busca mensajes por texto y filtros; devuelve una página de resultados ordenados por relevancia"""
+    filters = filters or {}
+    offset = (page - 1) * page_size
+    ranked = _ranked_ids(text, filters, page_size + 1, offset)
+    has_next = len(ranked) > page_size
+    ranked = ranked[:page_size]
+    from .partitions import get_messages
+    fields = ('id', 'message_id', 'queue_name', 'account_id', 'region', 'topic_arn', 'subject', 'state', 'received_at')
+    messages = Message.objects.only(*fields).in_bulk([pk for pk, _ in ranked])
+    missing = [pk for pk, _ in ranked if pk not in messages]
+    if missing:
+        messages.update(get_messages(missing, fields))
+    results = []
+    for pk, snippet in ranked:
+        if pk in messages:
+            message = messages[pk]
+            message.snippet = snippet
+            results.append(message)
+    return {'results': results, 'page': page, 'page_size': page_size, 'has_next': has_next}
@@ -0,0 +1,259 @@
+from django.db import DatabaseError, transaction
+from pathlib import Path
+from . import metrics
+from .aws_service import store_messages
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Spool local de solo agregado entre la recepción y la base de datos. Los lotes recibidos se
+# escriben (con fsync) antes de confirmarlos en SQS; un escritor los pasa a la base en
+# transacciones grandes y avanza el checkpoint. Tras una caída se reprocesa desde el último
+# checkpoint: store_messages descarta lo que ya estaba guardado. Un mensaje que no se puede
+# guardar (ya se borró de SQS) se aparta a dead-letter.jsonl para no frenar al resto.
+
+# Cada registro: largo (4 bytes) + CRC32 (4 bytes) + JSON {"q": url, "m": [mensajes]}
+HEADER = struct.Struct('>II')
+SEGMENT_PREFIX = 'segment-'
+CHECKPOINT = 'checkpoint.json'
+DEAD_LETTER = 'dead-letter.jsonl'
+
+def _segment_name(seq):
+    return f'{SEGMENT_PREFIX}{seq:012d}.log'
+
+def _fsync_directory(directory):
+    # Hace durable la creación, el renombrado o el borrado de archivos (no existe en Windows)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _read_records(handle, start, end):
+    """Lee registros válidos entre start y end; devuelve [(offset_siguiente, registro)] y dónde frenó"""
+    records = []
+    offset = start
+    handle.seek(start)
+    while offset + HEADER.size <= end:
+        length, crc = HEADER.unpack(handle.read(HEADER.size))
+        if offset + HEADER.size + length > end:
+            break
+        data = handle.read(length)
+        if zlib.crc32(data) != crc:
+            break
+        offset += HEADER.size + length
+        records.append((offset, data))
+    return records, offset
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._checkpoint = self._load_checkpoint()
+        segments = self._segments()
+        self._active_seq = segments[-1] if segments else self._checkpoint[0]
+        self._recover(self._active_seq)
+        self._active = open(self.directory / _segment_name(self._active_seq), 'ab')
+        self._active_size = self._active.tell()
+
+    def _segments(self):
+        return sorted(
+            int(path.name[len(SEGMENT_PREFIX):-len('.log')]) for path in self.directory.glob(f'{SEGMENT_PREFIX}*.log')
+        )
+
+    def _load_checkpoint(self):
+        try:
+            data = json.loads((self.directory / CHECKPOINT).read_text())
+            return data['segment'], data['offset']
+        except FileNotFoundError:
+            return 0, 0
+
+    def _recover(self, seq):
+        """Corta un registro a medio escribir al final del último segmento (caída durante un append)"""
+        path = self.directory / _segment_name(seq)
+        if not path.exists():
+            return
+        start = self._checkpoint[1] if seq == self._checkpoint[0] else 0
+        size = path.stat().st_size
+        with open(path, 'rb') as handle:
+            _, valid = _read_records(handle, start, size)
+        if valid < size:
+            logger.warning('Spool: se descartan %d bytes incompletos al final de %s', size - valid, path.name)
+            with open(path, 'r+b') as handle:
+                handle.truncate(valid)
+                os.fsync(handle.fileno())
+
+    def append(self, queue_url, messages):
+        """Agrega un lote y no vuelve hasta que está en disco; recién entonces puede confirmarse en SQS"""
+        data = json.dumps({'q': queue_url, 'm': messages}, separators=(',', ':')).encode('utf-8')
+        record = HEADER.pack(len(data), zlib.crc32(data)) + data
+        with metrics.spool_append_seconds.time(), self._lock:
+            self._active.write(record)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active_size += len(record)
+            if self._active_size >= self.segment_bytes:
+                self._rotate()
+        metrics.spool_messages.inc(len(messages), stage='appended')
+
+    def _rotate(self):
+        self._active.close()
+        self._active_seq += 1
+        self._active = open(self.directory / _segment_name(self._active_seq), 'ab')
+        self._active_size = 0
+        _fsync_directory(self.directory)
+
+    def read(self, max_messages):
+        """Lotes pendientes desde el checkpoint (hasta max_messages); devuelve (lotes, posición final)"""
+        with self._lock:
+            active_seq, active_size = self._active_seq, self._active_size
+        seq, offset = self._checkpoint
+        batches, count = [], 0
+        while count < max_messages:
+            path = self.directory / _segment_name(seq)
+            end = active_size if seq == active_seq else (path.stat().st_size if path.exists() else 0)
+            if offset < end:
+                with open(path, 'rb') as handle:
+                    records, stopped = _read_records(handle, offset, end)
+                if stopped < end and seq != active_seq:
+                    logger.error('Spool: registro dañado en %s (offset %d); se saltea el resto', path.name, stopped)
+                for next_offset, data in records:
+                    batch = _parse_record(data)
+                    if batch is None:
+                        # Registro con CRC válido pero ilegible: se entrega con cola None para apartarlo
+                        logger.error('Spool: registro ilegible en %s (offset %d)', path.name, offset)
+                        batch = (None, [data.decode('utf-8', 'replace')])
+                    batches.append(batch)
+                    count += len(batch[1])
+                    offset = next_offset
+                    if count >= max_messages:
+                        break
+                if count >= max_messages:
+                    break
+            if seq >= active_seq:
+                break
+            seq, offset = seq + 1, 0
+        return batches, (seq, offset)
+
+    def commit(self, position):
+        """Avanza el checkpoint tras guardar en la base y borra los segmentos ya consumidos"""
+        tmp = self.directory / f'{CHECKPOINT}.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump({'segment': position[0], 'offset': position[1]}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self.directory / CHECKPOINT)
+        self._checkpoint = position
+        for seq in self._segments():
+            if seq < position[0]:
+                (self.directory / _segment_name(seq)).unlink()
+        _fsync_directory(self.directory)
+
+    def dead_letter(self, entries):
+        """Aparta en dead-letter.jsonl los mensajes que no se pudieron guardar: [(cola, mensaje, error)]"""
+        with self._lock, open(self.directory / DEAD_LETTER, 'a', encoding='utf-8') as handle:
+            for queue_url, message, error in entries:
+                handle.write(json.dumps({'q': queue_url, 'm': message, 'error': error}, separators=(',', ':')) + '\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+        metrics.spool_messages.inc(len(entries), stage='dead_letter')
+
+    def pending_bytes(self):
+        """Bytes escritos que todavía no pasaron a la base"""
+        with self._lock:
+            active_seq, active_size = self._active_seq, self._active_size
+        seq, offset = self._checkpoint
+        if seq == active_seq:
+            return active_size - offset
+        total = active_size - offset
+        for other in self._segments():
+            if seq <= other < active_seq:
+                total += (self.directory / _segment_name(other)).stat().st_size
+        return total
+
+    def close(self):
+        with self._lock:
+            self._active.close()
+
+
+def _parse_record(data):
+    """(cola, mensajes) de un registro del spool, o None si no tiene esa forma"""
+    try:
+        record = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or not isinstance(record.get('q'), str) or not isinstance(record.get('m'), list):
+        return None
+    return record['q'], record['m']
+
+def _result(messages, created, rejected=()):
+    return {
+        'received': len(messages),
+        'created': created,
+        'duplicates': len(messages) - created - len(rejected),
+        'failed': [{'message': message, 'code': 'dead_letter', 'error': error} for _, message, error in rejected],
+    }
+
+def _store_each(queue_url, messages):
+    """Guarda de a un mensaje; devuelve cuántos eran nuevos y los que no se pudieron guardar"""
+    created, rejected = 0, []
+    for message in messages:
+        try:
+            with transaction.atomic():
+                created += len(store_messages(queue_url, [message]))
+        except DatabaseError:
+            # La base no está disponible: se reintenta el tramo completo más tarde
+            raise
+        except Exception as exc:
+            logger.exception('Spool: no se pudo guardar un mensaje de %s; se aparta', queue_url)
+            rejected.append((queue_url, message, f'{type(exc).__name__}: {exc}'))
+    return created, rejected
+
+def drain_spool(spool, max_messages=1000, on_batch=None):
+    """Pasa a la base un tramo del spool en una sola transacción; devuelve cuántos mensajes leyó"""
+    batches, position = spool.read(max_messages)
+    if not batches:
+        return 0
+    # Se agrupa por cola para guardar con un solo lote por cola
+    by_queue = {}
+    rejected = []
+    for queue_url, messages in batches:
+        if queue_url is None:
+            rejected.extend((None, message, 'registro ilegible') for message in messages)
+        else:
+            by_queue.setdefault(queue_url, []).extend(messages)
+    results = {}
+    try:
+        with transaction.atomic():
+            for queue_url, messages in by_queue.items():
+                results[queue_url] = _result(messages, len(store_messages(queue_url, messages)))
+    except DatabaseError:
+        raise
+    except Exception:
+        # Un mensaje dañado haría fallar el tramo en cada reintento: se guarda de a uno y se
+        # apartan solo los que fallan, para que el checkpoint avance
+        logger.exception('Spool: falló el paso de un tramo a la base; se guarda mensaje por mensaje')
+        for queue_url, messages in by_queue.items():
+            created, failed = _store_each(queue_url, messages)
+            results[queue_url] = _result(messages, created, failed)
+            rejected.extend(failed)
+    if rejected:
+        spool.dead_letter(rejected)
+    spool.commit(position)
+    drained = sum(len(messages) for _, messages in batches)
+    metrics.spool_messages.inc(drained - len(rejected), stage='stored')
+    if on_batch:
+        for queue_url, result in results.items():
+            on_batch(queue_url, result)
+    return drained
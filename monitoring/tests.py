@@ -1,3 +1,829 @@
-from django.test import TestCase
+from datetime import timedelta
+from botocore.exceptions import ClientError, EndpointConnectionError
+from botocore.stub import Stubber
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+from . import aws_clients, envelopes, fake_aws, metrics, partitions
+from .aws_clients import get_client, reset_clients
+from .aws_service import (
+    build_message, fetch_all_messages, fetch_messages_from_queue, get_queue_url_from_arn, ingest_messages, queue_labels,
+    queue_url_from_arn, store_messages,
+)
+from .blobs import delete_orphan_blobs
+from .collector import refresh_target_queues, target_client
+from .consumer import QueueConsumer
+from .events import _cached, event_key, forget_events
+from .benchmarks import bench_queue_names, publish_load, seed_messages, setup_fake_load
+from .counters import get_counts, queue_key, rebuild_counters
+from .inventory import invalidate_inventory, refresh_inventory
+from .live import LiveBroker, Subscription
+from .models import (
+    Message, MessageBlob, MessageCounter, MessageEvent, MessagePartition, MessageRollup, QueueMetricSample,
+)
+from .pagination import keyset_page
+from .poller import poll_queues
+from .queue_metrics import collect_queue_metrics
+from .retention import expired_messages, purge_queryset
+from .rollups import record_rollups, series
+from .search import FTS_TABLE, search_messages
+from .spool import HEADER, Spool, drain_spool
+from .topology import build_topology, get_topology, invalidate_topology
+import asyncio
+import boto3
+import json
+import os
+import tempfile
+import threading
+import zlib
 
 # Create your tests here.
+
+@override_settings(
+    MONITOR_AWS_BACKEND='fake',
+    MONITOR_REGIONS=[fake_aws.DEFAULT_REGION],
+    MONITOR_QUEUE_PREFIXES=[],
+    MONITOR_TARGETS=[],
+    MONITOR_PEEK_QUEUES=[],
+)
+class FakeBackendIngestTests(TestCase):
+    """Camino completo de ingesta contra el SQS/SNS falso en memoria"""
+
+    def setUp(self):
+        fake_aws.backend.reset()
+        invalidate_inventory()
+        self.sqs = get_client('sqs', fake_aws.DEFAULT_REGION)
+        self.sns = get_client('sns', fake_aws.DEFAULT_REGION)
+        self.queue_urls, self.topic_arns = setup_fake_load(self.sqs, self.sns, queues=4, topics=2)
+
+    def test_fetch_all_messages_stores_and_deletes(self):
+        publish_load(self.sns, self.topic_arns, 30)
+        # Cada publicación llega a las dos colas suscritas a su topic
+        self.assertEqual(fake_aws.backend.pending(), 60)
+        while fake_aws.backend.pending():
+            fetch_all_messages(max_messages=10, wait_time=0)
+        self.assertEqual(Message.objects.count(), 60)
+        message = Message.objects.filter(topic_arn=self.topic_arns[0], duplicate=False).first()
+        self.assertEqual(message.topic_arn, self.topic_arns[0])
+        self.assertEqual(message.account_id, fake_aws.ACCOUNT_ID)
+        self.assertEqual(message.region, fake_aws.DEFAULT_REGION)
+        self.assertIsNotNone(message.published_at)
+        self.assertEqual(message.envelope, 'sns')
+        self.assertIsNotNone(message.envelope_id)
+        self.assertEqual(set(message.payload), {'payload'})
+        # 15 publicaciones por topic, cada una entregada a sus dos colas: el topic cuenta eventos
+        counter = MessageCounter.objects.get(kind=MessageCounter.TOPIC, name=self.topic_arns[0])
+        self.assertEqual(counter.count, 15)
+        self.assertEqual(MessageEvent.objects.filter(topic_arn=self.topic_arns[0]).count(), 15)
+        self.assertEqual(set(MessageEvent.objects.values_list('fanout', flat=True)), {2})
+        self.assertEqual(Message.objects.filter(duplicate=True).count(), 30)
+        copy = Message.objects.filter(duplicate=True).first()
+        self.assertIsNone(copy.payload)
+        self.assertEqual(json.loads(copy.full_body), {'payload': 'x' * 512})
+
+    @override_settings(MONITOR_PEEK_VISIBILITY_TIMEOUT=0)
+    def test_redelivered_messages_are_not_duplicated(self):
+        self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody='hola')
+        # En modo observación el mensaje se guarda y queda en la cola; la segunda lectura lo descarta
+        fetch_messages_from_queue(self.queue_urls[0], wait_time=0, peek=True)
+        fetch_messages_from_queue(self.queue_urls[0], wait_time=0)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 1)
+        self.assertEqual(fake_aws.backend.pending(), 0)
+
+    def test_peek_mode_leaves_messages_in_queue(self):
+        publish_load(self.sns, self.topic_arns[:1], 5)
+        fetch_messages_from_queue(self.queue_urls[0], wait_time=0, peek=True)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 5)
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_urls[0])['Attributes']
+        # Siguen en la cola, invisibles hasta que vence la visibilidad corta de la observación
+        self.assertEqual(attributes['ApproximateNumberOfMessagesNotVisible'], '5')
+
+    @override_settings(MONITOR_PEEK_VISIBILITY_TIMEOUT=0, MONITOR_PEEK_MAX_BACKOFF=60)
+    def test_peek_consumer_does_not_spin_on_idle_messages(self):
+        self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody='hola')
+        consumer = QueueConsumer(self.queue_urls[:1], receivers_per_queue=1, wait_time=0, max_backoff=1, peek=True)
+        timer = threading.Timer(2.5, consumer.stop)
+        timer.start()
+        consumer.run()
+        message = self.sqs.receive_message(QueueUrl=self.queue_urls[0], AttributeNames=['All'])['Messages'][0]
+        # Visible en todo momento, pero se relee con espera creciente: 0 s, 1 s, 2 s...
+        self.assertLessEqual(int(message['Attributes']['ApproximateReceiveCount']), 5)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 1)
+
+    @override_settings(MONITOR_PEEK_VISIBILITY_TIMEOUT=0, MONITOR_PEEK_MAX_BACKOFF=1)
+    def test_peek_consumer_retakes_messages_after_a_failed_store(self):
+        self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody='hola')
+        consumer = QueueConsumer(self.queue_urls[:1], receivers_per_queue=1, wait_time=0, max_backoff=1, peek=True)
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return ingest_messages(*args, **kwargs)
+        with mock.patch('monitoring.consumer.ingest_messages', side_effect=flaky):
+            timer = threading.Timer(2.5, consumer.stop)
+            timer.start()
+            consumer.run()
+        # El fallo no lo marcó como visto: una relectura posterior lo guardó
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 1)
+
+    def test_consumer_survives_database_errors(self):
+        for body in ('uno', 'dos'):
+            self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody=body)
+        consumer = QueueConsumer(self.queue_urls[:1], receivers_per_queue=1, max_messages=1, wait_time=0, max_backoff=1)
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return ingest_messages(*args, **kwargs)
+        with mock.patch('monitoring.consumer.ingest_messages', side_effect=flaky):
+            timer = threading.Timer(2, consumer.stop)
+            timer.start()
+            consumer.run()
+        # El primer lote quedó sin confirmar (en vuelo en SQS); el escritor siguió con el segundo
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 1)
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_urls[0])['Attributes']
+        self.assertEqual(attributes['ApproximateNumberOfMessagesNotVisible'], '1')
+
+    def test_poll_isolates_ingest_errors_per_queue(self):
+        for url in self.queue_urls[:2]:
+            self.sqs.send_message(QueueUrl=url, MessageBody='hola')
+
+        def failing(queue_url, messages, **kwargs):
+            if queue_url == self.queue_urls[0]:
+                raise ValueError('cuerpo inválido')
+            return ingest_messages(queue_url, messages, **kwargs)
+        with mock.patch('monitoring.poller.ingest_messages', side_effect=failing):
+            results = poll_queues(self.queue_urls[:2], wait_time=0)
+        self.assertEqual(results[self.queue_urls[0]]['error'], 'cuerpo inválido')
+        self.assertEqual(results[self.queue_urls[1]]['created'], 1)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-1').count(), 1)
+
+    def test_consumer_skips_messages_that_cannot_be_stored(self):
+        for body in ('uno', 'veneno', 'dos'):
+            self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody=body)
+        batches = []
+        consumer = QueueConsumer(
+            self.queue_urls[:1], receivers_per_queue=1, wait_time=0, max_backoff=1,
+            on_batch=lambda queue_url, result: batches.append(result),
+        )
+
+        def poisoned(queue_url, messages, **kwargs):
+            if any(msg['Body'] == 'veneno' for msg in messages):
+                raise ValueError('cuerpo inválido')
+            return ingest_messages(queue_url, messages, **kwargs)
+        with mock.patch('monitoring.consumer.ingest_messages', side_effect=poisoned):
+            timer = threading.Timer(1.5, consumer.stop)
+            timer.start()
+            consumer.run()
+        # Solo el mensaje dañado queda sin guardar ni confirmar; el resto del lote se guardó
+        self.assertEqual(
+            set(Message.objects.filter(queue_name='bench-queue-0').values_list('body', flat=True)), {'uno', 'dos'},
+        )
+        self.assertEqual(sum(result['created'] for result in batches), 2)
+        self.assertEqual([entry['code'] for result in batches for entry in result['failed']], ['ValueError'])
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_urls[0])['Attributes']
+        self.assertEqual(attributes['ApproximateNumberOfMessagesNotVisible'], '1')
+
+    def test_spool_receiver_survives_ack_network_errors(self):
+        for body in ('uno', 'dos'):
+            self.sqs.send_message(QueueUrl=self.queue_urls[0], MessageBody=body)
+        error = EndpointConnectionError(endpoint_url=self.queue_urls[0])
+        with tempfile.TemporaryDirectory() as directory:
+            spool = Spool(directory)
+            consumer = QueueConsumer(
+                self.queue_urls[:1], receivers_per_queue=1, max_messages=1, wait_time=0, max_backoff=1, spool=spool,
+            )
+            with mock.patch.object(consumer.clients[self.queue_urls[0]], 'delete_message_batch', side_effect=error):
+                timer = threading.Timer(1.5, consumer.stop)
+                timer.start()
+                consumer.run()
+            spool.close()
+        # El receptor siguió vivo tras el primer fallo y recibió el segundo mensaje
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 2)
+        self.assertGreaterEqual(metrics.ack_failures.value(
+            **queue_labels(self.queue_urls[0]), operation='delete_message_batch', code='EndpointConnectionError',
+        ), 2)
+
+    def test_rolled_back_event_is_not_cached(self):
+        forget_events()
+        publish_load(self.sns, self.topic_arns[:1], 1)
+        messages = self.sqs.receive_message(QueueUrl=self.queue_urls[0])['Messages']
+        key = event_key(build_message(messages[0], self.queue_urls[0]))
+        with mock.patch('monitoring.aws_service.increment_counters', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                store_messages(self.queue_urls[0], messages)
+        self.assertEqual(_cached([key]), {})
+        self.assertFalse(MessageEvent.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            store_messages(self.queue_urls[0], messages)
+        message = Message.objects.get()
+        self.assertEqual(_cached([key]), {key: message.event_id})
+        self.assertEqual(message.event.key, key)
+
+    def test_search_filters_match_fanout_copies(self):
+        self.sns.publish(TopicArn=self.topic_arns[0], Message='pedido ABC123 confirmado')
+        while fake_aws.backend.pending():
+            fetch_all_messages(max_messages=10, wait_time=0)
+        # El topic 0 entrega en las colas 0 y 2: el evento se encuentra filtrando por cualquiera de ellas
+        for queue in ('bench-queue-0', 'bench-queue-2'):
+            results = search_messages('ABC123', {'queue': queue})['results']
+            self.assertEqual(len(results), 1, queue)
+        self.assertEqual(len(search_messages('ABC123')['results']), 1)
+        self.assertEqual(search_messages('ABC123', {'queue': 'bench-queue-1'})['results'], [])
+
+    def test_purging_primary_promotes_a_copy(self):
+        body = 'pedido XYZ789 ' + 'x' * 500
+        self.sns.publish(TopicArn=self.topic_arns[0], Message=body)
+        while fake_aws.backend.pending():
+            fetch_all_messages(max_messages=10, wait_time=0)
+        primary = Message.objects.get(duplicate=False)
+        purge_queryset(Message.objects.filter(id=primary.id))
+        copy = Message.objects.get()
+        self.assertFalse(copy.duplicate)
+        self.assertEqual(copy.full_body, body)
+        self.assertEqual(MessageCounter.objects.get(kind=MessageCounter.TOPIC, name=self.topic_arns[0]).count, 1)
+        self.assertEqual([message.id for message in search_messages('XYZ789')['results']], [copy.id])
+
+    @override_settings(MONITOR_REGIONS=['us-east-1', 'eu-west-1'])
+    def test_same_named_queues_are_counted_per_region(self):
+        self.addCleanup(cache.clear)
+        urls = []
+        for region, count in (('us-east-1', 2), ('eu-west-1', 1)):
+            sqs = get_client('sqs', region)
+            url = sqs.create_queue(QueueName='orders')['QueueUrl']
+            for index in range(count):
+                sqs.send_message(QueueUrl=url, MessageBody=f'pedido {index}')
+            fetch_messages_from_queue(url, wait_time=0)
+            urls.append(url)
+        refresh_inventory()
+        collect_queue_metrics(urls)
+        self.assertEqual(
+            set(QueueMetricSample.objects.filter(queue_name='orders').values_list('region', flat=True)),
+            {'us-east-1', 'eu-west-1'},
+        )
+        response = self.client.get(reverse('queue_list'))
+        rows = {row['region']: row for row in response.context['queues'] if row['name'] == 'orders'}
+        self.assertEqual({region: row['count'] for region, row in rows.items()}, {'us-east-1': 2, 'eu-west-1': 1})
+        self.assertEqual(rows['eu-west-1']['origin_query'], f'account={fake_aws.ACCOUNT_ID}&region=eu-west-1')
+        response = self.client.get(f"{reverse('message_list', args=['orders'])}?{rows['eu-west-1']['origin_query']}")
+        self.assertEqual(len(response.context['messages']), 1)
+
+    def test_queue_list_includes_target_queues(self):
+        self.addCleanup(cache.clear)
+        sqs = get_client('sqs', 'eu-west-1')
+        url = sqs.create_queue(QueueName='orders')['QueueUrl']
+        sqs.send_message(QueueUrl=url, MessageBody='pedido')
+        fetch_messages_from_queue(url, wait_time=0)
+        refresh_inventory()
+        with override_settings(MONITOR_TARGETS=[{'name': 'europa', 'region': 'eu-west-1', 'queues': [url]}]):
+            refresh_target_queues()
+            response = self.client.get(reverse('queue_list'))
+        row, = [row for row in response.context['queues'] if row['name'] == 'orders']
+        self.assertEqual((row['url'], row['account_id'], row['region'], row['count']), (url, fake_aws.ACCOUNT_ID, 'eu-west-1', 1))
+        self.assertEqual(len(response.context['queues']), len(self.queue_urls) + 1)
+
+    def test_inventory_follows_every_page(self):
+        self.addCleanup(invalidate_inventory)
+        for index in range(3):
+            self.sns.create_topic(Name=f'orders-{index}')
+        with mock.patch.object(fake_aws.backend, 'page_size', 2):
+            pages = list(self.sqs.get_paginator('list_queues').paginate())
+            self.assertEqual([len(page['QueueUrls']) for page in pages], [2, 2])
+            self.assertEqual(pages[0]['NextToken'], '2')
+            inventory = refresh_inventory()
+            topology = build_topology()
+        self.assertEqual(inventory['queues'], self.queue_urls)
+        self.assertEqual(len(inventory['topics']), 5)
+        self.assertEqual(sum(len(subscriptions) for subscriptions in topology.values()), len(self.queue_urls))
+
+    def test_queue_url_from_arn(self):
+        self.assertEqual(
+            queue_url_from_arn('arn:aws:sqs:eu-west-1:210987654321:orders'),
+            'https://sqs.eu-west-1.amazonaws.com/210987654321/orders',
+        )
+        self.assertEqual(
+            queue_url_from_arn('arn:aws-cn:sqs:cn-north-1:210987654321:orders'),
+            'https://sqs.cn-north-1.amazonaws.com.cn/210987654321/orders',
+        )
+        self.assertIsNone(queue_url_from_arn('arn:aws:sns:us-east-1:210987654321:orders'))
+        self.assertIsNone(queue_url_from_arn('orders'))
+        # Con una partición desconocida se pregunta la URL a SQS
+        self.assertEqual(
+            get_queue_url_from_arn(f'arn:aws-xx:sqs:us-east-1:{fake_aws.ACCOUNT_ID}:bench-queue-0', client=self.sqs),
+            self.queue_urls[0],
+        )
+        self.assertIsNone(get_queue_url_from_arn('arn:aws-xx:sqs:us-east-1:210987654321:missing', client=self.sqs))
+
+    def test_topology_is_cached_until_invalidated(self):
+        self.addCleanup(cache.clear)
+        invalidate_topology()
+        with mock.patch('monitoring.topology.build_topology', wraps=build_topology) as build:
+            topology = get_topology()
+            self.assertEqual(get_topology(), topology)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(
+                [sub['queue_url'] for sub in topology[self.topic_arns[0]]], [self.queue_urls[0], self.queue_urls[2]],
+            )
+            url = self.sqs.create_queue(QueueName='orders')['QueueUrl']
+            self.sns.subscribe(TopicArn=self.topic_arns[0], Protocol='sqs', Endpoint=self.sqs.get_queue_attributes(
+                QueueUrl=url, AttributeNames=['QueueArn'],
+            )['Attributes']['QueueArn'])
+            # La suscripción nueva no se ve hasta invalidar la topología cacheada
+            self.assertNotIn(url, [sub['queue_url'] for sub in get_topology()[self.topic_arns[0]]])
+            invalidate_topology()
+            self.assertIn(url, [sub['queue_url'] for sub in get_topology()[self.topic_arns[0]]])
+            self.assertEqual(build.call_count, 2)
+
+    def test_queue_metrics_use_the_target_role_and_region(self):
+        self.addCleanup(cache.clear)
+        url = get_client('sqs', 'eu-west-1').create_queue(QueueName='orders')['QueueUrl']
+        target = {
+            'name': 'europa', 'region': 'eu-west-1', 'role_arn': 'arn:aws:iam::210987654321:role/monitor', 'queues': [url],
+        }
+        with override_settings(MONITOR_TARGETS=[target]), \
+                mock.patch('monitoring.queue_metrics.target_client', wraps=target_client) as client:
+            refresh_target_queues()
+            collect_queue_metrics([self.queue_urls[0], url])
+        self.assertEqual(
+            sorted(call.args[1:] for call in client.call_args_list), [('eu-west-1', 'cloudwatch'), ('eu-west-1', 'sqs')],
+        )
+        self.assertTrue(all(call.args[0] is target for call in client.call_args_list))
+        self.assertEqual(QueueMetricSample.objects.filter(region='eu-west-1', queue_name='orders').count(), 1)
+
+    def test_ingestion_metrics(self):
+        labels = queue_labels(self.queue_urls[1])
+        stored = metrics.messages_stored.value(**labels)
+        publish_load(self.sns, self.topic_arns, 4)
+        fetch_messages_from_queue(self.queue_urls[1], wait_time=0)
+        fetch_messages_from_queue(self.queue_urls[1], wait_time=0)
+        self.assertEqual(metrics.messages_stored.value(**labels), stored + 2)
+        self.assertGreaterEqual(metrics.empty_receives.value(**labels), 1)
+        self.assertIn(
+            f'sqs_receive_seconds_bucket{{queue="bench-queue-1",account="{fake_aws.ACCOUNT_ID}",'
+            f'region="{fake_aws.DEFAULT_REGION}",le="+Inf"}}',
+            metrics.render(),
+        )
+
+    def test_spool_survives_torn_write_and_replays(self):
+        publish_load(self.sns, self.topic_arns[:1], 3)
+        messages = self.sqs.receive_message(QueueUrl=self.queue_urls[0], MaxNumberOfMessages=10)['Messages']
+        with tempfile.TemporaryDirectory() as directory:
+            spool = Spool(directory)
+            spool.append(self.queue_urls[0], messages)
+            spool.close()
+            # Caída a mitad de un append: el registro incompleto se descarta al reabrir
+            with open(spool.directory / 'segment-000000000000.log', 'ab') as handle:
+                handle.write(b'\x00\x00\x10\x00parcial')
+            spool = Spool(directory)
+            self.assertEqual(drain_spool(spool), 3)
+            self.assertEqual(spool.pending_bytes(), 0)
+            # Reprocesar desde un checkpoint viejo no duplica filas
+            spool.append(self.queue_urls[0], messages)
+            self.assertEqual(drain_spool(spool), 3)
+            spool.close()
+            self.assertEqual(Spool(directory).pending_bytes(), 0)
+        self.assertEqual(Message.objects.filter(queue_name='bench-queue-0').count(), 3)
+
+    def test_spool_sets_aside_poison_records(self):
+        url = self.queue_urls[0]
+        with tempfile.TemporaryDirectory() as directory:
+            spool = Spool(directory)
+            spool.append(url, [{'MessageId': 'm-1', 'Body': 'uno'}, {'Body': 'sin id'}])
+            # Registro con CRC válido pero que no es un lote del spool
+            data = b'no es json'
+            with spool._lock:
+                spool._active.write(HEADER.pack(len(data), zlib.crc32(data)) + data)
+                spool._active.flush()
+                spool._active_size += HEADER.size + len(data)
+            spool.append(url, [{'MessageId': 'm-2', 'Body': 'dos'}])
+            self.assertEqual(drain_spool(spool), 4)
+            # El checkpoint avanzó: la próxima vuelta no reintenta los registros dañados
+            self.assertEqual(spool.pending_bytes(), 0)
+            self.assertEqual(drain_spool(spool), 0)
+            with open(spool.directory / 'dead-letter.jsonl') as handle:
+                dead = [json.loads(line) for line in handle]
+            spool.close()
+        self.assertEqual([(entry['q'], entry['m']) for entry in dead], [(None, 'no es json'), (url, {'Body': 'sin id'})])
+        self.assertEqual(
+            set(Message.objects.filter(queue_name='bench-queue-0').values_list('message_id', flat=True)), {'m-1', 'm-2'},
+        )
+
+
+class RollupTests(TestCase):
+    def test_series_percentiles_are_clamped_to_max_lag(self):
+        now = timezone.now()
+        rows = [
+            Message(queue_name='q1', topic_arn='arn:t', received_at=now, published_at=now - timedelta(seconds=lag))
+            for lag in (0.05, 0.05, 0.05, 7200)
+        ]
+        rows.append(Message(queue_name='q1', topic_arn='arn:t', duplicate=True, received_at=now))
+        record_rollups(rows)
+        record_rollups(rows[:1])
+        point, = series(MessageCounter.QUEUE, 'q1', span=timedelta(hours=1), now=now)['points']
+        self.assertEqual(point['count'], 6)
+        self.assertEqual(point['lag_p50'], 0.1)
+        # El percentil que cae en el último bucket (+inf) se acota con la demora máxima
+        self.assertEqual(point['lag_p99'], 7200)
+        self.assertEqual(point['lag_max'], 7200)
+        # Las copias de un evento no suman al topic
+        point, = series(MessageCounter.TOPIC, 'arn:t', span=timedelta(hours=1), now=now)['points']
+        self.assertEqual(point['count'], 5)
+        self.assertEqual(MessageRollup.objects.filter(name='q1').count(), 3)
+
+    def test_same_named_queues_have_separate_series(self):
+        now = timezone.now()
+        record_rollups([
+            Message(account_id='111111111111', region=region, queue_name='orders', received_at=now)
+            for region in ('us-east-1', 'us-east-1', 'eu-west-1')
+        ])
+        self.assertEqual(MessageRollup.objects.filter(name='orders', resolution=MessageRollup.MINUTE).count(), 2)
+        point, = series(MessageCounter.QUEUE, 'orders', span=timedelta(hours=1), now=now, region='eu-west-1')['points']
+        self.assertEqual(point['count'], 1)
+        # Sin origen se suman todas las homónimas
+        point, = series(MessageCounter.QUEUE, 'orders', span=timedelta(hours=1), now=now)['points']
+        self.assertEqual(point['count'], 3)
+
+
+@override_settings(MONITOR_AWS_BACKEND='aws', AWS_ACCESS_KEY_ID='AKIATEST', AWS_SECRET_ACCESS_KEY='secret')
+class AwsClientTests(SimpleTestCase):
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+        self.addCleanup(aws_clients._expired.clear)
+
+    def test_assume_role_does_not_block_other_clients(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_assume_role(role_arn, external_id=None):
+            started.set()
+            release.wait(5)
+            return boto3.session.Session(aws_access_key_id='AKIAROLE', aws_secret_access_key='secret')
+
+        with mock.patch('monitoring.aws_clients._assume_role_session', side_effect=slow_assume_role):
+            role = threading.Thread(target=get_client, args=('sqs', 'us-east-1', 'arn:aws:iam::111111111111:role/r'))
+            role.start()
+            self.assertTrue(started.wait(5))
+            # Mientras STS no responde, los clientes sin rol se siguen creando
+            plain = threading.Thread(target=get_client, args=('sqs', 'us-east-1'))
+            plain.start()
+            plain.join(2)
+            self.assertFalse(plain.is_alive())
+            release.set()
+            role.join(5)
+        self.assertFalse(role.is_alive())
+
+    @mock.patch.dict(os.environ, {'AWS_EC2_METADATA_DISABLED': 'true', 'AWS_SHARED_CREDENTIALS_FILE': '/nonexistent'})
+    def test_expired_credentials_reset_clients(self):
+        client = get_client('sqs', 'us-east-1')
+        with Stubber(client) as stubber:
+            stubber.add_client_error('list_queues', service_error_code='ExpiredToken', http_status_code=403)
+            with self.assertRaises(ClientError):
+                client.list_queues()
+        # El cliente nuevo ya no firma con las credenciales explícitas vencidas
+        renewed = get_client('sqs', 'us-east-1')
+        self.assertIsNot(renewed, client)
+        credentials = renewed._request_signer._credentials
+        self.assertTrue(credentials is None or credentials.access_key != 'AKIATEST')
+
+
+def failing_decoder(document, backend=None):
+    raise KeyError('detail')
+
+
+class EnvelopeDecodeTests(SimpleTestCase):
+    def test_sns_envelope(self):
+        envelope = envelopes.decode(json.dumps({
+            'Type': 'Notification', 'MessageId': 'm-1', 'TopicArn': 'arn:aws:sns:us-east-1:1:t',
+            'Subject': 'alta', 'Message': '{"id": 7}', 'Timestamp': '2024-01-01T00:00:00.000Z',
+            'MessageAttributes': {'kind': {'Type': 'String', 'Value': 'order'}},
+        }))
+        self.assertEqual(envelope.kind, 'sns')
+        self.assertEqual(envelope.body, '{"id": 7}')
+        self.assertEqual(envelope.payload, {'id': 7})
+        self.assertEqual(envelope.envelope_id, 'm-1')
+        self.assertEqual(envelope.published_at.year, 2024)
+        self.assertEqual(envelope.attributes, {'kind': {'DataType': 'String', 'StringValue': 'order'}})
+
+    def test_eventbridge_event(self):
+        body = json.dumps({'id': 'e-1', 'detail-type': 'OrderCreated', 'time': '2024-01-01T00:00:00Z', 'detail': {'id': 7}})
+        envelope = envelopes.decode(body)
+        self.assertEqual((envelope.kind, envelope.subject, envelope.envelope_id), ('eventbridge', 'OrderCreated', 'e-1'))
+        self.assertEqual(envelope.payload, {'id': 7})
+        self.assertEqual(envelope.body, body)
+
+    def test_raw_delivery(self):
+        self.assertEqual(envelopes.decode('{"id": 7}').payload, {'id': 7})
+        envelope = envelopes.decode('texto plano')
+        self.assertEqual((envelope.kind, envelope.body, envelope.payload), ('raw', 'texto plano', None))
+
+    def test_malformed_envelope_fields_are_ignored(self):
+        envelope = envelopes.decode(json.dumps({'detail-type': 'x', 'detail': {}, 'time': 1700000000}))
+        self.assertEqual((envelope.kind, envelope.published_at), ('eventbridge', None))
+        envelope = envelopes.decode(json.dumps({'detail-type': 'x', 'detail': {}, 'time': '2024-13-45T00:00:00Z'}))
+        self.assertIsNone(envelope.published_at)
+        envelope = envelopes.decode(json.dumps({
+            'TopicArn': 'arn:aws:sns:us-east-1:1:t', 'Message': 'hola', 'Timestamp': 'ayer',
+            'MessageAttributes': {'a': 'x', 'b': {'Type': 5, 'Value': 'v'}},
+        }))
+        self.assertEqual((envelope.kind, envelope.published_at), ('sns', None))
+        self.assertEqual(envelope.attributes, {'b': {'DataType': 'String', 'StringValue': 'v'}})
+        envelope = envelopes.decode(json.dumps({'TopicArn': 'arn:aws:sns:us-east-1:1:t', 'Message': 'hola', 'MessageAttributes': []}))
+        self.assertEqual(envelope.attributes, {})
+        # Campos con otro tipo: no es un sobre reconocible y se guarda tal cual
+        body = json.dumps({'TopicArn': 7, 'Message': 'hola'})
+        self.assertEqual(envelopes.decode(body).kind, 'raw')
+
+    @override_settings(MONITOR_ENVELOPE_DECODERS=['monitoring.tests.failing_decoder'])
+    def test_failing_decoder_falls_back_to_raw(self):
+        envelope = envelopes.decode('{"id": 7}')
+        self.assertEqual((envelope.kind, envelope.body, envelope.payload), ('raw', '{"id": 7}', {'id': 7}))
+
+
+@override_settings(
+    MONITOR_PARTITION_PERIOD='day', MONITOR_PARTITION_SEAL_AFTER=0, MONITOR_PARTITION_RETENTION_DAYS=30,
+)
+class PartitionTests(TestCase):
+    def setUp(self):
+        seed_messages(40, queues=2, topics=1, days=4)
+        rebuild_counters()
+        self.queue_name = bench_queue_names(2)[0]
+        # Los mensajes sembrados no tienen cuenta ni región de origen
+        self.queue_key = queue_key(None, None, self.queue_name)
+        self.moved = partitions.seal_partitions()
+
+    def test_seal_moves_finished_periods(self):
+        self.assertTrue(self.moved)
+        self.assertEqual(Message.objects.count() + sum(self.moved.values()), 40)
+        start, _ = partitions.period_bounds(timezone.now())
+        self.assertFalse(Message.objects.filter(received_at__lt=start).exists())
+        # Los contadores no cambian al sellar, y rebuild suma las particiones
+        rebuild_counters()
+        self.assertEqual(get_counts(MessageCounter.QUEUE)[self.queue_key], 20)
+
+    def test_views_read_sealed_rows(self):
+        seen = []
+        url = reverse('message_list', args=[self.queue_name])
+        cursor = ''
+        while True:
+            response = self.client.get(url, {'page_size': 7, 'cursor': cursor} if cursor else {'page_size': 7})
+            page = response.context['page']
+            seen.extend(message.pk for message in page['items'])
+            if not page['next_cursor']:
+                break
+            cursor = page['next_cursor']
+        self.assertEqual(len(seen), 20)
+        self.assertEqual(len(set(seen)), 20)
+        sealed = MessagePartition.objects.order_by('period_start').first()
+        response = self.client.get(reverse('message_detail', args=[sealed.min_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['message'].partition, sealed.table_name)
+
+    def test_seal_in_small_chunks_moves_the_same_rows(self):
+        sealed = dict(self.moved)
+        for table in sealed:
+            partitions.drop_partition(MessagePartition.objects.get(table_name=table))
+        Message.objects.all().delete()
+        seed_messages(40, queues=2, topics=1, days=4)
+        self.assertEqual(partitions.seal_partitions(chunk_size=3), sealed)
+        self.assertEqual(sum(MessagePartition.objects.values_list('rows', flat=True)), sum(sealed.values()))
+
+    def test_drop_removes_the_search_rows_by_id_range(self):
+        first, second = MessagePartition.objects.order_by('period_start')[:2]
+        live = Message._meta.db_table
+        late_id = first.min_id + 1
+        with connection.cursor() as cursor:
+            # Una fila con el reloj atrasado: su id cae en el rango de la partición pero sigue en la tabla principal
+            cursor.execute(f'INSERT INTO {live} SELECT * FROM {first.table_name} WHERE id = %s', [late_id])
+            cursor.execute(f'DELETE FROM {first.table_name} WHERE id = %s', [late_id])
+            for table in (live, first.table_name, second.table_name):
+                cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, body) SELECT id, body FROM {table}")
+        partitions.drop_partition(first)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} WHERE rowid BETWEEN %s AND %s', [first.min_id, second.max_id])
+            remaining = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(remaining, {late_id, *range(second.min_id, second.max_id + 1)})
+
+    def test_expired_partitions_are_dropped(self):
+        dropped = partitions.drop_expired_partitions(now=timezone.now() + timedelta(days=40))
+        self.assertEqual(sum(dropped.values()), sum(self.moved.values()))
+        self.assertFalse(MessagePartition.objects.exists())
+        self.assertEqual(get_counts(MessageCounter.QUEUE)[self.queue_key], Message.objects.filter(
+            queue_name=self.queue_name,
+        ).count())
+
+
+def store_bodies(queue_name, bodies):
+    """Guarda los cuerpos como si llegaran en un ReceiveMessage de la cola"""
+    url = f'https://sqs.us-east-1.amazonaws.com/123456789012/{queue_name}'
+    store_messages(url, [
+        {'MessageId': f'{queue_name}-{index}', 'ReceiptHandle': f'rh-{index}', 'Body': body}
+        for index, body in enumerate(bodies)
+    ])
+
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        moment = timezone.now()
+        Message.objects.bulk_create([Message(message_id=f'm{index}', queue_name='q1', body='x') for index in range(10)])
+        # La mitad comparte received_at: el id desempata el orden
+        first = list(Message.objects.order_by('id').values_list('id', flat=True)[:5])
+        Message.objects.filter(id__in=first).update(received_at=moment)
+        self.expected = list(Message.objects.order_by('-received_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_walks_every_row_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            page = keyset_page(Message.objects.all(), cursor=cursor, page_size=3)
+            self.assertEqual(page['is_first'], cursor is None)
+            seen.extend(message.pk for message in page['items'])
+            if not page['next_cursor']:
+                break
+            cursor = page['next_cursor']
+        self.assertEqual(seen, self.expected)
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        page = keyset_page(Message.objects.all(), cursor='no-es-un-cursor', page_size=3)
+        self.assertTrue(page['is_first'])
+        self.assertEqual([message.pk for message in page['items']], self.expected[:3])
+
+    def test_message_list_defers_body(self):
+        response = self.client.get(reverse('message_list', args=['q1']), {'page_size': 4})
+        messages = response.context['messages']
+        self.assertEqual([message.pk for message in messages], self.expected[:4])
+        self.assertIn('body', messages[0].get_deferred_fields())
+
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        store_bodies('q1', [f'pedido {index}' for index in range(6)])
+        # Un mensaje por hora hacia atrás, del más nuevo al más viejo
+        self.now = timezone.now()
+        self.newest = list(Message.objects.order_by('-id').values_list('id', flat=True))
+        for hours, pk in enumerate(self.newest):
+            Message.objects.filter(id=pk).update(received_at=self.now - timedelta(hours=hours))
+
+    def test_max_rows_keeps_the_newest(self):
+        expired = expired_messages(Message.objects.filter(queue_name='q1'), {'max_rows': 4}, now=self.now)
+        self.assertEqual(set(expired.values_list('id', flat=True)), set(self.newest[4:]))
+
+    def test_max_age(self):
+        # Vence lo recibido hace más de 2,5 horas
+        now = self.now + timedelta(days=1) - timedelta(hours=2, minutes=30)
+        expired = expired_messages(Message.objects.filter(queue_name='q1'), {'max_age_days': 1}, now=now)
+        self.assertEqual(set(expired.values_list('id', flat=True)), set(self.newest[3:]))
+        self.assertFalse(expired_messages(Message.objects.all(), {}).exists())
+
+    def test_purge_keeps_counters_and_search_in_sync(self):
+        expired = expired_messages(Message.objects.filter(queue_name='q1'), {'max_rows': 2}, now=self.now)
+        self.assertEqual(purge_queryset(expired, chunk_size=3), 4)
+        self.assertEqual(MessageCounter.objects.get(kind=MessageCounter.QUEUE).count, 2)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE}')
+            indexed = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(indexed, set(self.newest[:2]))
+        self.assertEqual({message.pk for message in search_messages('pedido')['results']}, set(self.newest[:2]))
+
+
+
+@override_settings(MONITOR_BLOB_THRESHOLD=200, MONITOR_BODY_PREVIEW=50)
+class BlobTests(TestCase):
+    def setUp(self):
+        self.body = 'x' * 1000 + ' REF4242'
+
+    def test_large_bodies_are_offloaded_once(self):
+        store_bodies('q1', [self.body, self.body, 'corto'])
+        blob = MessageBlob.objects.get()
+        self.assertEqual(blob.size, len(self.body))
+        self.assertLess(len(blob.data), blob.size)
+        large = Message.objects.filter(body_blob=blob)
+        self.assertEqual(large.count(), 2)
+        for message in large:
+            self.assertEqual(len(message.body), 50)
+            self.assertEqual(message.body_size, len(self.body))
+            self.assertEqual(message.full_body, self.body)
+        self.assertEqual(Message.objects.get(body_blob__isnull=True).full_body, 'corto')
+        # El índice de búsqueda recibe el cuerpo completo, no el extracto
+        self.assertEqual(len(search_messages('REF4242')['results']), 2)
+
+    def test_orphan_blobs_are_deleted(self):
+        store_bodies('q1', [self.body, self.body])
+        first, second = Message.objects.order_by('id')
+        purge_queryset(Message.objects.filter(id=first.id))
+        self.assertEqual(delete_orphan_blobs(), 0)
+        purge_queryset(Message.objects.filter(id=second.id))
+        self.assertEqual(delete_orphan_blobs(), 1)
+        self.assertFalse(MessageBlob.objects.exists())
+
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        bodies = {
+            'repeated': 'pago rechazado rechazado rechazado',
+            'long': 'pago aprobado sin problemas en el cobro, rechazado una vez por la tarjeta y luego aprobado',
+            'other': 'otro mensaje',
+        }
+        store_bodies('q1', bodies.values())
+        store_bodies('q2', ['envío rechazado'])
+        self.ids = {name: Message.objects.get(body=body).pk for name, body in bodies.items()}
+        self.ids['q2'] = Message.objects.get(queue_name='q2').pk
+
+    def test_ranking_and_snippet(self):
+        results = search_messages('rechazado')['results']
+        # Más apariciones y cuerpos más cortos primero (bm25)
+        self.assertEqual([message.pk for message in results], [self.ids['repeated'], self.ids['q2'], self.ids['long']])
+        self.assertIn('[rechazado]', results[0].snippet)
+        self.assertEqual(len(search_messages('rechaz*')['results']), 3)
+
+    def test_filters_and_pages(self):
+        results = search_messages('rechazado', {'queue': 'q2'})['results']
+        self.assertEqual([message.pk for message in results], [self.ids['q2']])
+        Message.objects.filter(pk=self.ids['q2']).update(received_at=timezone.now() - timedelta(days=2))
+        recent = search_messages('rechazado', {'since': timezone.now() - timedelta(days=1)})['results']
+        self.assertNotIn(self.ids['q2'], [message.pk for message in recent])
+        first = search_messages('rechazado', page_size=2)
+        second = search_messages('rechazado', page=2, page_size=2)
+        self.assertTrue(first['has_next'])
+        self.assertFalse(second['has_next'])
+        self.assertEqual(len(first['results']) + len(second['results']), 3)
+
+    def test_search_page_links_keep_the_origin_filters(self):
+        params = {'q': 'rechazado', 'account': '123456789012', 'region': 'us-east-1', 'page_size': 1}
+        response = self.client.get(reverse('message_search'), params)
+        self.assertEqual(len(response.context['result']['results']), 1)
+        self.assertContains(
+            response, 'href="?q=rechazado&amp;account=123456789012&amp;region=us-east-1&amp;page_size=1&amp;page=2"',
+        )
+        self.assertContains(response, 'name="region" placeholder="Región" value="us-east-1"')
+        response = self.client.get(reverse('message_search'), {**params, 'page': 2})
+        self.assertContains(response, '&amp;page_size=1&amp;page=1">Anterior')
+
+    def test_operators_in_the_text_are_literal(self):
+        self.assertEqual(search_messages('"OR NEAR(')['results'], [])
+        self.assertEqual(search_messages('')['results'], [])
+
+
+@override_settings(MONITOR_LIVE_POLL_INTERVAL=0)
+class LiveTailTests(TestCase):
+    def test_poll_fans_out_new_messages_to_each_subscriber(self):
+        store_bodies('q1', ['viejo'])
+        loop = asyncio.new_event_loop()
+        broker = LiveBroker()
+        everything = broker.subscribe(loop=loop)
+        only_q2 = broker.subscribe(queue_name='q2', loop=loop)
+        try:
+            # La primera consulta fija desde dónde seguir: lo ya guardado no se reenvía
+            self.assertEqual(broker.poll_once(), 0)
+            store_bodies('q2', ['nuevo', 'otro'])
+            store_bodies('q3', ['ajeno'])
+            self.assertEqual(broker.poll_once(), 3)
+            loop.run_until_complete(asyncio.sleep(0))
+            self.assertEqual(everything.events.qsize(), 3)
+            self.assertEqual(only_q2.events.qsize(), 2)
+            self.assertEqual(only_q2.events.get_nowait()['preview'], 'nuevo')
+            self.assertEqual(broker.poll_once(), 0)
+        finally:
+            broker.unsubscribe(everything)
+            broker.unsubscribe(only_q2)
+            loop.close()
+
+    def test_slow_subscriber_drops_the_oldest_events(self):
+        loop = asyncio.new_event_loop()
+        try:
+            subscription = Subscription(loop, maxsize=2)
+            for index in range(3):
+                subscription.offer({'id': index, 'queue_name': 'q1', 'topic_arn': None})
+            self.assertEqual(subscription.dropped, 1)
+            self.assertEqual([subscription.events.get_nowait()['id'] for _ in range(2)], [1, 2])
+        finally:
+            loop.close()
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get(reverse('live_tail_stream'))
+        self.assertEqual(response.status_code, 501)
+        # La página cae a consultas periódicas en lugar de abrir el EventSource
+        page = self.client.get(reverse('live_tail'))
+        self.assertFalse(page.context['streaming'])
+        self.assertContains(page, reverse('live_tail_poll'))
+
+    def test_poll_endpoint_returns_messages_after_the_given_id(self):
+        store_bodies('q1', ['viejo'])
+        baseline = self.client.get(reverse('live_tail_poll')).json()
+        self.assertEqual(baseline['messages'], [])
+        store_bodies('q2', ['nuevo'])
+        data = self.client.get(reverse('live_tail_poll'), {'after': baseline['last_id'], 'queue': 'q2'}).json()
+        self.assertEqual([event['preview'] for event in data['messages']], ['nuevo'])
+        self.assertEqual(data['last_id'], data['messages'][0]['id'])
+        empty = self.client.get(reverse('live_tail_poll'), {'after': data['last_id']}).json()
+        self.assertEqual((empty['messages'], empty['last_id']), ([], data['last_id']))
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from .aws_service import get_queue_url_from_arn, get_sns_client, get_sqs_client
+from .inventory import monitored_regions
+import threading
+
+CACHE_KEY = 'sns-topology'
+
+_build_lock = threading.Lock()
+
+def build_topology():
+    """Arma el mapa topic -> colas suscritas recorriendo todas las suscripciones de la cuenta"""
+    topology = {}
+    for region in monitored_regions():
+        sns = get_sns_client(region)
+        sqs = get_sqs_client(region)
+        paginator = sns.get_paginator('list_subscriptions')
+        for page in paginator.paginate():
+            for sub in page.get('Subscriptions', []):
+                if sub.get('Protocol') != 'sqs' or not sub.get('Endpoint'):
+                    continue
+                queue_url = get_queue_url_from_arn(sub['Endpoint'], client=sqs)
+                topology.setdefault(sub['TopicArn'], []).append({
+                    'subscription_arn': sub.get('SubscriptionArn'),
+                    'queue_arn': sub['Endpoint'],
+                    'queue_url': queue_url,
+                })
+    return topology
+
+def get_topology():
+    """Devuelve la topología cacheada (MONITOR_TOPOLOGY_TTL) o la reconstruye"""
+    topology = cache.get(CACHE_KEY)
+    if topology is None:
+        # Un solo hilo por proceso la reconstruye; los demás esperan y reutilizan el resultado
+        with _build_lock:
+            topology = cache.get(CACHE_KEY)
+            if topology is None:
+                topology = build_topology()
+                cache.set(CACHE_KEY, topology, timeout=settings.MONITOR_TOPOLOGY_TTL)
+    return topology
+
+def invalidate_topology():
+    """Descarta la topología cacheada, por ejemplo tras crear o borrar suscripciones"""
+    cache.delete(CACHE_KEY)
+
+def subscribed_queue_urls(topic_arn):
+    """URLs de las colas SQS suscritas a un topic"""
+    return [sub['queue_url'] for sub in get_topology().get(topic_arn, []) if sub['queue_url']]
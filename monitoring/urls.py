@@ -7,5 +7,14 @@ urlpatterns = [
     path('messages/<int:pk>/', views.message_detail, name='message_detail'),
     path('topics/', views.topic_list, name='topic_list'),
     path('topics/<str:topic_arn>/', views.topic_message_list, name='topic_message_list'),
+    path('topics/<str:topic_arn>/update/', views.update_topic_messages, name='update_topic_messages'),
+    path('live/', views.live_tail, name='live_tail'),
+    path('live/stream/', views.live_tail_stream, name='live_tail_stream'),
+    path('live/poll/', views.live_tail_poll, name='live_tail_poll'),
+    path('stats/', views.stats, name='stats'),
+    path('api/stats/', views.stats_api, name='stats_api'),
+    path('search/', views.message_search, name='message_search'),
+    path('api/search/', views.message_search_api, name='message_search_api'),
     path('update/', views.update_messages, name='update_messages'),
+    path('metrics', views.metrics_view, name='metrics'),
 ] 
\ No newline at end of file
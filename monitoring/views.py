@@ -1,55 +1,349 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from .aws_service import list_queues, list_topics, fetch_all_messages, fetch_messages_by_topic
-from .models import Message
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+import asyncio
+import json
+from urllib.parse import urlencode
+from .aws_service import fetch_all_messages, fetch_messages_by_topic, queue_key_from_url
+from .collector import get_target_queues
+from .counters import get_counts
+from .inventory import get_inventory
+from . import metrics, partitions
+from .live import broker, latest_message_id, recent_events
+from .models import Message, MessageCounter
+from .pagination import get_page_size, paginate_messages
+from .queue_metrics import get_queue_metrics, get_trends
+from .rollups import series
+from .refresh import ALL_QUEUES, ensure_scheduler, refresh_status, trigger_refresh
+from .search import search_messages
+
+# Columnas que muestran los listados; body y attributes solo se cargan en el detalle
+LIST_FIELDS = ('id', 'message_id', 'queue_name', 'account_id', 'region', 'state', 'received_at')
+
+# Entregas de un mismo evento que se listan en el detalle
+MAX_DELIVERIES = 50
 
 # Vistas para colas SQS
 
 def queue_list(request):
     """Lista las colas SQS y muestra el conteo de mensajes"""
-    queues = list_queues()
-    queue_names = [url.split('/')[-1] for url in queues]
+    ensure_scheduler()
+    # El inventario de colas sale de la caché; nunca se lista AWS durante la request
+    inventory = get_inventory()
+    # Se suman las colas de MONITOR_TARGETS (otras cuentas o regiones), también cacheadas
+    queues = list(dict.fromkeys(inventory['queues'] + list(get_target_queues())))
+    # Cada cola se identifica por (cuenta, región, nombre): las homónimas no se mezclan
+    keys = [queue_key_from_url(url) for url in queues]
+    # Un único SELECT sobre la tabla de contadores en vez de un COUNT por cola
+    counts = get_counts(MessageCounter.QUEUE, keys if queues else None)
+    if not queues:
+        # Mientras se arma el primer inventario se muestran las colas conocidas localmente
+        keys = sorted(counts, key=lambda key: (key[2], key[0], key[1]))
+        queues = [None] * len(keys)
+    # Backlog real en SQS desde la caché de métricas (se renueva en segundo plano)
+    backlog = get_queue_metrics([url for url in queues if url])
+    trends = get_trends(keys)
     queue_info = []
-    for url, name in zip(queues, queue_names):
-        count = Message.objects.filter(queue_name=name).count()
-        queue_info.append({'url': url, 'name': name, 'count': count})
-    return render(request, 'monitoring/queue_list.html', {'queues': queue_info})
+    for url, key in zip(queues, keys):
+        account_id, region, name = key
+        origin = {param: value for param, value in (('account', account_id), ('region', region)) if value}
+        queue_info.append({
+            'url': url,
+            'name': name,
+            'account_id': account_id,
+            'region': region,
+            # El enlace a los mensajes filtra por el origen de esta cola
+            'origin_query': urlencode(origin),
+            'count': counts.get(key, 0),
+            'backlog': backlog['queues'].get(key),
+            'trend': trends.get(key),
+        })
+    return render(request, 'monitoring/queue_list.html', {
+        'queues': queue_info,
+        'metrics_collected_at': backlog['collected_at'],
+        'inventory_collected_at': inventory['collected_at'],
+        'refresh': refresh_status(ALL_QUEUES),
+    })
+
+
+def _origin_filters(request):
+    """Filtros opcionales por cuenta y región de origen (?account= y ?region=)"""
+    filters = {}
+    if request.GET.get('account'):
+        filters['account_id'] = request.GET['account']
+    if request.GET.get('region'):
+        filters['region'] = request.GET['region']
+    return filters
+
+
+def _origin_query(request):
+    """Parámetros de origen a conservar en los enlaces de paginación"""
+    params = {key: request.GET[key] for key in ('account', 'region') if request.GET.get(key)}
+    return f'&{urlencode(params)}' if params else ''
 
 
 def message_list(request, queue_name):
     """Muestra los mensajes recibidos en la cola especificada"""
-    messages = Message.objects.filter(queue_name=queue_name).order_by('-received_at')
-    return render(request, 'monitoring/message_list.html', {'messages': messages, 'queue_name': queue_name})
+    filters = {'queue_name': queue_name, **_origin_filters(request)}
+    messages = Message.objects.filter(**filters).only(*LIST_FIELDS)
+    page = paginate_messages(request, messages, older=partitions.older_messages(filters, LIST_FIELDS))
+    return render(request, 'monitoring/message_list.html', {
+        'messages': page['items'],
+        'page': page,
+        'queue_name': queue_name,
+        'filter_query': _origin_query(request),
+    })
 
 
 def message_detail(request, pk):
     """Muestra detalle de un mensaje específico"""
-    msg = get_object_or_404(Message, pk=pk)
-    return render(request, 'monitoring/message_detail.html', {'message': msg})
+    # Primero la tabla principal; si no está, la partición sellada cuyo rango de ids lo incluye
+    msg = Message.objects.select_related('body_blob', 'event').filter(pk=pk).first() or partitions.get_message(pk)
+    if msg is None:
+        raise Http404('Mensaje no encontrado')
+    # El contenido ya viene parseado desde la ingesta; solo se formatea
+    payload = json.dumps(msg.payload, indent=2, ensure_ascii=False) if msg.payload is not None else None
+    deliveries = []
+    if msg.event_id and getattr(msg, 'partition', None):
+        deliveries = partitions.event_deliveries(msg, LIST_FIELDS, MAX_DELIVERIES)
+    elif msg.event_id:
+        deliveries = msg.event.deliveries.only(*LIST_FIELDS).order_by('received_at', 'id')[:MAX_DELIVERIES]
+    return render(request, 'monitoring/message_detail.html', {
+        'message': msg,
+        'payload': payload,
+        'deliveries': deliveries,
+    })
 
 # Vistas para topics SNS
 
 def topic_list(request):
     """Lista los topics de SNS y muestra el conteo de mensajes"""
-    # Actualiza la lista de mensajes antes de generar el reporte
-    fetch_all_messages()
-    topics = list_topics()
-    topic_info = []
-    for arn in topics:
-        count = Message.objects.filter(topic_arn=arn).count()
-        topic_info.append({'arn': arn, 'count': count})
-    return render(request, 'monitoring/topic_list.html', {'topics': topic_info})
+    # Los mensajes se actualizan en segundo plano; la vista solo lee de la base
+    ensure_scheduler()
+    inventory = get_inventory()
+    topics = inventory['topics']
+    counts = get_counts(MessageCounter.TOPIC, topics if topics else None)
+    topic_info = [{'arn': arn, 'count': counts.get(arn, 0)} for arn in topics or sorted(counts)]
+    return render(request, 'monitoring/topic_list.html', {
+        'topics': topic_info,
+        'inventory_collected_at': inventory['collected_at'],
+        'refresh': refresh_status(ALL_QUEUES),
+    })
 
 
 def topic_message_list(request, topic_arn):
     """Muestra los mensajes asociados a un topic específico"""
-    # Actualiza los mensajes de las colas suscritas a este topic SNS
-    fetch_messages_by_topic(topic_arn)
-    messages = Message.objects.filter(topic_arn=topic_arn).order_by('-received_at')
-    return render(request, 'monitoring/topic_message_list.html', {'messages': messages, 'topic_arn': topic_arn})
+    # Una fila por evento (la primera entrega), con la cantidad de colas a las que llegó
+    filters = {'topic_arn': topic_arn, 'duplicate': False}
+    messages = Message.objects.filter(**filters).select_related('event').only(*LIST_FIELDS, 'event__fanout')
+    page = paginate_messages(
+        request, messages, older=partitions.older_messages(filters, (*LIST_FIELDS, 'event'), related=('event',)),
+    )
+    return render(request, 'monitoring/topic_message_list.html', {
+        'messages': page['items'],
+        'page': page,
+        'topic_arn': topic_arn,
+        'refresh': refresh_status(f'topic:{topic_arn}'),
+    })
+
+# Tail en vivo de mensajes. Servido por ASGI usa Server-Sent Events; bajo WSGI cada conexión
+# abierta ocuparía un worker, así que la página consulta live_tail_poll cada pocos segundos.
+
+def live_streaming(request):
+    return isinstance(request, ASGIRequest) and bool(settings.MONITOR_LIVE_POLL_INTERVAL)
+
+def live_tail(request):
+    """Página que muestra los mensajes a medida que se guardan"""
+    return render(request, 'monitoring/live_tail.html', {
+        'queue_name': request.GET.get('queue', ''),
+        'topic_arn': request.GET.get('topic', ''),
+        'streaming': live_streaming(request),
+    })
+
+
+def live_tail_poll(request):
+    """Mensajes guardados después de ?after=<id>; sin after devuelve solo el id desde el que seguir"""
+    try:
+        after = int(request.GET['after'])
+    except (KeyError, ValueError):
+        return JsonResponse({'last_id': latest_message_id(), 'messages': []})
+    events = recent_events(
+        after,
+        queue_name=request.GET.get('queue') or None,
+        topic_arn=request.GET.get('topic') or None,
+        limit=settings.MONITOR_LIVE_POLL_BATCH,
+    )
+    return JsonResponse({'last_id': events[-1]['id'] if events else after, 'messages': events})
+
+
+async def live_tail_stream(request):
+    """Flujo SSE de mensajes nuevos, filtrable por ?queue= y ?topic="""
+    if not live_streaming(request):
+        return HttpResponse(
+            'El flujo en vivo requiere servir el proyecto por ASGI (por ejemplo, uvicorn sqs_monitor.asgi:application) '
+            'y MONITOR_LIVE_POLL_INTERVAL mayor a 0; usar live/poll/ en su lugar.',
+            status=501,
+            content_type='text/plain; charset=utf-8',
+        )
+    subscription = broker.subscribe(
+        queue_name=request.GET.get('queue') or None,
+        topic_arn=request.GET.get('topic') or None,
+    )
+
+    async def events():
+        reported_drops = 0
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=settings.MONITOR_LIVE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                # Avisar al cliente lento cuántos mensajes se descartaron
+                if subscription.dropped != reported_drops:
+                    yield f'event: dropped\ndata: {subscription.dropped - reported_drops}\n\n'
+                    reported_drops = subscription.dropped
+                yield f'id: {event["id"]}\nevent: message\ndata: {json.dumps(event)}\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Estadísticas de throughput y demora
+
+# Rangos de tiempo disponibles en los gráficos
+STATS_RANGES = {
+    '1h': timedelta(hours=1),
+    '6h': timedelta(hours=6),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
 
-# Vista para actualizar mensajes desde AWS
+
+def stats(request):
+    """Gráficos de mensajes por minuto y demora de entrega"""
+    return render(request, 'monitoring/stats.html', {
+        'kind': request.GET.get('kind', MessageCounter.QUEUE),
+        'name': request.GET.get('name', ''),
+        'account': request.GET.get('account', ''),
+        'region': request.GET.get('region', ''),
+        'range': request.GET.get('range', '24h'),
+        'ranges': list(STATS_RANGES),
+        # Sin cuenta ni región, la serie de una cola suma sus homónimas de todos los orígenes
+        'queues': sorted({name for _, _, name in get_counts(MessageCounter.QUEUE)}),
+        'topics': sorted(get_counts(MessageCounter.TOPIC)),
+    })
+
+
+def stats_api(request):
+    """Serie temporal en JSON desde los rollups, sin leer la tabla de mensajes"""
+    kind = request.GET.get('kind', MessageCounter.QUEUE)
+    if kind not in (MessageCounter.QUEUE, MessageCounter.TOPIC):
+        return JsonResponse({'error': 'kind debe ser queue o topic'}, status=400)
+    span = STATS_RANGES.get(request.GET.get('range', '24h'))
+    if span is None:
+        return JsonResponse({'error': f'range debe ser uno de {", ".join(STATS_RANGES)}'}, status=400)
+    return JsonResponse(series(
+        kind, name=request.GET.get('name') or None, span=span,
+        account_id=request.GET.get('account') or None, region=request.GET.get('region') or None,
+    ))
+
+# Búsqueda de mensajes
+
+def _parse_moment(value, end_of_day=False):
+    """Acepta fecha o fecha y hora; una fecha sola como límite superior incluye todo el día"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _search(request):
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    filters = {
+        'queue': request.GET.get('queue') or None,
+        'topic': request.GET.get('topic') or None,
+        'state': request.GET.get('state') or None,
+        'account': request.GET.get('account') or None,
+        'region': request.GET.get('region') or None,
+        'since': _parse_moment(request.GET.get('since')),
+        'until': _parse_moment(request.GET.get('until'), end_of_day=True),
+    }
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return text, {'results': [], 'page': page, 'page_size': get_page_size(request), 'has_next': False}
+    return text, search_messages(text, filters, page=page, page_size=get_page_size(request))
+
+
+def message_search(request):
+    """Busca mensajes por contenido, asunto y atributos"""
+    text, result = _search(request)
+    # Los enlaces de paginación conservan todos los filtros (incluidos cuenta y región)
+    query = request.GET.copy()
+    query.pop('page', None)
+    return render(request, 'monitoring/message_search.html', {
+        'q': text, 'result': result, 'params': request.GET, 'query': query.urlencode(),
+    })
+
+
+def message_search_api(request):
+    """Versión JSON de la búsqueda de mensajes"""
+    text, result = _search(request)
+    return JsonResponse({
+        'q': text,
+        'page': result['page'],
+        'page_size': result['page_size'],
+        'has_next': result['has_next'],
+        'results': [
+            {
+                'id': msg.pk,
+                'message_id': msg.message_id,
+                'queue_name': msg.queue_name,
+                'account_id': msg.account_id,
+                'region': msg.region,
+                'topic_arn': msg.topic_arn,
+                'subject': msg.subject,
+                'state': msg.state,
+                'received_at': msg.received_at,
+                'snippet': msg.snippet,
+            }
+            for msg in result['results']
+        ],
+    })
+
+# Vistas para actualizar mensajes desde AWS
 
 def update_messages(request):
-    """Ejecuta la recolección de mensajes desde AWS y redirige al dashboard"""
-    fetch_all_messages()
+    """Lanza en segundo plano la recolección de mensajes desde AWS y redirige al dashboard"""
+    trigger_refresh(ALL_QUEUES, fetch_all_messages)
     return redirect('queue_list')
+
+
+def update_topic_messages(request, topic_arn):
+    """Lanza en segundo plano la recolección de las colas suscritas a un topic"""
+    trigger_refresh(f'topic:{topic_arn}', fetch_messages_by_topic, topic_arn)
+    return redirect('topic_message_list', topic_arn=topic_arn)
+
+
+def metrics_view(request):
+    """Métricas de ingesta y de llamadas a AWS en formato de Prometheus"""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
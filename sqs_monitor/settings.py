@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -73,12 +74,67 @@ WSGI_APPLICATION = 'sqs_monitor.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Perfil elegido con DB_PROFILE:
+#   sqlite          SQLite ajustado para un escritor concurrente con lectores (por defecto)
+#   sqlite-default  SQLite con la configuración de fábrica (para comparar en bench_database;
+#                   el modo WAL queda grabado en el archivo una vez activado)
+#   postgresql      PostgreSQL con conexiones persistentes; requiere psycopg
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgresql':
+    DB_POOL = os.getenv('DB_POOL', '').lower() in ('1', 'true', 'yes')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'sqs_monitor'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', ''),
+            # El pool de psycopg (psycopg[pool]) reemplaza a las conexiones persistentes
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            # Verifica una conexión reutilizada antes de usarla (tras un reinicio del servidor)
+            'CONN_HEALTH_CHECKS': True,
+            # Detrás de PgBouncer en modo transacción no pueden usarse cursores del lado del servidor
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes'),
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                'application_name': os.getenv('DB_APPLICATION_NAME', 'sqs_monitor'),
+            },
+        }
     }
-}
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME') or BASE_DIR / 'db.sqlite3',
+        }
+    }
+    if DB_PROFILE == 'sqlite':
+        # Se ejecuta en cada conexión nueva. WAL deja leer mientras se escribe; con WAL,
+        # synchronous=NORMAL solo puede perder la última transacción ante un corte de luz.
+        # mmap_size lee la base por memoria mapeada y busy_timeout espera al lock en vez de
+        # fallar con "database is locked".
+        SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))};'
+                f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            # Las transacciones toman el lock de escritura al empezar: una lectura que luego
+            # escribe no puede quedar bloqueada sin que busy_timeout la haga esperar
+            'transaction_mode': 'IMMEDIATE',
+        }
 
 
 # Password validation
@@ -126,4 +182,148 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_REGION = os.getenv('AWS_REGION')
-AWS_SESSION_TOKEN=os.getenv('AWS_SESSION_TOKEN')
\ No newline at end of file
+AWS_SESSION_TOKEN=os.getenv('AWS_SESSION_TOKEN')
+
+# Cantidad máxima de colas que se consultan en paralelo al actualizar mensajes
+SQS_POLL_CONCURRENCY = int(os.getenv('SQS_POLL_CONCURRENCY', '10'))
+
+# Configuración de los clientes de boto3 compartidos por el proceso
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', str(max(10, SQS_POLL_CONCURRENCY * 2))))
+AWS_RETRY_MODE = os.getenv('AWS_RETRY_MODE', 'standard')
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', '5'))
+AWS_CONNECT_TIMEOUT = int(os.getenv('AWS_CONNECT_TIMEOUT', '5'))
+# Debe superar el tiempo máximo de long polling (20 segundos)
+AWS_READ_TIMEOUT = int(os.getenv('AWS_READ_TIMEOUT', '30'))
+# Nombre de sesión usado al asumir los roles de MONITOR_TARGETS
+AWS_ROLE_SESSION_NAME = os.getenv('AWS_ROLE_SESSION_NAME', 'sqs-monitor')
+
+# Actualización periódica de los mensajes desde el proceso web, en segundos. Desactivada por
+# defecto: cada proceso web tendría su propio hilo vaciando las colas; la ingesta continua
+# corresponde a fetch_monitor_queue --continuous. Tanto esta actualización como el botón
+# "actualizar ahora" se agrupan mediante la caché: con varios procesos web hace falta un
+# backend compartido (CACHES con Redis o Memcached); LocMemCache solo agrupa dentro de un proceso.
+MONITOR_REFRESH_INTERVAL = int(os.getenv('MONITOR_REFRESH_INTERVAL', '0'))
+# Tiempo máximo que se considera en curso una actualización antes de permitir otra
+MONITOR_REFRESH_TIMEOUT = int(os.getenv('MONITOR_REFRESH_TIMEOUT', '300'))
+
+# Paginación de los listados de mensajes
+MONITOR_PAGE_SIZE = int(os.getenv('MONITOR_PAGE_SIZE', '50'))
+MONITOR_MAX_PAGE_SIZE = int(os.getenv('MONITOR_MAX_PAGE_SIZE', '500'))
+
+# Retención de mensajes. La política por defecto se aplica a cada cola; 'queues' y
+# 'topics' permiten sobrescribirla por nombre de cola o ARN de topic
+MONITOR_RETENTION = {
+    'default': {
+        'max_age_days': int(os.getenv('MONITOR_RETENTION_DAYS', '30')),
+        'max_rows': int(os.getenv('MONITOR_RETENTION_MAX_ROWS', '0')) or None,
+    },
+    'queues': {},
+    'topics': {},
+}
+# Filas borradas por transacción, para no retener el lock de escritura
+MONITOR_RETENTION_CHUNK_SIZE = int(os.getenv('MONITOR_RETENTION_CHUNK_SIZE', '1000'))
+# Frecuencia en segundos con la que el consumidor continuo aplica la retención (0 la desactiva)
+MONITOR_RETENTION_INTERVAL = int(os.getenv('MONITOR_RETENTION_INTERVAL', '3600'))
+# Directorio donde archivar los mensajes antes de borrarlos (vacío: no se archivan)
+MONITOR_ARCHIVE_DIR = os.getenv('MONITOR_ARCHIVE_DIR') or None
+# Ejecutar VACUUM tras cada pasada de retención
+MONITOR_VACUUM = os.getenv('MONITOR_VACUUM', '').lower() in ('1', 'true', 'yes')
+
+# Particiones por tiempo de la tabla de mensajes: '' (desactivadas), 'day' o 'week' (en UTC).
+# Cada período terminado se sella en su propia tabla durante la pasada de retención
+MONITOR_PARTITION_PERIOD = os.getenv('MONITOR_PARTITION_PERIOD', '')
+# Segundos de espera tras el fin de un período antes de sellarlo. Los mensajes que vuelvan a
+# recibirse después (por ejemplo, en colas observadas) ya no se descartan como repetidos
+MONITOR_PARTITION_SEAL_AFTER = int(os.getenv('MONITOR_PARTITION_SEAL_AFTER', '3600'))
+# Antigüedad en días a la que se borra una partición entera (0: nunca). Las políticas por cola
+# o topic más cortas, y max_rows, solo se aplican a la tabla principal
+MONITOR_PARTITION_RETENTION_DAYS = int(
+    os.getenv('MONITOR_PARTITION_RETENTION_DAYS', str(MONITOR_RETENTION['default']['max_age_days'] or 0))
+)
+
+# Cuerpos de mensaje mayores a este tamaño (en bytes) se guardan comprimidos en MessageBlob
+MONITOR_BLOB_THRESHOLD = int(os.getenv('MONITOR_BLOB_THRESHOLD', '16384'))
+# Codec de compresión de los blobs: 'zlib', o 'zstd' si está instalado el paquete zstandard
+MONITOR_BLOB_CODEC = os.getenv('MONITOR_BLOB_CODEC', 'zlib')
+# Caracteres del cuerpo que se conservan en la fila de Message como extracto
+MONITOR_BODY_PREVIEW = int(os.getenv('MONITOR_BODY_PREVIEW', '1024'))
+
+# Eventos pendientes por cliente del tail en vivo; si se llena se descartan los más viejos
+MONITOR_LIVE_QUEUE_SIZE = int(os.getenv('MONITOR_LIVE_QUEUE_SIZE', '100'))
+# Segundos sin mensajes tras los que se envía un keep-alive por la conexión SSE
+MONITOR_LIVE_KEEPALIVE = int(os.getenv('MONITOR_LIVE_KEEPALIVE', '15'))
+# Cada cuántos segundos el proceso web busca mensajes nuevos (los guarda el consumidor, en otro
+# proceso) para repartirlos entre sus clientes en vivo; 0 desactiva el tail en vivo
+MONITOR_LIVE_POLL_INTERVAL = float(os.getenv('MONITOR_LIVE_POLL_INTERVAL', '1'))
+# Máximo de mensajes que se leen en cada consulta
+MONITOR_LIVE_POLL_BATCH = int(os.getenv('MONITOR_LIVE_POLL_BATCH', '500'))
+
+# Días que se conservan los buckets de estadísticas de cada resolución (0 o None: sin límite)
+MONITOR_ROLLUP_RETENTION_DAYS = {
+    '1m': int(os.getenv('MONITOR_ROLLUP_MINUTE_DAYS', '2')),
+    '1h': int(os.getenv('MONITOR_ROLLUP_HOUR_DAYS', '45')),
+    '1d': int(os.getenv('MONITOR_ROLLUP_DAY_DAYS', '0')),
+}
+
+# Métricas de backlog de SQS: vigencia de la caché, ventana de tendencia y retención de muestras
+MONITOR_QUEUE_METRICS_TTL = int(os.getenv('MONITOR_QUEUE_METRICS_TTL', '30'))
+MONITOR_QUEUE_METRICS_TREND_MINUTES = int(os.getenv('MONITOR_QUEUE_METRICS_TREND_MINUTES', '15'))
+MONITOR_QUEUE_METRICS_RETENTION_DAYS = int(os.getenv('MONITOR_QUEUE_METRICS_RETENTION_DAYS', '7'))
+
+# Colas que se observan sin consumir: los mensajes se guardan y quedan en la cola.
+# Cada observación cuenta como una recepción (ApproximateReceiveCount); las relecturas de
+# mensajes ya vistos se espacian hasta MONITOR_PEEK_MAX_BACKOFF, pero en colas con redrive
+# policy conviene igual un maxReceiveCount holgado. Cada entrada es un nombre (la cola con ese
+# nombre en cualquier cuenta o región) o la URL completa de una cola
+MONITOR_PEEK_QUEUES = [name for name in os.getenv('MONITOR_PEEK_QUEUES', '').split(',') if name]
+# Fracción de los mensajes observados que se guarda (1 = todos)
+MONITOR_PEEK_SAMPLE_RATE = float(os.getenv('MONITOR_PEEK_SAMPLE_RATE', '1'))
+# Visibilidad pedida al recibir en modo observación: los mensajes vuelven solos a la cola al vencer
+MONITOR_PEEK_VISIBILITY_TIMEOUT = int(os.getenv('MONITOR_PEEK_VISIBILITY_TIMEOUT', '2'))
+# Espera máxima entre lecturas de una cola observada que solo devuelve mensajes ya vistos;
+# acota cuántas veces por hora se suma a ApproximateReceiveCount de un mensaje sin consumir
+MONITOR_PEEK_MAX_BACKOFF = int(os.getenv('MONITOR_PEEK_MAX_BACKOFF', '60'))
+
+# Spool en disco entre la recepción y la base: los lotes se confirman en SQS apenas quedan
+# escritos (con fsync) y un único escritor los pasa a la base en transacciones grandes.
+# Vacío lo desactiva y cada lote se guarda en la base antes de confirmarlo.
+MONITOR_SPOOL_DIR = os.getenv('MONITOR_SPOOL_DIR', '')
+# Tamaño a partir del cual se abre un segmento nuevo (los consumidos se borran enteros)
+MONITOR_SPOOL_SEGMENT_BYTES = int(os.getenv('MONITOR_SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+# Mensajes por transacción del escritor
+MONITOR_SPOOL_BATCH = int(os.getenv('MONITOR_SPOOL_BATCH', '1000'))
+# Pendiente máximo en disco antes de dejar de recibir (contrapresión)
+MONITOR_SPOOL_MAX_BYTES = int(os.getenv('MONITOR_SPOOL_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+# Segundos que se cachea el mapa de topics SNS y colas suscritas
+MONITOR_TOPOLOGY_TTL = int(os.getenv('MONITOR_TOPOLOGY_TTL', '300'))
+
+# Inventario de colas y topics: regiones, prefijos de nombre de cola (vacío: todas) y vigencia
+MONITOR_REGIONS = [region for region in os.getenv('MONITOR_REGIONS', '').split(',') if region]
+MONITOR_QUEUE_PREFIXES = [prefix for prefix in os.getenv('MONITOR_QUEUE_PREFIXES', '').split(',') if prefix]
+MONITOR_INVENTORY_TTL = int(os.getenv('MONITOR_INVENTORY_TTL', '300'))
+
+# Destinos adicionales en otras cuentas o regiones, como lista JSON. Cada destino admite
+# 'region', 'role_arn' (opcional), 'external_id' (opcional) y 'queues' (URLs) o 'queue_prefix'.
+# Ejemplo: [{"region": "eu-west-1", "role_arn": "arn:aws:iam::123456789012:role/monitor",
+#            "queue_prefix": "orders-"}]
+MONITOR_TARGETS = json.loads(os.getenv('MONITOR_TARGETS', '[]'))
+
+# 'aws' usa boto3; 'fake' usa el backend en memoria de monitoring/fake_aws.py (benchmarks y pruebas)
+MONITOR_AWS_BACKEND = os.getenv('MONITOR_AWS_BACKEND', 'aws')
+
+# Puerto del endpoint /metrics del consumidor (fetch_monitor_queue); 0 lo desactiva.
+# La aplicación web expone /metrics en su propia URL.
+MONITOR_METRICS_PORT = int(os.getenv('MONITOR_METRICS_PORT', '0'))
+
+# Decodificación del cuerpo de los mensajes: 'auto' usa orjson si está instalado, o 'json' / 'orjson'
+MONITOR_JSON_BACKEND = os.getenv('MONITOR_JSON_BACKEND', 'auto')
+# Decodificadores de sobres, como rutas separadas por comas (vacío: SNS y EventBridge)
+MONITOR_ENVELOPE_DECODERS = [path for path in os.getenv('MONITOR_ENVELOPE_DECODERS', '').split(',') if path]
+
+# Deduplicación de entregas del mismo evento (fan-out de SNS): tamaño y vida (segundos) de la
+# caché en memoria de eventos recientes, y ventana (segundos) para identificar por contenido
+# las entregas directas de SNS, que no traen el MessageId del sobre
+MONITOR_EVENT_CACHE_SIZE = int(os.getenv('MONITOR_EVENT_CACHE_SIZE', '100000'))
+MONITOR_EVENT_CACHE_TTL = int(os.getenv('MONITOR_EVENT_CACHE_TTL', '3600'))
+MONITOR_EVENT_HASH_WINDOW = int(os.getenv('MONITOR_EVENT_HASH_WINDOW', '60'))